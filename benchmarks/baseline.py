@@ -0,0 +1,116 @@
+"""Сохранённые результаты бенчмарков и поиск регрессий.
+
+Результат бенчмарка - словарь ``{имя замера: значение}``, где значение -
+время (меньше - лучше) или пропускная способность (больше - лучше, имена
+с суффиксом ``_rps``). Базовые результаты лежат в ``benchmarks/baselines/``
+в JSON вместе с описанием машины, на которой сняты: сравнивать имеет смысл
+только замеры с одной машины.
+"""
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# Допустимое ухудшение относительно базового результата
+DEFAULT_TOLERANCE = 0.2
+
+HIGHER_IS_BETTER_SUFFIXES = ('_rps',)
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save(name, results, params=None):
+    """Записывает ``results`` как новый базовый результат."""
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    payload = {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'params': params or {},
+        'results': {key: round(value, 3) for key, value in results.items()},
+    }
+    with open(baseline_path(name), 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False, sort_keys=True)
+        f.write('\n')
+    return baseline_path(name)
+
+
+def load(name):
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _higher_is_better(key):
+    return key.endswith(HIGHER_IS_BETTER_SUFFIXES)
+
+
+def compare(baseline, results, tolerance=DEFAULT_TOLERANCE):
+    """Список строк ``(имя, база, текущее, изменение, регрессия)``.
+
+    Изменение - относительное ухудшение: положительное значение означает, что
+    стало хуже. Замеры, которых нет в базовом результате, пропускаются.
+    """
+    rows = []
+    for key, value in results.items():
+        base = baseline['results'].get(key)
+        if not base:
+            continue
+        if _higher_is_better(key):
+            change = (base - value) / base
+        else:
+            change = (value - base) / base
+        rows.append((key, base, value, change, change > tolerance))
+    return rows
+
+
+def report(name, results, params=None, save_baseline=False, tolerance=DEFAULT_TOLERANCE, out=sys.stdout):
+    """Сохраняет или сравнивает результаты; возвращает код выхода (1 - регрессия)."""
+    if save_baseline:
+        path = save(name, results, params)
+        print(f'\nБазовый результат сохранён: {path}', file=out)
+        return 0
+
+    baseline = load(name)
+    if baseline is None:
+        print(f'\nБазового результата {name} нет; сохраните его флагом --save-baseline', file=out)
+        return 0
+    if baseline.get('params', {}) != (params or {}):
+        print(f'\nВнимание: параметры отличаются от базовых {baseline.get("params")}', file=out)
+    if baseline.get('machine') != machine_info():
+        print('\nВнимание: базовый результат снят на другой машине', file=out)
+
+    rows = compare(baseline, results, tolerance)
+    print(f'\nСравнение с базовым результатом от {baseline["recorded_at"]} (допуск {tolerance:.0%}):', file=out)
+    print(f'{"metric":<36} {"baseline":>12} {"current":>12} {"change":>9}', file=out)
+    regressions = 0
+    for key, base, value, change, regressed in rows:
+        flag = '  РЕГРЕССИЯ' if regressed else ''
+        print(f'{key:<36} {base:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}', file=out)
+        regressions += regressed
+    if regressions:
+        print(f'\nРегрессий: {regressions}', file=out)
+        return 1
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='сохранить результаты как базовые вместо сравнения')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='допустимое относительное ухудшение (по умолчанию 0.2)')
@@ -0,0 +1,88 @@
+"""Время построения и сериализации каждого графика дашборда.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_charts.py
+    python benchmarks/bench_charts.py --charts trend debt --repeat 10
+    python benchmarks/bench_charts.py --save-baseline
+
+Для каждого графика из реестра ``dashboard.charts`` замеряются этапы
+``get_data`` (запрос к агрегатам), ``build_figure`` (фигура Plotly с общим
+макетом), ``to_html`` (фрагмент страницы, как в ``ChartSpec.render_html``) и
+``to_json`` (ответ ``/dashboards/chart/<id>.json``). Строки ``page`` - вся
+страница через ``charts.render_charts``: с пустым кэшем графиков (cold) и с
+заполненным (warm); ``page@N`` - холодная отрисовка первых N графиков, чтобы
+видеть, как время растёт с числом графиков.
+
+Данные берутся из базы ``DATABASE_URL`` (без агрегатов - демонстрационные
+значения). Результаты сравниваются с ``benchmarks/baselines/charts.json``.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from benchmarks import baseline  # noqa: E402
+from dashboard import chart_cache, charts  # noqa: E402
+
+
+def best_of(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def chart_stages(spec):
+    data = spec.get_data()
+    fig = spec.build_figure(data)
+    return [
+        ('get_data', spec.get_data),
+        ('build_figure', lambda: spec.build_figure(data)),
+        ('to_html', lambda: fig.to_html(full_html=False, include_plotlyjs=False, div_id=spec.div_id)),
+        ('to_json', lambda: fig.to_json()),
+    ]
+
+
+def render_cold(specs):
+    chart_cache.invalidate()
+    return charts.render_charts(specs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--charts', nargs='+', help='идентификаторы графиков (по умолчанию все)')
+    parser.add_argument('--repeat', type=int, default=5)
+    baseline.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    specs = charts.get_specs(args.charts)
+    results = {}
+    print(f'{"chart":<12} {"stage":<14} {"ms":>10}')
+    for spec in specs:
+        for stage, func in chart_stages(spec):
+            elapsed = best_of(func, args.repeat) * 1e3
+            results[f'{spec.chart_id}.{stage}_ms'] = elapsed
+            print(f'{spec.chart_id:<12} {stage:<14} {elapsed:>10.3f}')
+
+    for n in range(1, len(specs) + 1):
+        elapsed = best_of(lambda: render_cold(specs[:n]), args.repeat) * 1e3
+        results[f'page@{n}.cold_ms'] = elapsed
+        print(f'{"page@" + str(n):<12} {"cold":<14} {elapsed:>10.3f}')
+    charts.render_charts(specs)
+    elapsed = best_of(lambda: charts.render_charts(specs), args.repeat) * 1e3
+    results['page.warm_ms'] = elapsed
+    print(f'{"page":<12} {"warm":<14} {elapsed:>10.3f}')
+
+    params = {'charts': [spec.chart_id for spec in specs], 'repeat': args.repeat}
+    return baseline.report('charts', results, params, args.save_baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
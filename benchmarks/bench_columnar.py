@@ -0,0 +1,102 @@
+"""Чтение диапазонов рядов из файлового колоночного хранилища.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_columnar.py
+    python benchmarks/bench_columnar.py --rows 1000000 10000000 --years 20
+
+Во временном каталоге строится хранилище ``dashboard.columnar`` с
+синтетической историей метрик ``seed_metrics.DEMO_SERIES`` за ``--years``
+лет (без базы). Для выборок графиков тренда и задолженности выводятся лучшее
+время и пик памяти Python (tracemalloc): страницы memmap в него не входят,
+их читает и кэширует ОС. Результаты сравниваются с
+``benchmarks/baselines/columnar.json``.
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from benchmarks import baseline  # noqa: E402
+from dashboard import columnar, queries  # noqa: E402
+from dashboard.management.commands.seed_metrics import DEMO_SERIES  # noqa: E402
+
+TREND = [('revenue', ''), ('profit', '')]
+DEBT = [('overdue_debt', bucket) for bucket in ('1-30', '31-60', '60-90')]
+
+
+def build_store(root, n_rows, years, rng, chunk_size=1_000_000):
+    store = columnar.ColumnarStore(root)
+    start = np.datetime64('2000-01-01')
+    days = int(years * 365.25)
+    with store.writing() as writer:
+        for first in range(0, n_rows, chunk_size):
+            n = min(chunk_size, n_rows - first)
+            series = rng.integers(0, len(DEMO_SERIES), n)
+            writer.add(
+                np.array([metric for metric, _, _ in DEMO_SERIES], dtype=object)[series],
+                np.array([dimension for _, dimension, _ in DEMO_SERIES], dtype=object)[series],
+                start + np.sort(rng.integers(0, days, n)),
+                rng.gamma(4., np.array([mean for _, _, mean in DEMO_SERIES])[series] / 4.),
+            )
+    return store, (start + days - 1).astype(datetime.date)
+
+
+def make_cases(store, last_day):
+    last_year = last_day - datetime.timedelta(days=365)
+    return [
+        ('trend_month', 'trend, all years by month',
+         lambda: store.period_series(TREND, queries.DashboardQuery())),
+        ('trend_last_year_day', 'trend, last year by day',
+         lambda: store.period_series(TREND, queries.DashboardQuery(since=last_year, granularity='day'))),
+        ('debt_week', 'debt, all years by week',
+         lambda: store.period_series(DEBT, queries.DashboardQuery(granularity='week'))),
+        ('debt_bucket_last_year_month', 'debt 1-30, last year by month',
+         lambda: store.period_series(DEBT, queries.DashboardQuery(since=last_year, filters={'bucket': ['1-30']}))),
+        ('expenses_totals', 'expenses totals, all years',
+         lambda: store.dimension_totals('expenses', queries.DashboardQuery())),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    baseline.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    results = {}
+    print(f'{"rows":>10} {"case":<32} {"ms":>9} {"peak KB":>9}')
+    for n in args.rows:
+        with tempfile.TemporaryDirectory() as root:
+            store, last_day = build_store(root, n, args.years, rng)
+            for key, name, case in make_cases(store, last_day):
+                case()  # первое чтение открывает memmap партиций
+                elapsed = min(timeit.repeat(case, repeat=args.repeat, number=1)) * 1e3
+                tracemalloc.start()
+                case()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results[f'{n}.{key}_ms'] = elapsed
+                print(f'{n:>10} {name:<32} {elapsed:>9.2f} {peak / 1024:>9.0f}')
+
+    params = {'rows': args.rows, 'years': args.years, 'repeat': args.repeat}
+    return baseline.report('columnar', results, params, args.save_baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Задержка перекрёстной фильтрации на большом наборе фактов.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_crossfilter.py
+    python benchmarks/bench_crossfilter.py --rows 100000 1000000 5000000 --repeat 5
+
+Набор ``crossfilter.Dataset`` строится из синтетических фактов по метрикам
+``seed_metrics.DEMO_SERIES`` (без базы). Для каждого графика с
+перекрёстным фильтром замеряется клик: ``crossfilter.select`` и расчёт
+изменившихся трасс всех графиков (``crossfilter.changes``) - то, что делает
+``/dashboards/crossfilter.json`` без сериализации ответа. Цель - меньше 50 мс
+на миллионе строк. Результаты сравниваются с
+``benchmarks/baselines/crossfilter.json``.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from benchmarks import baseline  # noqa: E402
+from dashboard import charts, crossfilter, queries  # noqa: E402
+from dashboard.management.commands.seed_metrics import DEMO_SERIES  # noqa: E402
+
+
+def make_dataset(n_rows, rng, days=3 * 365):
+    series = rng.integers(0, len(DEMO_SERIES), n_rows)
+    metrics = np.array([metric for metric, _, _ in DEMO_SERIES], dtype=object)[series]
+    dimensions = np.array([dimension for _, dimension, _ in DEMO_SERIES], dtype=object)[series]
+    means = np.array([mean for _, _, mean in DEMO_SERIES])[series]
+    dates = np.datetime64('2022-01-01') + rng.integers(0, days, n_rows)
+    values = rng.gamma(4., means / 4.)
+    return crossfilter.Dataset(metrics, dimensions, dates, values)
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, repeat=repeat, number=1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--granularity', default='month', choices=list(queries.GRANULARITIES))
+    parser.add_argument('--repeat', type=int, default=5)
+    baseline.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    base = queries.DashboardQuery(granularity=args.granularity)
+    specs = charts.get_specs()
+    sources = [spec for spec in specs if crossfilter.is_source(spec, specs)]
+    results = {}
+    print(f'{"rows":>10} {"click on":<12} {"changed":>8} {"ms":>9}')
+    for n in args.rows:
+        dataset = make_dataset(n, rng)
+        # Колонки периодов считаются один раз на набор, до первого клика
+        dataset.buckets(args.granularity)
+        for spec in sources:
+            value = crossfilter.point_values(spec, crossfilter.effective_query(base, {}, dataset, spec))[0]
+
+            def click():
+                state = crossfilter.select(spec, base, {}, dataset, value)
+                return crossfilter.changes(specs, base, {}, state, dataset)
+            changed = click()
+            elapsed = best_of(click, args.repeat) * 1e3
+            results[f'{n}.{spec.chart_id}_ms'] = elapsed
+            print(f'{n:>10} {spec.chart_id:<12} {len(changed):>8} {elapsed:>9.2f}')
+
+    params = {'rows': args.rows, 'granularity': args.granularity, 'repeat': args.repeat}
+    return baseline.report('crossfilter', results, params, args.save_baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Время сериализации и размер JSON фигуры: текст против typed arrays.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_encoding.py
+    python benchmarks/bench_encoding.py --sizes 10000 100000 --repeat 3
+
+Фигура - две трассы Scatter с осью дат и рядами float, как на графике
+динамики выручки; время включает построение фигуры и сериализацию.
+``json`` - текущий путь: ряды списками Python и ``fig.to_json()``;
+``binary`` - ряды массивами NumPy (``encoding.as_arrays``) и
+``encoding.figure_to_json(fig, binary=True)``. Размер указан для тела
+ответа и после gzip (уровень 6).
+"""
+import argparse
+import gzip
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import encoding  # noqa: E402
+
+
+def make_data(n, rng):
+    # Списки Python - как из источников данных графиков
+    return {
+        'dates': pd.date_range('2000-01-01', periods=n, freq='min'),
+        'revenue': rng.normal(50, 5, n).tolist(),
+        'profit': rng.normal(15, 2, n).tolist(),
+    }
+
+
+def build_figure(data):
+    fig = go.Figure()
+    for name in ('revenue', 'profit'):
+        fig.add_trace(go.Scatter(x=data['dates'], y=data[name], name=name))
+    return fig
+
+
+def serialize_json(data):
+    return encoding.figure_to_json(build_figure(data))
+
+
+def serialize_binary(data):
+    arrays = encoding.as_arrays(data, ['revenue', 'profit'])
+    return encoding.figure_to_json(build_figure(arrays), binary=True)
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, repeat=repeat, number=1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f'{"n":>9} {"encoding":>8} {"time, ms":>10} {"size, KB":>10} {"gzip, KB":>10}')
+    for n in args.sizes:
+        data = make_data(n, rng)
+        for name, serialize in (('json', serialize_json), ('binary', serialize_binary)):
+            elapsed = best_of(lambda: serialize(data), args.repeat)
+            payload = serialize(data).encode('utf-8')
+            compressed = gzip.compress(payload, compresslevel=6)
+            print(f'{n:>9} {name:>8} {elapsed * 1e3:>10.1f} {len(payload) / 1024:>10.0f} {len(compressed) / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Пропускная способность и память потоковой выгрузки фактов.
+
+Запуск из корня проекта (база должна быть мигрирована):
+
+    python benchmarks/bench_export.py
+    python benchmarks/bench_export.py --rows 10000 100000 1000000 --formats csv
+
+Для каждого размера во временную транзакцию добавляются синтетические факты
+(после замера она откатывается, база не меняется) и выгружаются через
+``/dashboards/export/trend.<формат>``. Выводятся время, строки и мегабайты
+в секунду и пик памяти Python (tracemalloc, отдельным прогоном) - он не
+должен расти с числом строк. Память, которую pyarrow выделяет вне
+интерпретатора, tracemalloc не видит. Результаты сравниваются с
+``benchmarks/baselines/export.json``.
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from benchmarks import baseline  # noqa: E402
+from dashboard import export  # noqa: E402
+from dashboard.models import MetricFact  # noqa: E402
+
+# Синтетические факты лежат далеко за реальными датами и выгружаются
+# отдельным срезом
+START = datetime.date(2200, 1, 1)
+
+
+def add_facts(first, last):
+    facts = (
+        MetricFact(metric='revenue', dimension='', date=START + datetime.timedelta(days=i // 100), value=i * 0.001)
+        for i in range(first, last)
+    )
+    MetricFact.objects.bulk_create(facts, batch_size=10_000)
+
+
+def download(client, fmt):
+    response = client.get(f'/dashboards/export/trend.{fmt}', {'since': START.isoformat()})
+    assert response.status_code == 200, response.status_code
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--formats', nargs='+', default=export.formats(), choices=list(export.CONTENT_TYPES))
+    baseline.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    client = Client(HTTP_HOST='localhost')
+    # Прогрев: первый запрос импортирует модули графиков
+    for fmt in args.formats:
+        download(client, fmt)
+    results = {}
+    print(f'{"rows":>10} {"format":<8} {"MB":>8} {"s":>8} {"rows/s":>10} {"MB/s":>7} {"peak KB":>9}')
+    with transaction.atomic():
+        inserted = 0
+        for n in sorted(args.rows):
+            add_facts(inserted, n)
+            inserted = n
+            for fmt in args.formats:
+                started = time.perf_counter()
+                size = download(client, fmt)
+                elapsed = time.perf_counter() - started
+
+                tracemalloc.start()
+                download(client, fmt)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                results[f'{fmt}.{n}.ms'] = elapsed * 1e3
+                results[f'{fmt}.{n}.peak_kb'] = peak / 1024
+                print(f'{n:>10} {fmt:<8} {size / 1e6:>8.1f} {elapsed:>8.2f} {n / elapsed:>10.0f} '
+                      f'{size / 1e6 / elapsed:>7.1f} {peak / 1024:>9.0f}')
+        transaction.set_rollback(True)
+
+    params = {'rows': sorted(args.rows), 'formats': args.formats, 'chunk_size': export.chunk_size()}
+    return baseline.report('export', results, params, args.save_baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Нагрузочный тест представлений на локально запущенном сервере.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --server gunicorn --workers 4 --concurrency 16
+    python benchmarks/bench_load.py --server daphne --paths /dashboards/
+    python benchmarks/bench_load.py --url http://127.0.0.1:8000 --duration 30
+    python benchmarks/bench_load.py --chart-steps --cold --save-baseline
+
+Скрипт поднимает сервер в отдельном процессе (``--server``: ``gunicorn``,
+``uvicorn`` или ``daphne`` для ASGI, встроенный многопоточный ``wsgiref`` -
+если ничего не установлено) либо нагружает уже запущенный (``--url``).
+Каждый путь нагружается ``--concurrency`` потоками с keep-alive соединениями
+в течение ``--duration`` секунд; выводятся запросы в секунду и перцентили
+задержки p50/p90/p99. ``--chart-steps`` добавляет пути
+``/dashboards/?charts=<первые N графиков>``, ``--cold`` отключает кэш
+фрагментов графиков на сервере (каждый запрос строит фигуры заново).
+
+Клиент работает в том же интерпретаторе, что и скрипт, поэтому при
+насыщении процессора клиентом цифры занижены: следите за загрузкой CPU или
+запускайте клиент на другой машине через ``--url``. Результаты сравниваются
+с ``benchmarks/baselines/load.json``.
+"""
+import argparse
+import http.client
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import baseline  # noqa: E402
+
+DEFAULT_PATHS = ['/', '/about/', '/dashboards/', '/dashboards/?mode=lazy', '/dashboards/chart/trend.json']
+
+# Идентификаторы графиков в порядке регистрации (для --chart-steps)
+CHART_IDS = ['trend', 'expenses', 'plan_fact', 'funnel', 'debt', 'scatter', 'waterfall', 'hbar']
+
+SERVERS = ('gunicorn', 'uvicorn', 'daphne', 'wsgiref')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', 'superset_presentation.wsgi:application',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning']
+    if server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'superset_presentation.asgi:application',
+                '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+    if server == 'daphne':
+        return [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port),
+                'superset_presentation.asgi:application']
+    return [sys.executable, os.path.abspath(__file__), '--serve', str(port)]
+
+
+def pick_server(requested):
+    if requested:
+        return requested
+    for server in ('gunicorn', 'uvicorn', 'daphne'):
+        if importlib.util.find_spec(server) is not None:
+            return server
+    return 'wsgiref'
+
+
+def serve_wsgiref(port):
+    """Многопоточный WSGI-сервер из стандартной библиотеки (без зависимостей)."""
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+    from superset_presentation.wsgi import application
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    httpd = make_server('127.0.0.1', port, application,
+                        server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    httpd.serve_forever()
+
+
+def start_server(server, workers, cold):
+    port = free_port()
+    env = dict(os.environ)
+    if cold:
+        env['CHART_CACHE_BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
+    process = subprocess.Popen(server_command(server, port, workers), cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'Сервер {server} завершился с кодом {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'Сервер {server} не запустился за 30 секунд')
+
+
+def run_load(base_url, path, concurrency, duration, warmup):
+    """Нагружает ``path``; возвращает задержки (с), число ошибок и время теста."""
+    parts = urlsplit(base_url)
+    headers = {'Host': 'localhost', 'Accept-Encoding': 'gzip'}
+
+    def worker(stop_at, latencies, errors):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors.append(1)
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+                continue
+            latencies.append(time.perf_counter() - started)
+            if response.status >= 400:
+                errors.append(1)
+        conn.close()
+
+    def run(seconds):
+        latencies, errors = [], []
+        stop_at = time.monotonic() + seconds
+        threads = [threading.Thread(target=worker, args=(stop_at, latencies, errors))
+                   for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, len(errors), time.perf_counter() - started
+
+    if warmup:
+        run(warmup)
+    return run(duration)
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = np.asarray(latencies)
+    if not latencies.size:
+        return {'rps': 0.0, 'p50_ms': 0.0, 'p90_ms': 0.0, 'p99_ms': 0.0, 'errors': errors}
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    return {
+        'rps': latencies.size / elapsed,
+        'p50_ms': float(p50),
+        'p90_ms': float(p90),
+        'p99_ms': float(p99),
+        'errors': errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    parser.add_argument('--server', choices=SERVERS, help='по умолчанию - первый установленный')
+    parser.add_argument('--url', help='адрес уже запущенного сервера')
+    parser.add_argument('--workers', type=int, default=2, help='процессы сервера (gunicorn, uvicorn)')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    parser.add_argument('--chart-steps', action='store_true',
+                        help='нагрузить /dashboards/ с 1, 2, ... графиками')
+    parser.add_argument('--cold', action='store_true', help='без кэша фрагментов графиков')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.)
+    parser.add_argument('--warmup', type=float, default=2.)
+    baseline.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve_wsgiref(args.serve)
+        return 0
+
+    paths = list(args.paths)
+    if args.chart_steps:
+        paths += [f'/dashboards/?charts={",".join(CHART_IDS[:n])}' for n in range(1, len(CHART_IDS) + 1)]
+
+    process = None
+    server = 'external'
+    base_url = args.url
+    if base_url is None:
+        server = pick_server(args.server)
+        process, base_url = start_server(server, args.workers, args.cold)
+    print(f'Сервер: {server} ({base_url}), потоков клиента: {args.concurrency}, {args.duration:g} с на путь')
+
+    results = {}
+    try:
+        print(f'{"path":<48} {"rps":>9} {"p50, ms":>9} {"p90, ms":>9} {"p99, ms":>9} {"errors":>7}')
+        for path in paths:
+            summary = summarize(*run_load(base_url, path, args.concurrency, args.duration, args.warmup))
+            print(f'{path:<48} {summary["rps"]:>9.1f} {summary["p50_ms"]:>9.2f} '
+                  f'{summary["p90_ms"]:>9.2f} {summary["p99_ms"]:>9.2f} {summary["errors"]:>7}')
+            results[f'{path}.throughput_rps'] = summary['rps']
+            results[f'{path}.p50_ms'] = summary['p50_ms']
+            results[f'{path}.p99_ms'] = summary['p99_ms']
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    params = {
+        'server': server, 'workers': args.workers, 'concurrency': args.concurrency,
+        'duration': args.duration, 'cold': args.cold, 'paths': paths,
+    }
+    return baseline.report('load', results, params, args.save_baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
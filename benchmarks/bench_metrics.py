@@ -0,0 +1,73 @@
+"""Сравнение векторизованных расчётов dashboard.metrics со списочными.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_metrics.py
+    python benchmarks/bench_metrics.py --sizes 1000 100000 --repeat 3
+
+Для каждого размера входных данных выводится лучшее время из ``--repeat``
+прогонов для прежней реализации на списках Python и для NumPy.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import metrics  # noqa: E402
+
+
+# Прежние реализации из dashboards_view, перенесённые без изменений.
+
+def list_margin(income, costs):
+    profitability = [((i - c) / i) * 100 for i, c in zip(income, costs)]
+    return profitability, 2. * max(profitability) / (40. ** 2)
+
+
+def list_waterfall_labels(values):
+    return [f"+{v}" if v > 0 else str(v) for v in values if v is not None]
+
+
+def make_cases(n, rng):
+    income = rng.uniform(10, 100, n)
+    costs = income * rng.uniform(0.2, 0.9, n)
+    steps = rng.integers(-50, 50, n)
+
+    income_l, costs_l = income.tolist(), costs.tolist()
+    steps_l = steps.tolist()
+    return [
+        ('margin + sizeref',
+         lambda: list_margin(income_l, costs_l),
+         lambda: metrics.bubble_sizeref(metrics.margin_pct(income, costs))),
+        ('waterfall labels',
+         lambda: list_waterfall_labels(steps_l),
+         lambda: metrics.waterfall_labels(steps)),
+    ]
+
+
+def best_of(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f'{"case":<20} {"n":>10} {"lists, ms":>12} {"numpy, ms":>12} {"speedup":>9}')
+    for n in args.sizes:
+        for name, baseline, vectorized in make_cases(n, rng):
+            t_list = best_of(baseline, args.repeat)
+            t_vec = best_of(vectorized, args.repeat)
+            print(f'{name:<20} {n:>10} {t_list * 1e3:>12.3f} {t_vec * 1e3:>12.3f} {t_list / t_vec:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
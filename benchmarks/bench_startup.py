@@ -0,0 +1,178 @@
+"""Время запуска и память процесса Django: ленивый импорт стека графиков.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --workers 4
+
+Первая часть в отдельных процессах замеряет ``django.setup()`` и первый
+запрос к ``/`` - то, что делает каждый воркер и каждая команда manage.py:
+
+- ``lazy`` - текущее поведение, dash/plotly/pandas/numpy не загружаются
+  (если загрузились, бенчмарк завершается с ошибкой);
+- ``eager`` - как раньше, когда ``dashboard.views`` импортировал модули
+  графиков при загрузке (эмулируется импортом ``dashboard.charts``).
+
+Выводится лучшее время из ``--repeat`` запусков и пиковый RSS процесса.
+
+Вторая часть (Linux, если установлен gunicorn) запускает gunicorn с
+``gunicorn.conf.py`` с ``preload_app`` и без, прогревает каждый воркер
+запросами к ``/dashboards/`` и выводит средние PSS (память с учётом
+разделяемых с мастером страниц) и частную память воркера. Результаты
+сравниваются с ``benchmarks/baselines/startup.json``.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import baseline  # noqa: E402
+
+HEAVY_MODULES = ('dash', 'plotly', 'pandas', 'numpy')
+
+STARTUP_SNIPPET = '''
+import json, os, resource, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+import django
+django.setup()
+if {eager}:
+    import dashboard.charts
+from django.test import Client
+Client(HTTP_HOST='localhost').get('/')
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'seconds': elapsed,
+    'maxrss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'heavy': [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''
+
+
+def measure_startup(eager, repeat):
+    runs = []
+    code = STARTUP_SNIPPET.format(eager=eager, heavy=HEAVY_MODULES)
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run['seconds'])
+    return best['seconds'], max(run['maxrss_mb'] for run in runs), best['heavy']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    result = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            result.append(int(entry))
+    return result
+
+
+def memory_mb(pid):
+    """PSS и частная память процесса (МБ) из /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return values['Pss'], values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def measure_workers(preload, workers, warmup_requests):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers),
+               GUNICORN_PRELOAD='true' if preload else 'false')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'superset_presentation.wsgi:application',
+         '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=ROOT, env=env)
+    try:
+        started = time.perf_counter()
+        deadline = time.monotonic() + 60
+        while len(children(process.pid)) < workers:
+            if time.monotonic() > deadline or process.poll() is not None:
+                raise SystemExit('gunicorn не запустился')
+            time.sleep(0.1)
+        request = urllib.request.Request(f'http://127.0.0.1:{port}/', headers={'Host': 'localhost'})
+        while True:
+            try:
+                urllib.request.urlopen(request, timeout=5).read()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise SystemExit('gunicorn не отвечает')
+                time.sleep(0.1)
+        ready = time.perf_counter() - started
+        # Запросы распределяются по воркерам, так что прогреваются все
+        dashboards = urllib.request.Request(f'http://127.0.0.1:{port}/dashboards/', headers={'Host': 'localhost'})
+        for _ in range(warmup_requests * workers):
+            urllib.request.urlopen(dashboards, timeout=60).read()
+        usage = [memory_mb(pid) for pid in children(process.pid)]
+        pss = sum(u[0] for u in usage) / len(usage)
+        private = sum(u[1] for u in usage) / len(usage)
+        return ready, pss, private
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--warmup-requests', type=int, default=3,
+                        help='запросов к /dashboards/ на воркер перед замером памяти')
+    baseline.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f'{"mode":<8} {"startup, ms":>12} {"max RSS, MB":>12}  loaded')
+    for name, eager in (('lazy', False), ('eager', True)):
+        seconds, rss, heavy = measure_startup(eager, args.repeat)
+        results[f'startup.{name}_ms'] = seconds * 1e3
+        results[f'startup.{name}_rss_mb'] = rss
+        print(f'{name:<8} {seconds * 1e3:>12.1f} {rss:>12.1f}  {", ".join(heavy) or "-"}')
+        if not eager and heavy:
+            print(f'Запуск Django загружает {", ".join(heavy)}: ленивый импорт сломан')
+            return 1
+
+    if importlib.util.find_spec('gunicorn') is None or not os.path.exists('/proc/self/smaps_rollup'):
+        print('\ngunicorn не установлен или нет /proc: замер памяти воркеров пропущен')
+    else:
+        print(f'\n{"preload":<8} {"ready, ms":>12} {"PSS/worker, MB":>16} {"private/worker, MB":>20}')
+        for preload in (False, True):
+            ready, pss, private = measure_workers(preload, args.workers, args.warmup_requests)
+            name = 'preload' if preload else 'fork'
+            results[f'gunicorn.{name}_ready_ms'] = ready * 1e3
+            results[f'gunicorn.{name}_pss_mb'] = pss
+            results[f'gunicorn.{name}_private_mb'] = private
+            print(f'{str(preload):<8} {ready * 1e3:>12.1f} {pss:>16.1f} {private:>20.1f}')
+
+    params = {'repeat': args.repeat, 'workers': args.workers}
+    return baseline.report('startup', results, params, args.save_baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,5 +5,13 @@ set -o errexit
 # Устанавливаем зависимости из requirements.txt
 pip install -r requirements.txt
 
-# Выполняем коллекцию статических файлов
-python manage.py collectstatic --noinput
\ No newline at end of file
+# Собственная сборка Plotly.js только с нужными графикам типами трасс
+python manage.py build_plotly_bundle
+
+# Выполняем коллекцию статических файлов (хэш в имени, .gz и .br)
+python manage.py collectstatic --noinput
+
+# Заранее отрисованные страницы для WhiteNoise (если включены)
+if [ "$DASHBOARD_PRERENDER" = "true" ]; then
+    python manage.py build_dashboards
+fi
@@ -1,3 +1,22 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ChartArtifact, MetricFact, MetricRollup
+
+
+@admin.register(MetricFact)
+class MetricFactAdmin(admin.ModelAdmin):
+    list_display = ('metric', 'dimension', 'date', 'value')
+    list_filter = ('metric',)
+    date_hierarchy = 'date'
+
+
+@admin.register(MetricRollup)
+class MetricRollupAdmin(admin.ModelAdmin):
+    list_display = ('metric', 'dimension', 'period', 'period_start', 'value_sum', 'row_count')
+    list_filter = ('metric', 'period')
+
+
+@admin.register(ChartArtifact)
+class ChartArtifactAdmin(admin.ModelAdmin):
+    list_display = ('chart_id', 'revision', 'computed_at', 'duration_ms', 'locked_by')
+    readonly_fields = ('content_hash', 'revision', 'computed_at', 'duration_ms', 'locked_until', 'locked_by')
@@ -0,0 +1,197 @@
+"""Кэш отрисованных HTML-фрагментов графиков.
+
+Фрагмент графика зависит только от его входных данных и шаблона оформления,
+поэтому результат ``fig.to_html()`` можно переиспользовать между запросами.
+Ключ кэша строится из идентификатора графика, версии данных и хэша входных
+данных: изменение данных даёт новый ключ, а ``invalidate()`` сбрасывает
+сразу все фрагменты.
+
+Версия данных читается из базы. В пределах запроса (``request_scope``,
+включается ``DataVersionMiddleware``) она запоминается при первом обращении:
+все графики и выборки страницы используют одну версию, а водяной знак
+читается одним запросом.
+"""
+import contextvars
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+CACHE_ALIAS = getattr(settings, 'DASHBOARD_CHART_CACHE_ALIAS', 'charts')
+
+VERSION_KEY = 'chart:version'
+INVALIDATED_KEY = 'chart:invalidated_at'
+HITS_KEY = 'chart:stats:hits'
+MISSES_KEY = 'chart:stats:misses'
+
+# Память версий текущего запроса (словарь) или None вне request_scope. Пул
+# потоков построения графиков получает копию контекста и тот же словарь.
+_scope = contextvars.ContextVar('chart_cache_scope', default=None)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def is_shared():
+    """Общий ли кэш для всех процессов (не в памяти одного процесса)."""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def _json_default(value):
+    # Массивы NumPy и индексы pandas раскрываем целиком: их str() усекает
+    # длинные ряды многоточием, и разные данные дали бы одинаковый хэш.
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def inputs_hash(*parts):
+    """Стабильный хэш входных данных графика (данные + параметры лайаута)."""
+    payload = json.dumps(parts, sort_keys=True, default=_json_default, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def generation():
+    """Номер явной инвалидации; увеличивается при каждом ``invalidate()``."""
+    cache = get_cache()
+    cache.add(VERSION_KEY, 1, timeout=None)
+    return cache.get(VERSION_KEY, 1)
+
+
+@contextmanager
+def request_scope():
+    """Запоминать версии данных до конца блока (обычно - запроса)."""
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def _scoped(name, compute):
+    scope = _scope.get()
+    if scope is None:
+        return compute()
+    if name not in scope:
+        scope[name] = compute()
+    return scope[name]
+
+
+def watermark():
+    """``rollups.data_version()``; внутри ``request_scope`` читается один раз."""
+    from . import rollups
+
+    return _scoped('watermark', rollups.data_version)
+
+
+def data_version():
+    """Текущая версия данных: водяной знак агрегатов и номер инвалидации.
+
+    Водяной знак (``rollups.data_version()``) читается из базы, поэтому
+    версия меняется во всех процессах сразу после ``refresh_rollups``, даже
+    если кэш у каждого процесса свой (LocMemCache).
+    """
+    def compute():
+        fact_id, updated_at = watermark()
+        return f'{fact_id}.{updated_at.timestamp() if updated_at else 0:.6f}.{generation()}'
+
+    return _scoped('data_version', compute)
+
+
+def invalidated_at():
+    """Время последнего ``invalidate()`` (UTC) или ``None``."""
+    timestamp = get_cache().get(INVALIDATED_KEY)
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp else None
+
+
+def invalidate():
+    """Помечает все закэшированные фрагменты как устаревшие; новый номер инвалидации."""
+    cache = get_cache()
+    cache.set(INVALIDATED_KEY, time.time(), timeout=None)
+    cache.add(VERSION_KEY, 1, timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # Ключ успел истечь или был вытеснен между add() и incr()
+        cache.set(VERSION_KEY, 2, timeout=None)
+        return 2
+
+
+def make_key(chart_id, digest, version):
+    return f'chart:v{version}:{chart_id}:{digest}'
+
+
+def _count(key, delta):
+    if not delta:
+        return
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def stats():
+    """Счётчики попаданий и промахов кэша фрагментов."""
+    values = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+        'version': data_version(),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def render_many(items, map_fn=map):
+    """Возвращает HTML-фрагменты для списка графиков, используя кэш.
+
+    ``items`` - последовательность кортежей ``(chart_id, inputs, render)``,
+    где ``render`` - функция без аргументов, строящая HTML фрагмента.
+    Результат - словарь ``{chart_id: html}``. Все ключи читаются одним
+    запросом к бэкенду кэша, отсутствующие фрагменты строятся и
+    записываются также одним запросом. ``map_fn`` позволяет строить
+    промахи параллельно (например, через пул потоков).
+    """
+    cache = get_cache()
+    version = data_version()
+    keys = {chart_id: make_key(chart_id, inputs_hash(chart_id, inputs), version)
+            for chart_id, inputs, _ in items}
+    cached = cache.get_many(list(keys.values()))
+
+    result = {}
+    to_render = []
+    for chart_id, _, render in items:
+        key = keys[chart_id]
+        if key in cached:
+            result[chart_id] = cached[key]
+        else:
+            to_render.append((chart_id, render))
+
+    missing = {}
+    rendered = map_fn(lambda item: item[1](), to_render)
+    for (chart_id, _), html in zip(to_render, rendered):
+        result[chart_id] = html
+        missing[keys[chart_id]] = html
+
+    if missing:
+        cache.set_many(missing)
+    _count(HITS_KEY, len(items) - len(missing))
+    _count(MISSES_KEY, len(missing))
+    return result
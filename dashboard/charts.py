@@ -0,0 +1,560 @@
+"""Реестр графиков дашборда.
+
+Каждый график описывается спецификацией ``ChartSpec``: источник данных,
+функция построения трасс и переопределения лайаута поверх общего
+``LAYOUT_TEMPLATE``. Страница запрашивает нужные графики по идентификаторам,
+фигуры строятся только при промахе кэша и параллельно в пуле потоков.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import threading
+
+from django.conf import settings
+from django.http import Http404
+import plotly.graph_objects as go
+import pandas as pd
+import numpy as np
+
+from . import chart_cache, downsample, encoding, metrics, profiling, queries, rollups
+
+# ЕДИНАЯ СТРОГАЯ ЦВЕТОВАЯ СХЕМА
+COLOR_PRIMARY = '#1f4b99'  # Темно-синий (основной)
+COLOR_SECONDARY = '#2ca02c' # Темно-зеленый
+COLOR_TERTIARY = '#8b0000'  # Бордовый
+COLOR_GREY = '#404040'      # Темно-серый для текста
+PLOT_BGCOLOR = 'white'      # Фон графиков
+GRID_COLOR = '#e6e6e6'      # Цвет сетки
+
+# ЕДИНЫЙ ШАБЛОН ДЛЯ НАСТРОЙКИ ЛАЙАУТА
+LAYOUT_TEMPLATE = {
+    'font': {'family': 'Roboto, Arial, sans-serif', 'color': COLOR_GREY, 'size': 12},
+    'title': {'x': 0.5, 'xanchor': 'center', 'font': {'size': 16, 'color': COLOR_GREY}},
+    'plot_bgcolor': PLOT_BGCOLOR,
+    'paper_bgcolor': 'rgba(0,0,0,0)', # Прозрачный фон для легкой интеграции в сайт
+    'xaxis': {
+        'showgrid': True,
+        'gridcolor': GRID_COLOR,
+        'gridwidth': 1,
+        'zeroline': False,
+        'showline': True,
+        'linecolor': COLOR_GREY,
+        'linewidth': 1,
+        'tickfont': {'size': 11}
+    },
+    'yaxis': {
+        'showgrid': True,
+        'gridcolor': GRID_COLOR,
+        'gridwidth': 1,
+        'zeroline': False,
+        'showline': True,
+        'linecolor': COLOR_GREY,
+        'linewidth': 1,
+        'tickfont': {'size': 11},
+        'tickprefix': '₽', # Добавляем символ рубля для финансовых графиков
+    },
+    'legend': {
+        'orientation': 'h',
+        'yanchor': 'bottom',
+        'y': 1.02,
+        'xanchor': 'right',
+        'x': 1
+    },
+    'hoverlabel': {
+        'bgcolor': 'white',
+        'font_size': 11,
+        'font_family': 'Roboto, Arial, sans-serif'
+    },
+    'margin': {'l': 50, 'r': 20, 't': 60, 'b': 50},
+    'height': 400,
+}
+
+
+class ChartSpec:
+    """Описание одного графика дашборда."""
+
+    def __init__(self, chart_id, title, data_source, builder, layout=None, div_id=None, series=None,
+                 traces=None, cross_filter=None, metrics=(), refresh_interval=None):
+        self.chart_id = chart_id
+        self.title = title                # Заголовок карточки на странице
+        self.data_source = data_source    # (query) -> dict с входными данными
+        self.builder = builder            # (data) -> go.Figure без общего лайаута
+        self.layout = layout or {}        # Переопределения поверх LAYOUT_TEMPLATE
+        self.div_id = div_id or f'{chart_id.replace("_", "-")}-chart'
+        # (ключ оси X, [ключи рядов Y]) - временные ряды, которые можно
+        # обрезать по диапазону и прореживать под ширину графика
+        self.series = series
+        # (data) -> [{атрибут трассы: значения}] - данные трасс без построения
+        # фигуры, для обновления графика через Plotly.restyle (см. crossfilter)
+        self.traces = traces
+        # (имя фильтра, ключ данных, атрибут точки Plotly): клик фильтрует
+        # остальные графики по значению из data[ключ]; клиент берёт его из
+        # атрибута точки события plotly_click (x, y, label, text, customdata)
+        self.cross_filter = cross_filter
+        # Метрики фактов (MetricFact.metric), на которых построен график, -
+        # для выгрузки данных (см. dashboard.export)
+        self.metrics = tuple(metrics)
+        # Период пересчёта планировщиком в секундах (None - общий, см.
+        # dashboard.precompute)
+        self.refresh_interval = refresh_interval
+
+    def __repr__(self):
+        return f'<ChartSpec {self.chart_id}>'
+
+    @property
+    def zoomable(self):
+        return self.series is not None
+
+    def get_data(self, query=None):
+        with profiling.span('data', self.chart_id):
+            return self.data_source(query or queries.DEFAULT_QUERY)
+
+    def prepare_data(self, data, options=None):
+        """Обрезает временные ряды по диапазону и прореживает их.
+
+        ``options``: ``width`` - ширина графика в пикселях (по умолчанию
+        ``DASHBOARD_CHART_WIDTH``), ``start``/``end`` - границы диапазона,
+        ``downsample`` - метод (``'lttb'`` или ``'minmax'``), ``encoding`` -
+        при ``'binary'`` ряды Y передаются в фигуру массивами NumPy. Если рядов меньше,
+        чем пикселей, и диапазон не задан, данные возвращаются как есть.
+        """
+        if self.series is None:
+            return data
+        options = options or {}
+        x_key, y_keys = self.series
+        if options.get('encoding') == 'binary':
+            data = encoding.as_arrays(data, y_keys)
+        x = data[x_key]
+        lo, hi = downsample.time_range(x, options.get('start'), options.get('end'))
+        n_points = options.get('width') or getattr(settings, 'DASHBOARD_CHART_WIDTH', 1200)
+        if (lo, hi) == (0, len(x)) and len(x) <= n_points:
+            return data
+
+        ys = [np.asarray(data[key][lo:hi], dtype=float) for key in y_keys]
+        keep = lo + downsample.select(x[lo:hi], ys, n_points, options.get('downsample', 'lttb'))
+        prepared = dict(data)
+        for key in [x_key] + list(y_keys):
+            values = data[key]
+            prepared[key] = values[keep] if hasattr(values, 'take') else [values[i] for i in keep.tolist()]
+        return prepared
+
+    def build_figure(self, data, options=None):
+        with profiling.span('prepare', self.chart_id):
+            data = self.prepare_data(data, options)
+        with profiling.span('figure', self.chart_id):
+            fig = self.builder(data)
+        with profiling.span('layout', self.chart_id):
+            fig.update_layout(LAYOUT_TEMPLATE)
+            fig.update_layout(self.layout)
+        return fig
+
+    def render_html(self, data, options=None):
+        fig = self.build_figure(data, options)
+        with profiling.span('to_html', self.chart_id):
+            return fig.to_html(full_html=False, include_plotlyjs=False, div_id=self.div_id)
+
+    def render_json(self, data, options=None):
+        binary = (options or {}).get('encoding') == 'binary'
+        fig = self.build_figure(data, options)
+        with profiling.span('to_json', self.chart_id):
+            return encoding.figure_to_json(fig, binary=binary)
+
+    def render(self, data, fmt='html', options=None):
+        if fmt == 'json':
+            return self.render_json(data, options)
+        return self.render_html(data, options)
+
+    def cache_inputs(self, data, options=None):
+        return (data, LAYOUT_TEMPLATE, self.layout, options or {})
+
+
+REGISTRY = {}
+
+
+def register_chart(chart_id, title, data_source, layout=None, div_id=None, series=None,
+                   traces=None, cross_filter=None, metrics=(), refresh_interval=None):
+    """Декоратор, регистрирующий функцию построения графика в реестре."""
+    def decorator(builder):
+        REGISTRY[chart_id] = ChartSpec(chart_id, title, data_source, builder,
+                                       layout=layout, div_id=div_id, series=series,
+                                       traces=traces, cross_filter=cross_filter, metrics=metrics,
+                                       refresh_interval=refresh_interval)
+        return builder
+    return decorator
+
+
+def get_specs(chart_ids=None):
+    """Спецификации графиков в порядке регистрации или в запрошенном порядке."""
+    if not chart_ids:
+        return list(REGISTRY.values())
+    try:
+        return [REGISTRY[chart_id] for chart_id in chart_ids]
+    except KeyError as exc:
+        raise Http404(f'Неизвестный график: {exc.args[0]}')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'DASHBOARD_CHART_WORKERS', 4),
+                    thread_name_prefix='chart-builder',
+                )
+    return _executor
+
+
+def _parallel_map(func, iterable):
+    calls = list(iterable)
+    if len(calls) < 2 or getattr(settings, 'DASHBOARD_CHART_WORKERS', 4) <= 1:
+        return [func(call) for call in calls]
+    # Каждая задача выполняется в копии контекста запроса (профиль, см. profiling)
+    executor = _get_executor()
+    futures = [executor.submit(contextvars.copy_context().run, func, call) for call in calls]
+    return [future.result() for future in futures]
+
+
+def render_charts(specs, fmt='html', options=None, query=None):
+    """Возвращает список пар ``(spec, fragment)`` для переданных спецификаций.
+
+    ``fmt`` - ``'html'`` (фрагмент для вставки в страницу) или ``'json'``
+    (JSON фигуры для Plotly.newPlot); ``options`` - параметры отображения
+    временных рядов (см. ``ChartSpec.prepare_data``), ``query`` - срез данных
+    (см. ``dashboard.queries``). Данные запрашиваются у
+    всех графиков (они нужны для ключа кэша), а фигуры строятся и
+    сериализуются только для промахов кэша - параллельно.
+    """
+    items = []
+    for spec in specs:
+        data = spec.get_data(query)
+        items.append((
+            f'{spec.chart_id}.{fmt}',
+            spec.cache_inputs(data, options),
+            lambda spec=spec, data=data: spec.render(data, fmt, options),
+        ))
+    with profiling.span('charts'):
+        fragments = chart_cache.render_many(items, map_fn=_parallel_map)
+    return [(spec, fragments[f'{spec.chart_id}.{fmt}']) for spec in specs]
+
+
+# ---------------------------------------------------------------------------
+# Источники данных
+#
+# Источник получает срез ``query`` (dashboard.queries) и читает агрегаты
+# (dashboard.rollups) за его диапазон с его гранулярностью и фильтрами. Пока
+# агрегатов нет (пустая база), графики без фильтров показывают
+# демонстрационные значения; пустой срез с фильтрами даёт пустой график.
+# ---------------------------------------------------------------------------
+
+def trend_data(query):
+    series = rollups.period_series([('revenue', ''), ('profit', '')], query)
+    if series['dates'] or not query.is_default:
+        return {
+            'dates': series['dates'],
+            'revenue': series[('revenue', '')],
+            'profit': series[('profit', '')],
+        }
+    return {
+        'dates': pd.date_range(start='2024-01-01', periods=6, freq='ME'),
+        'revenue': [45.2, 48.5, 52.1, 49.8, 55.3, 58.9], # млн руб.
+        'profit': [12.1, 13.0, 14.5, 13.2, 15.8, 17.2],  # млн руб.
+    }
+
+
+def expenses_data(query):
+    totals = rollups.dimension_totals('expenses', query)
+    if totals or not query.is_default:
+        return {
+            'labels': [dimension for dimension, _ in totals],
+            'values': [total for _, total in totals],
+        }
+    return {
+        'labels': ['ФОТ', 'Закупка сырья', 'Маркетинг', 'Налоги', 'Аренда', 'Прочие'],
+        'values': [45, 25, 10, 8, 7, 5],
+    }
+
+
+def plan_fact_data(query):
+    series = rollups.period_series([('plan', ''), ('actual', '')], query)
+    if series['dates'] or not query.is_default:
+        return {
+            'months': [rollups.period_label(date, query.granularity) for date in series['dates']],
+            'dates': series['dates'],
+            'planned': series[('plan', '')],
+            'actual': series[('actual', '')],
+        }
+    return {
+        'months': ['Янв', 'Фев', 'Мар', 'Апр'],
+        'dates': pd.date_range(start='2024-01-01', periods=4, freq='MS'),
+        'planned': [22, 25, 23, 28],
+        'actual': [20, 26, 25, 30],
+    }
+
+
+def funnel_data(query):
+    totals = rollups.dimension_totals('funnel', query)
+    if totals or not query.is_default:
+        return {
+            'labels': [dimension for dimension, _ in totals],
+            'values': [total for _, total in totals],
+        }
+    return {
+        'labels': ['Лиды', 'Квалифицированные', 'Предложение', 'Переговоры', 'Сделка'],
+        'values': [1000, 600, 400, 250, 150],
+    }
+
+
+DEBT_BUCKETS = [('debt_1_30', '1-30'), ('debt_31_60', '31-60'), ('debt_60_90', '60-90')]
+
+
+def debt_data(query):
+    series = rollups.period_series([('overdue_debt', bucket) for _, bucket in DEBT_BUCKETS], query)
+    if series['dates'] or not query.is_default:
+        data = {'dates': series['dates']}
+        for key, bucket in DEBT_BUCKETS:
+            data[key] = series[('overdue_debt', bucket)]
+        return data
+    return {
+        'dates': pd.date_range(start='2024-01-01', periods=5, freq='ME'),
+        'debt_1_30': [1.2, 1.5, 1.0, 1.8, 1.3],
+        'debt_31_60': [0.5, 0.7, 0.4, 0.9, 0.6],
+        'debt_60_90': [0.2, 0.3, 0.1, 0.4, 0.2],
+    }
+
+
+def scatter_data(query):
+    income = dict(rollups.dimension_totals('income', query))
+    costs = dict(rollups.dimension_totals('costs', query))
+    if income or not query.is_default:
+        categories = sorted(income)
+        return {
+            'categories': categories,
+            'income': [income[category] for category in categories],
+            'costs': [costs.get(category, 0) for category in categories],
+        }
+    return {
+        'categories': ['Направление A', 'Направление B', 'Направление C', 'Направление D'],
+        'income': [50, 80, 30, 65],
+        'costs': [20, 50, 25, 30],
+    }
+
+
+def waterfall_data(query):
+    return {
+        'labels': ['Нач. остаток', 'Продажи', 'Возвраты', 'Закупки', 'Корректировки', 'Кон. остаток'],
+        'values': [100, 50, -15, -40, 5, None],  # None для конечного остатка
+    }
+
+
+def hbar_data(query):
+    leads = dict(rollups.dimension_totals('channel_leads', query))
+    deals = dict(rollups.dimension_totals('channel_deals', query))
+    if leads or not query.is_default:
+        channels = sorted(leads)
+        return {
+            'channels': channels,
+            'conversion': metrics.conversion_pct(
+                [deals.get(channel, 0) for channel in channels],
+                [leads[channel] for channel in channels],
+            ).tolist(),
+        }
+    return {
+        'channels': ['Партнеры', 'Сайт', 'Кол-центр', 'Соц. сети', 'Прямые продажи'],
+        'conversion': [22, 15, 18, 10, 25],  # %
+    }
+
+
+# ---------------------------------------------------------------------------
+# Графики
+# ---------------------------------------------------------------------------
+
+@register_chart(
+    'trend', 'Динамика выручки и прибыли', trend_data,
+    layout={'title': 'Динамика выручки и прибыли (млн руб.)'},
+    series=('dates', ['revenue', 'profit']),
+    traces=lambda data: [{'x': data['dates'], 'y': data['revenue']}, {'x': data['dates'], 'y': data['profit']}],
+    cross_filter=('period', 'dates', 'x'),
+    metrics=('revenue', 'profit'),
+)
+def build_trend(data):
+    """ГРАФИК 1: Динамика ключевых показателей (Линейный)."""
+    fig_trend = go.Figure()
+    fig_trend.add_trace(go.Scatter(x=data['dates'], y=data['revenue'], mode='lines+markers', name='Выручка', line=dict(color=COLOR_PRIMARY, width=3)))
+    fig_trend.add_trace(go.Scatter(x=data['dates'], y=data['profit'], mode='lines+markers', name='Чистая прибыль', line=dict(color=COLOR_SECONDARY, width=3)))
+    return fig_trend
+
+
+@register_chart(
+    'expenses', 'Структура операционных расходов', expenses_data,
+    layout={'title': 'Структура операционных расходов (%)', 'showlegend': False},
+    traces=lambda data: [{'labels': data['labels'], 'values': data['values']}],
+    cross_filter=('category', 'labels', 'label'),
+    metrics=('expenses',),
+)
+def build_expenses(data):
+    """ГРАФИК 2: Структура расходов (Круговая)."""
+    return go.Figure(data=[go.Pie(
+        labels=data['labels'],
+        values=data['values'],
+        hole=.4,
+        marker=dict(colors=[COLOR_PRIMARY, COLOR_SECONDARY, COLOR_TERTIARY, '#7f7f7f', '#17becf', '#bcbd22']),
+        textinfo='label+percent',
+        textfont_size=13
+    )])
+
+
+@register_chart(
+    'plan_fact', 'Выполнение плана по месяцам', plan_fact_data,
+    layout={
+        'title': 'Выполнение плана по месяцам (млн руб.)',
+        'barmode': 'group',
+        'yaxis': {'tickprefix': '₽'},
+    },
+    # На оси - подписи периодов, дата периода передаётся в customdata
+    traces=lambda data: [
+        {'x': data['months'], 'y': data['planned'], 'customdata': data['dates']},
+        {'x': data['months'], 'y': data['actual'], 'customdata': data['dates']},
+    ],
+    cross_filter=('period', 'dates', 'customdata'),
+    metrics=('plan', 'actual'),
+)
+def build_plan_fact(data):
+    """ГРАФИК 3: Плановые vs Фактические показатели (Столбчатый с группойми)."""
+    fig_plan_vs_fact = go.Figure()
+    fig_plan_vs_fact.add_trace(go.Bar(name='План', x=data['months'], y=data['planned'], customdata=data['dates'], marker_color=COLOR_PRIMARY, opacity=0.9))
+    fig_plan_vs_fact.add_trace(go.Bar(name='Факт', x=data['months'], y=data['actual'], customdata=data['dates'], marker_color=COLOR_SECONDARY, opacity=0.9))
+    return fig_plan_vs_fact
+
+
+@register_chart(
+    'funnel', 'Воронка продаж', funnel_data,
+    layout={'title': 'Воронка продаж'},
+    traces=lambda data: [{'y': data['labels'], 'x': data['values']}],
+    cross_filter=('stage', 'labels', 'y'),
+    metrics=('funnel',),
+)
+def build_funnel(data):
+    """ГРАФИК 4: Воронка продаж."""
+    return go.Figure(go.Funnel(
+        y=data['labels'],
+        x=data['values'],
+        textinfo = "value+percent initial",
+        marker={"color": [COLOR_PRIMARY, '#3d72a4', '#5a93cb', '#87bcde', '#b4d4e7']},
+        textfont={"size": 12}
+    ))
+
+
+@register_chart(
+    'debt', 'Просроченная дебиторская задолженность', debt_data,
+    layout={'title': 'Динамика просроченной дебиторской задолженности (млн руб.)', 'hovermode': 'x unified'},
+    series=('dates', [key for key, _ in DEBT_BUCKETS]),
+    traces=lambda data: [{'x': data['dates'], 'y': data[key]} for key, _ in DEBT_BUCKETS],
+    cross_filter=('period', 'dates', 'x'),
+    metrics=('overdue_debt',),
+)
+def build_debt(data):
+    """ГРАФИК 5: Динамика просроченной задолженности (Область)."""
+    fig_debt = go.Figure()
+    fig_debt.add_trace(go.Scatter(x=data['dates'], y=data['debt_1_30'], mode='none', name='1-30 дней', stackgroup='one', fillcolor='#ff9999'))
+    fig_debt.add_trace(go.Scatter(x=data['dates'], y=data['debt_31_60'], mode='none', name='31-60 дней', stackgroup='one', fillcolor='#ff6666'))
+    fig_debt.add_trace(go.Scatter(x=data['dates'], y=data['debt_60_90'], mode='none', name='60-90 дней', stackgroup='one', fillcolor='#ff0000'))
+    return fig_debt
+
+
+def scatter_traces(data):
+    profitability = metrics.margin_pct(data['income'], data['costs'])
+    return [{
+        'x': data['income'],
+        'y': data['costs'],
+        'text': data['categories'],
+        'marker.size': profitability.tolist(),
+        'marker.color': profitability.tolist(),
+        'marker.sizeref': metrics.bubble_sizeref(profitability),
+    }]
+
+
+@register_chart(
+    'scatter', 'Соотношение доходов и затрат', scatter_data,
+    layout={
+        'title': 'Соотношение доходов и затрат по направлениям',
+        'xaxis_title': 'Доходы (млн руб.)',
+        'yaxis_title': 'Затраты (млн руб.)',
+        'yaxis': {'tickprefix': '₽'},
+        'xaxis': {'tickprefix': '₽'},
+    },
+    traces=scatter_traces,
+    cross_filter=('direction', 'categories', 'text'),
+    metrics=('income', 'costs'),
+)
+def build_scatter(data):
+    """ГРАФИК 6: Соотношение затрат и доходов по направлениям (Scatter)."""
+    income = data['income']
+    costs = data['costs']
+    profitability = metrics.margin_pct(income, costs)  # Расчет рентабельности в %
+    sizeref = metrics.bubble_sizeref(profitability)
+    profitability = profitability.tolist()
+
+    fig_scatter = go.Figure()
+    fig_scatter.add_trace(go.Scatter(
+        x=income,
+        y=costs,
+        mode='markers+text',
+        marker=dict(size=profitability, sizemode='area', sizeref=sizeref, sizemin=4, color=profitability, colorscale='Blues', showscale=True),
+        text=data['categories'],
+        textposition='middle right',
+        hovertemplate='<b>%{text}</b><br>Доход: ₽%{x} млн<br>Затраты: ₽%{y} млн<br>Рентабельность: %{marker.size:.1f}%<extra></extra>'
+    ))
+    return fig_scatter
+
+
+@register_chart(
+    'waterfall', 'Движение товарных запасов', waterfall_data,
+    layout={'title': 'Движение товарных запасов (тыс. ед.)'},
+    refresh_interval=3600,  # демонстрационные данные не меняются
+)
+def build_waterfall(data):
+    """ГРАФИК 7: Отклонение от плана (Waterfall)."""
+    waterfall_values = data['values']
+    return go.Figure(go.Waterfall(
+        name="Склад",
+        orientation="v",
+        measure=["absolute", "relative", "relative", "relative", "relative", "total"],
+        x=data['labels'],
+        textposition="outside",
+        text=metrics.waterfall_labels(waterfall_values),
+        y=waterfall_values,
+        connector={"line":{"color":"rgb(63, 63, 63)"}},
+        increasing={"marker":{"color":COLOR_SECONDARY}},
+        decreasing={"marker":{"color":COLOR_TERTIARY}},
+        totals={"marker":{"color":COLOR_PRIMARY}}
+    ))
+
+
+@register_chart(
+    'hbar', 'Конверсия по каналам продаж', hbar_data,
+    layout={
+        'title': 'Конверсия по каналам продаж',
+        'xaxis_title': 'Конверсия, %',
+        'yaxis': {'autorange': 'reversed'},  # Чтобы список шел сверху вниз
+    },
+    traces=lambda data: [{'y': data['channels'], 'x': data['conversion'], 'text': data['conversion']}],
+    cross_filter=('channel', 'channels', 'y'),
+    metrics=('channel_leads', 'channel_deals'),
+)
+def build_hbar(data):
+    """ГРАФИК 8: Эффективность каналов продаж (Horizontal Bar)."""
+    fig_hbar = go.Figure()
+    fig_hbar.add_trace(go.Bar(
+        y=data['channels'],
+        x=data['conversion'],
+        orientation='h',
+        marker_color=COLOR_PRIMARY,
+        text=data['conversion'],
+        texttemplate='%{text}%',
+        textposition='auto'
+    ))
+    return fig_hbar
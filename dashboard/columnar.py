@@ -0,0 +1,437 @@
+"""Файловое колоночное хранилище рядов метрик (memory-mapped NumPy).
+
+Длинную историю фактов графикам не нужно читать через ORM: при
+``DASHBOARD_COLUMNAR_STORE = True`` выборки ``rollups.period_series`` и
+``rollups.dimension_totals`` считаются по файлам ``.npy``, открытым через
+``np.load(mmap_mode='r')``. Срез диапазона дат - это ``searchsorted`` по
+отсортированным дням и срез memmap без копирования; страницы файлов читает
+ОС и делит между воркерами, запросов к базе нет.
+
+Структура каталога ``DASHBOARD_COLUMNAR_ROOT``::
+
+    manifest.json                        курсор фактов, словари измерений, партиции
+    <метрика>/<ГГГГ-ММ>/columns.<gen>.npy  колонки партиции подряд (байты)
+
+В файле партиции из ``n`` строк колонки лежат одна за другой: дни от эпохи
+(int32, по возрастанию), коды измерений (int32) и значения (float64). Колонки
+- представления одного memmap, поэтому открытая партиция держит один
+файловый дескриптор, а открытыми остаются только
+``DASHBOARD_COLUMNAR_CACHE_SIZE`` недавно прочитанных партиций.
+
+Данные разбиты на партиции по метрике и месяцу. Новые факты дописываются
+инкрементально (``sync`` после ``rollups.refresh``): переписываются только
+затронутые партиции, и каждая запись создаёт новое поколение файлов
+``<gen>``. Манифест заменяется атомарно последним, поэтому читатели видят
+либо старое, либо новое состояние целиком; файлы предыдущего поколения
+остаются на диске для тех, кто ещё читает по старому манифесту.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from . import fact_cursor, queries
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки записи
+    fcntl = None
+
+MANIFEST_NAME = 'manifest.json'
+
+COLUMNS = ('days', 'dimension', 'value')
+
+COLUMN_DTYPES = {'days': np.int32, 'dimension': np.int32, 'value': np.float64}
+
+ROW_BYTES = sum(np.dtype(dtype).itemsize for dtype in COLUMN_DTYPES.values())
+
+FILE_RE = re.compile(r'^columns\.(?P<generation>\d+)\.npy$')
+
+# Гранулярности, для которых вся партиция (месяц) попадает в один период
+MONTHLY_GRANULARITIES = {'month': 1, 'quarter': 3, 'year': 12}
+
+
+def _empty_manifest():
+    return {'generation': 0, 'last_fact_id': 0, 'gaps': [], 'dimensions': {}, 'partitions': {}}
+
+
+def _to_days(date):
+    return int(np.datetime64(date, 'D').astype(np.int64))
+
+
+def _month_key(date):
+    return f'{date.year:04d}-{date.month:02d}'
+
+
+def _bucket_of_month(month, granularity):
+    """Начало периода (дни от эпохи) для партиции месяца ``month``."""
+    months = int(np.datetime64(month, 'M').astype(np.int64))
+    months -= months % MONTHLY_GRANULARITIES[granularity]
+    return int(np.datetime64(months, 'M').astype('datetime64[D]').astype(np.int64))
+
+
+def _partition_path(directory, generation):
+    return directory / f'columns.{generation}.npy'
+
+
+def _pack(columns):
+    """Колонки партиции одним массивом байт (порядок - ``COLUMNS``)."""
+    return np.concatenate([
+        np.ascontiguousarray(columns[column], dtype=COLUMN_DTYPES[column]).view(np.uint8) for column in COLUMNS
+    ])
+
+
+def _unpack(buffer):
+    """Колонки партиции - представления массива байт ``buffer`` без копирования."""
+    rows = len(buffer) // ROW_BYTES
+    columns, offset = {}, 0
+    for column in COLUMNS:
+        size = rows * np.dtype(COLUMN_DTYPES[column]).itemsize
+        columns[column] = buffer[offset:offset + size].view(COLUMN_DTYPES[column])
+        offset += size
+    return columns
+
+
+def _write_array(path, array):
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _generations(manifest):
+    return {
+        (metric, month): partition['generation']
+        for metric, partitions in manifest['partitions'].items()
+        for month, partition in partitions.items()
+    }
+
+
+class _Writer:
+    """Одна запись в хранилище: новое поколение файлов и новый манифест."""
+
+    def __init__(self, store, manifest, rebuild=False):
+        self.store = store
+        self.original = json.dumps(manifest, sort_keys=True)
+        # Файлы прежнего манифеста ещё могут читать другие процессы
+        self.previous = _generations(manifest)
+        if rebuild:
+            manifest = dict(_empty_manifest(), generation=manifest['generation'])
+        self.manifest = manifest
+        self.rebuild = rebuild
+        self.generation = manifest['generation'] + 1
+        self.touched = set()
+
+    def _codes(self, metric, dimensions):
+        names = self.manifest['dimensions'].setdefault(metric, [])
+        lookup = {name: code for code, name in enumerate(names)}
+        codes, uniques = pd.factorize(np.asarray(dimensions, dtype=object))
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for index, name in enumerate(uniques):
+            if name not in lookup:
+                lookup[name] = len(names)
+                names.append(name)
+            mapping[index] = lookup[name]
+        return mapping[codes]
+
+    def add(self, metrics, dimensions, dates, values):
+        """Дописывает строки в партиции их метрик и месяцев."""
+        frame = pd.DataFrame({
+            'metric': np.asarray(metrics, dtype=object),
+            'dimension': np.asarray(dimensions, dtype=object),
+            'days': np.asarray(dates, dtype='datetime64[D]').astype(np.int64),
+            'value': np.asarray(values, dtype=np.float64),
+        })
+        frame['month'] = frame['days'].to_numpy().astype('datetime64[D]').astype('datetime64[M]').astype(str)
+        for (metric, month), rows in frame.groupby(['metric', 'month'], sort=True):
+            new = {
+                'days': rows['days'].to_numpy(dtype=np.int32),
+                'dimension': self._codes(metric, rows['dimension'].to_numpy()),
+                'value': rows['value'].to_numpy(dtype=np.float64),
+            }
+            self._merge(metric, month, new)
+
+    def _merge(self, metric, month, new):
+        partitions = self.manifest['partitions'].setdefault(metric, {})
+        current = partitions.get(month)
+        directory = self.store.root / metric / month
+        if current is not None:
+            # Без кэша читателя: файлы этого поколения могут переписываться
+            # несколько раз за одну запись
+            old = _unpack(np.load(_partition_path(directory, current['generation'])))
+            new = {column: np.concatenate((old[column], new[column])) for column in COLUMNS}
+        self.touched.add((metric, month))
+        order = np.argsort(new['days'], kind='stable')
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_array(_partition_path(directory, self.generation),
+                     _pack({column: new[column][order] for column in COLUMNS}))
+        partitions[month] = {'generation': self.generation, 'rows': int(len(order))}
+
+    def commit(self):
+        if not self.touched and not self.rebuild and json.dumps(self.manifest, sort_keys=True) == self.original:
+            return
+        self.manifest['generation'] = self.generation
+        path = self.store.root / MANIFEST_NAME
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(self.manifest, ensure_ascii=False, sort_keys=True))
+        os.replace(tmp, path)
+
+        # Удаляем файлы, на которые не ссылается ни новый, ни прежний манифест
+        current = _generations(self.manifest)
+        partitions = set(self.previous) | self.touched if self.rebuild else self.touched
+        for metric, month in partitions:
+            keep = {current.get((metric, month)), self.previous.get((metric, month))}
+            for file in (self.store.root / metric / month).glob('*.npy'):
+                match = FILE_RE.match(file.name)
+                if match and int(match['generation']) not in keep:
+                    file.unlink(missing_ok=True)
+
+
+class ColumnarStore:
+    """Хранилище в каталоге ``root`` с выборками в духе ``dashboard.rollups``.
+
+    Каждый memmap держит открытым файловый дескриптор, поэтому открытыми
+    остаются только ``cache_size`` недавно прочитанных партиций (LRU).
+    """
+
+    def __init__(self, root, cache_size=None):
+        self.root = Path(root)
+        self.cache_size = cache_size or getattr(settings, 'DASHBOARD_COLUMNAR_CACHE_SIZE', 512)
+        self._lock = threading.Lock()
+        self._manifest = _empty_manifest()
+        self._manifest_mtime = None
+        self._lookups = {}
+        self._arrays = OrderedDict()
+
+    def __repr__(self):
+        return f'<ColumnarStore {self.root}>'
+
+    # -- чтение ---------------------------------------------------------------
+
+    def manifest(self):
+        """Текущий манифест; перечитывается, только если файл изменился."""
+        try:
+            mtime = (self.root / MANIFEST_NAME).stat().st_mtime_ns
+        except FileNotFoundError:
+            return _empty_manifest()
+        if mtime != self._manifest_mtime:
+            with self._lock:
+                if mtime != self._manifest_mtime:
+                    manifest = json.loads((self.root / MANIFEST_NAME).read_text())
+                    current = {
+                        (metric, month, partition['generation'])
+                        for metric, partitions in manifest['partitions'].items()
+                        for month, partition in partitions.items()
+                    }
+                    self._arrays = OrderedDict(
+                        (key, arrays) for key, arrays in self._arrays.items() if key in current)
+                    self._lookups = {
+                        metric: {name: code for code, name in enumerate(names)}
+                        for metric, names in manifest['dimensions'].items()
+                    }
+                    self._manifest, self._manifest_mtime = manifest, mtime
+        return self._manifest
+
+    @property
+    def last_fact_id(self):
+        return self.manifest()['last_fact_id']
+
+    def read_partition(self, metric, month, generation):
+        """Колонки партиции - представления одного memmap (LRU из ``cache_size`` партиций)."""
+        key = (metric, month, generation)
+        with self._lock:
+            arrays = self._arrays.get(key)
+            if arrays is not None:
+                self._arrays.move_to_end(key)
+                return arrays
+        arrays = _unpack(np.load(_partition_path(self.root / metric / month, generation), mmap_mode='r'))
+        with self._lock:
+            self._arrays[key] = arrays
+            # Вытесненный memmap закрывает дескриптор, когда его перестают читать
+            while len(self._arrays) > self.cache_size:
+                self._arrays.popitem(last=False)
+        return arrays
+
+    def columns(self, metric, since=None, until=None):
+        """``(месяц, колонки)`` партиций метрики в диапазоне дат по порядку.
+
+        Колонки - срезы memmap без копирования: граничные партиции
+        обрезаются бинарным поиском по дням.
+        """
+        partitions = self.manifest()['partitions'].get(metric, {})
+        first = _month_key(since) if since else None
+        last = _month_key(until) if until else None
+        for month in sorted(partitions):
+            if (first and month < first) or (last and month > last):
+                continue
+            arrays = self.read_partition(metric, month, partitions[month]['generation'])
+            days = arrays['days']
+            lo = int(np.searchsorted(days, _to_days(since), 'left')) if month == first else 0
+            hi = int(np.searchsorted(days, _to_days(until), 'right')) if month == last else len(days)
+            if hi > lo:
+                yield month, {column: array[lo:hi] for column, array in arrays.items()}
+
+    def _allowed(self, metric, query):
+        """Таблица разрешённых кодов измерений метрики или ``None`` без фильтров."""
+        lookup = self._lookups.get(metric, {})
+        allowed = None
+        for name, values in query.filters.items():
+            if metric not in queries.DIMENSION_FILTERS[name]:
+                continue
+            table = np.zeros(len(lookup), dtype=bool)
+            table[[lookup[value] for value in values if value in lookup]] = True
+            allowed = table if allowed is None else allowed & table
+        return allowed
+
+    def _slices(self, metric, query):
+        allowed = self._allowed(metric, query)
+        for month, columns in self.columns(metric, query.since, query.until):
+            if allowed is not None:
+                keep = allowed[columns['dimension']]
+                columns = {column: array[keep] for column, array in columns.items()}
+            yield month, columns
+
+    def period_series(self, series, query):
+        """То же, что ``rollups.period_series``, по файлам хранилища."""
+        self.manifest()
+        parts = {key: ([], []) for key in series}
+        for metric in sorted({metric for metric, _ in series}):
+            lookup = self._lookups.get(metric, {})
+            wanted = {lookup[dimension]: (metric, dimension)
+                      for key_metric, dimension in series if key_metric == metric and dimension in lookup}
+            if not wanted:
+                continue
+            for month, columns in self._slices(metric, query):
+                codes, values = columns['dimension'], columns['value']
+                if query.granularity in MONTHLY_GRANULARITIES:
+                    # Вся партиция - один период: суммы по кодам одним bincount
+                    bucket = _bucket_of_month(month, query.granularity)
+                    totals = np.bincount(codes, weights=values, minlength=len(lookup))
+                    counts = np.bincount(codes, minlength=len(lookup))
+                    for code, key in wanted.items():
+                        if counts[code]:
+                            parts[key][0].append(np.array([bucket]))
+                            parts[key][1].append(totals[code:code + 1])
+                    continue
+                days = columns['days'].astype(np.int64)
+                # 1970-01-01 - четверг; неделя начинается с понедельника
+                buckets = days if query.granularity == 'day' else days - (days + 3) % 7
+                for code, key in wanted.items():
+                    selected = codes == code
+                    selected_buckets = buckets[selected]
+                    if not len(selected_buckets):
+                        continue
+                    # Дни в партиции отсортированы: периоды идут подряд, и суммы
+                    # считаются по границам серий без сортировки
+                    starts = np.flatnonzero(np.r_[True, selected_buckets[1:] != selected_buckets[:-1]])
+                    parts[key][0].append(selected_buckets[starts])
+                    parts[key][1].append(np.add.reduceat(values[selected], starts))
+
+        sums = {}
+        for key, (periods, totals) in parts.items():
+            if periods:
+                # Неделя может начинаться в одной партиции и заканчиваться в другой
+                unique, inverse = np.unique(np.concatenate(periods), return_inverse=True)
+                sums[key] = (unique, np.bincount(inverse, weights=np.concatenate(totals), minlength=len(unique)))
+
+        all_periods = np.unique(np.concatenate([periods for periods, _ in sums.values()] or [np.empty(0, np.int64)]))
+        result = {'dates': all_periods.astype('datetime64[D]').tolist()}
+        for key in series:
+            column = [None] * len(all_periods)
+            if key in sums:
+                periods, totals = sums[key]
+                for index, total in zip(np.searchsorted(all_periods, periods).tolist(), totals.tolist()):
+                    column[index] = total
+            result[tuple(key)] = column
+        return result
+
+    def dimension_totals(self, metric, query):
+        """То же, что ``rollups.dimension_totals``, по файлам хранилища."""
+        names = self.manifest()['dimensions'].get(metric, [])
+        totals = np.zeros(len(names))
+        counts = np.zeros(len(names), dtype=np.int64)
+        for _, columns in self._slices(metric, query):
+            totals += np.bincount(columns['dimension'], weights=columns['value'], minlength=len(names))
+            counts += np.bincount(columns['dimension'], minlength=len(names))
+        present = np.flatnonzero(counts)
+        rows = [(names[code], total) for code, total in zip(present.tolist(), totals[present].tolist())]
+        return sorted(rows, key=lambda row: (-row[1], row[0]))
+
+    # -- запись ---------------------------------------------------------------
+
+    @contextmanager
+    def writing(self, rebuild=False):
+        """Запись в хранилище (один процесс за раз); манифест - при выходе."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            path = self.root / MANIFEST_NAME
+            manifest = json.loads(path.read_text()) if path.exists() else _empty_manifest()
+            writer = _Writer(self, manifest, rebuild=rebuild)
+            yield writer
+            writer.commit()
+
+    def append(self, metrics, dimensions, dates, values, last_fact_id=None):
+        """Дописывает строки (параллельные последовательности) одним поколением."""
+        with self.writing() as writer:
+            writer.add(metrics, dimensions, dates, values)
+            if last_fact_id is not None:
+                writer.manifest['last_fact_id'] = last_fact_id
+
+    def sync(self, upper_id=None, rebuild=False, chunk_size=100_000):
+        """Переносит в хранилище факты, ещё не перенесённые курсором манифеста.
+
+        Курсор тот же, что у агрегатов (``dashboard.fact_cursor``): поздно
+        закоммиченные факты тоже переносятся. ``upper_id`` ограничивает
+        перенос (например, водяным знаком агрегатов, чтобы хранилище
+        содержало те же факты). Факты читаются итератором порциями по
+        ``chunk_size``. Возвращает число перенесённых фактов.
+        """
+        with self.writing(rebuild=rebuild) as writer:
+            facts, last_id, gaps = fact_cursor.advance(
+                writer.manifest['last_fact_id'], writer.manifest.get('gaps', []), upper_id=upper_id)
+            rows = (
+                facts.order_by('metric', 'date')
+                .values_list('metric', 'dimension', 'date', 'value')
+                .iterator(chunk_size=chunk_size)
+            )
+            total = 0
+            while True:
+                frame = pd.DataFrame.from_records(
+                    (row for _, row in zip(range(chunk_size), rows)),
+                    columns=['metric', 'dimension', 'date', 'value'],
+                )
+                if frame.empty:
+                    break
+                writer.add(frame['metric'], frame['dimension'], frame['date'].to_numpy(dtype='datetime64[D]'),
+                           frame['value'])
+                total += len(frame)
+            writer.manifest['last_fact_id'] = last_id
+            writer.manifest['gaps'] = gaps
+        return total
+
+
+def is_enabled():
+    return getattr(settings, 'DASHBOARD_COLUMNAR_STORE', False)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Общее для процесса хранилище в ``DASHBOARD_COLUMNAR_ROOT``."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ColumnarStore(settings.DASHBOARD_COLUMNAR_ROOT)
+    return _store
@@ -0,0 +1,131 @@
+"""Валидаторы условных GET-запросов (ETag / Last-Modified).
+
+Валидаторы считаются до отрисовки страницы и не трогают данные графиков:
+для статических страниц это хэш шаблонов, для дашбордов - ещё версия
+агрегатов (один запрос к ``RollupWatermark``), версия кэша графиков, адрес
+Plotly.js и, если графики берутся из планировщика, ревизия готовых
+артефактов. ETag строится только из содержимого, поэтому одинаков на всех
+серверах и не меняется при повторном деплое того же кода. ``Last-Modified``
+- наибольшее из времени изменения шаблонов и кода и времени обновления
+данных, инвалидации кэша и расчёта артефактов. Если клиент прислал
+совпадающие ``If-None-Match``/``If-Modified-Since``, декоратор
+``django.views.decorators.http.condition`` отвечает 304, не вызывая
+представление.
+"""
+import functools
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from . import chart_cache, precompute
+
+BASE_TEMPLATES = ('base.html',)
+
+# Код графиков меняется только вместе с деплоем, поэтому его версию (хэш
+# исходников пакета) и время изменения достаточно вычислить один раз при
+# импорте. Модули не импортируются: charts загружает plotly (см. views).
+# Тесты на ответы не влияют и в версию не входят.
+_CODE_DIR = os.path.dirname(__file__)
+_CODE_FILES = sorted(
+    name for name in os.listdir(_CODE_DIR) if name.endswith('.py') and not name.startswith('test')
+)
+
+
+def _code_version():
+    digest = hashlib.sha256()
+    for name in _CODE_FILES:
+        with open(os.path.join(_CODE_DIR, name), 'rb') as file:
+            digest.update(name.encode('utf-8') + b'\0' + file.read())
+    return digest.hexdigest()[:16]
+
+
+CODE_VERSION = _code_version()
+CODE_MTIME = max(os.stat(os.path.join(_CODE_DIR, name)).st_mtime_ns for name in _CODE_FILES)
+
+
+@functools.lru_cache(maxsize=64)
+def _file_hash(path, mtime_ns):
+    # mtime в ключе: при изменении файла (runserver, деплой) хэш считается заново
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()[:16]
+
+
+def templates_state(template_name):
+    """``(хэш содержимого, наибольший mtime в нс)`` шаблона страницы и базовых шаблонов."""
+    digests, mtimes = [], []
+    for name in BASE_TEMPLATES + (template_name,):
+        path = get_template(name).origin.name
+        mtime_ns = os.stat(path).st_mtime_ns
+        digests.append(_file_hash(path, mtime_ns))
+        mtimes.append(mtime_ns)
+    return hashlib.sha256(''.join(digests).encode('ascii')).hexdigest()[:16], max(mtimes)
+
+
+def _from_ns(mtime_ns):
+    return datetime.fromtimestamp(mtime_ns / 1e9, tz=timezone.utc)
+
+
+def static_page(template_name):
+    """Пара ``(etag_func, last_modified_func)`` для страницы без данных."""
+    def etag(request, *args, **kwargs):
+        # Ссылка на интерактивные дашборды в меню зависит от настройки
+        interactive = '-i' if getattr(settings, 'DASHBOARD_INTERACTIVE', False) else ''
+        return templates_state(template_name)[0] + interactive
+
+    def last_modified(request, *args, **kwargs):
+        return _from_ns(templates_state(template_name)[1])
+
+    return etag, last_modified
+
+
+def _dashboard_state(request, template_name):
+    # Запоминаем на запросе: etag_func и last_modified_func вызываются оба
+    state = getattr(request, '_dashboard_state', None)
+    if state is None:
+        from . import plotlyjs  # тянет staticfiles; нужен только страницам с графиками
+
+        fact_id, rollups_updated = chart_cache.watermark()
+        templates_hash, templates_mtime = templates_state(template_name)
+        precomputed = precompute.revision() if precompute.is_enabled() else (0, None)
+        modified = max(
+            moment for moment in (
+                _from_ns(max(templates_mtime, CODE_MTIME)), rollups_updated,
+                chart_cache.invalidated_at(), precomputed[1],
+            ) if moment is not None
+        )
+        version = (
+            fact_id, chart_cache.data_version(), templates_hash, CODE_VERSION,
+            getattr(settings, 'DASHBOARD_LAZY_CHARTS', False),
+            getattr(settings, 'DASHBOARD_LIVE_UPDATES', False),
+            getattr(settings, 'DASHBOARD_INTERACTIVE', False),
+            # Страница ссылается на Plotly.js: собственная сборка с хэшем или CDN
+            plotlyjs.get_url(),
+            sorted(request.GET.lists()),
+            precomputed[0],
+        )
+        state = {
+            'etag': hashlib.sha256(repr(version).encode('utf-8')).hexdigest()[:16],
+            'last_modified': modified,
+        }
+        request._dashboard_state = state
+    return state
+
+
+def data_page(template_name):
+    """Пара ``(etag_func, last_modified_func)`` для страниц с данными графиков.
+
+    В ETag входят и параметры запроса: ``?charts=...``, ``?mode=lazy`` или
+    ``?width=...`` дают разные представления одного URL.
+    """
+    def etag(request, *args, **kwargs):
+        # Графики одного дашборда различаются аргументами URL (chart_id)
+        suffix = ''.join(f'-{value}' for value in kwargs.values())
+        return _dashboard_state(request, template_name)['etag'] + suffix
+
+    def last_modified(request, *args, **kwargs):
+        return _dashboard_state(request, template_name)['last_modified']
+
+    return etag, last_modified
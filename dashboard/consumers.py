@@ -0,0 +1,43 @@
+"""WebSocket-потребители Django Channels."""
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from . import charts, live
+
+
+class ChartUpdatesConsumer(AsyncJsonWebsocketConsumer):
+    """Подписка страницы дашборда на обновления графиков.
+
+    Клиент отправляет ``{"subscribe": ["trend", "debt"]}`` (или
+    ``"unsubscribe"``) и получает сообщения производителя (см.
+    ``dashboard.live``) в том виде, в каком они были сериализованы при
+    рассылке. При выключенном ``DASHBOARD_LIVE_UPDATES`` соединение
+    отклоняется, и производитель не запускается.
+    """
+
+    async def connect(self):
+        self.chart_ids = set()
+        if not getattr(settings, 'DASHBOARD_LIVE_UPDATES', False):
+            await self.close()
+            return
+        await self.accept()
+        live.ensure_producer()
+
+    async def disconnect(self, code):
+        for chart_id in self.chart_ids:
+            await self.channel_layer.group_discard(live.group_name(chart_id), self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            return
+        for chart_id in content.get('subscribe') or []:
+            if chart_id in charts.REGISTRY and chart_id not in self.chart_ids:
+                self.chart_ids.add(chart_id)
+                await self.channel_layer.group_add(live.group_name(chart_id), self.channel_name)
+        for chart_id in content.get('unsubscribe') or []:
+            if chart_id in self.chart_ids:
+                self.chart_ids.discard(chart_id)
+                await self.channel_layer.group_discard(live.group_name(chart_id), self.channel_name)
+
+    async def chart_delta(self, event):
+        await self.send(text_data=event['text'])
@@ -0,0 +1,340 @@
+"""Перекрёстная фильтрация графиков дашборда (cross-filter).
+
+Клик по элементу графика (столбец канала, сектор расходов, точка ряда)
+задаёт фильтр для остальных графиков страницы; сам график-источник своим
+фильтром не ограничивается. Чтобы клик не превращался в восемь запросов к
+базе, графики считаются по общему для всех сессий набору фактов в памяти
+(``Dataset``), а сервер возвращает только изменившиеся трассы.
+
+``Dataset`` - колоночное представление ``MetricFact``: коды метрик и
+измерений (категории), дни от эпохи и значения в массивах NumPy,
+отсортированные по (метрика, дата). Строки метрики - непрерывный срез,
+диапазон дат внутри него находится бинарным поиском, фильтр по измерению -
+булева маска через таблицу разрешённых кодов, суммирование - ``bincount``.
+Набор перестраивается, когда меняется версия агрегатов, и содержит те же
+факты, что учтены в них.
+
+Фильтры клика (состояние): ``{имя: {'value': значение, 'chart': источник}}``,
+где имя - фильтр измерения из ``queries.DIMENSION_FILTERS`` или ``period``
+(период ряда, ограничивает диапазон дат). Так как у каждого факта одно
+измерение, фильтр по каналу или статье расходов сужает только графики тех же
+метрик, а фильтр по периоду - все графики с метриками. Графику достаются
+только сужающие его фильтры (``applies``), поэтому остальные графики не
+пересчитываются, а график без фактов остаётся на демонстрационных данных.
+Источником фильтра служит только график, фильтр которого сужает другие
+графики страницы (``is_source``).
+"""
+import calendar
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+from . import chart_cache, queries, rollups
+from .models import MetricFact
+
+PERIOD_FILTER = 'period'
+
+FILTER_NAMES = (PERIOD_FILTER,) + tuple(queries.DIMENSION_FILTERS)
+
+
+def _to_days(dates):
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def _from_days(days):
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]').tolist()
+
+
+class Dataset:
+    """Колоночный набор фактов с выборками в духе ``dashboard.rollups``."""
+
+    def __init__(self, metrics, dimensions, dates, values):
+        metric_codes, metric_names = pd.factorize(np.asarray(metrics, dtype=object), sort=True)
+        dimension_codes, dimension_names = pd.factorize(np.asarray(dimensions, dtype=object), sort=True)
+        days = _to_days(dates)
+        order = np.lexsort((days, metric_codes))
+
+        self.metric_codes = metric_codes[order].astype(np.int32)
+        self.dimension_codes = dimension_codes[order].astype(np.int32)
+        self.days = days[order]
+        self.values = np.asarray(values, dtype=np.float64)[order]
+        self.dimension_names = list(dimension_names)
+        self.dimension_lookup = {name: code for code, name in enumerate(self.dimension_names)}
+        # Индекс категорий: метрика -> непрерывный срез строк
+        bounds = np.searchsorted(self.metric_codes, np.arange(len(metric_names) + 1))
+        self.metric_slices = {
+            name: (int(bounds[code]), int(bounds[code + 1])) for code, name in enumerate(metric_names)
+        }
+        self._buckets = {}
+
+    @classmethod
+    def from_facts(cls, upper_id=None, chunk_size=100_000):
+        """Набор из ``MetricFact`` (с ``id <= upper_id``, если задан)."""
+        facts = MetricFact.objects.all()
+        if upper_id is not None:
+            facts = facts.filter(id__lte=upper_id)
+        rows = facts.order_by().values_list('metric', 'dimension', 'date', 'value')
+        frame = pd.DataFrame.from_records(rows.iterator(chunk_size=chunk_size),
+                                          columns=['metric', 'dimension', 'date', 'value'])
+        return cls(frame['metric'], frame['dimension'], frame['date'].to_numpy(dtype='datetime64[D]'),
+                   frame['value'].to_numpy(dtype=float))
+
+    def __len__(self):
+        return len(self.values)
+
+    def has_facts(self, metrics):
+        """Есть ли в наборе факты хотя бы одной из ``metrics``."""
+        return any(hi > lo for lo, hi in (self.metric_slices.get(metric, (0, 0)) for metric in metrics))
+
+    def buckets(self, granularity):
+        """Начало периода (дни от эпохи) для каждой строки; считается один раз."""
+        buckets = self._buckets.get(granularity)
+        if buckets is None:
+            days = self.days
+            if granularity == 'day':
+                buckets = days
+            elif granularity == 'week':
+                # 1970-01-01 - четверг; неделя начинается с понедельника
+                buckets = days - (days + 3) % 7
+            else:
+                months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+                if granularity == 'quarter':
+                    months = months - months % 3
+                elif granularity == 'year':
+                    months = months - months % 12
+                buckets = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+            self._buckets[granularity] = buckets
+        return buckets
+
+    def _rows(self, metric, query):
+        """Срез строк метрики в диапазоне дат среза и маска фильтров измерений."""
+        lo, hi = self.metric_slices.get(metric, (0, 0))
+        days = self.days[lo:hi]
+        start = int(np.searchsorted(days, _to_days(query.since), 'left')) if query.since else 0
+        end = int(np.searchsorted(days, _to_days(query.until), 'right')) if query.until else hi - lo
+        lo, hi = lo + start, lo + end
+
+        mask = None
+        for name, values in query.filters.items():
+            if metric not in queries.DIMENSION_FILTERS[name]:
+                continue
+            allowed = np.zeros(len(self.dimension_names), dtype=bool)
+            allowed[[self.dimension_lookup[value] for value in values if value in self.dimension_lookup]] = True
+            matches = allowed[self.dimension_codes[lo:hi]]
+            mask = matches if mask is None else mask & matches
+        return lo, hi, mask
+
+    def _select(self, array, lo, hi, mask):
+        array = array[lo:hi]
+        return array if mask is None else array[mask]
+
+    def period_series(self, series, query):
+        """То же, что ``rollups.period_series``, по фактам в памяти."""
+        sums = {}
+        for metric in sorted({metric for metric, _ in series}):
+            lo, hi, mask = self._rows(metric, query)
+            buckets = self._select(self.buckets(query.granularity), lo, hi, mask)
+            codes = self._select(self.dimension_codes, lo, hi, mask)
+            values = self._select(self.values, lo, hi, mask)
+            for key in series:
+                if key[0] != metric or key[1] not in self.dimension_lookup:
+                    continue
+                selected = codes == self.dimension_lookup[key[1]]
+                periods, inverse = np.unique(buckets[selected], return_inverse=True)
+                sums[key] = (periods, np.bincount(inverse, weights=values[selected], minlength=len(periods)))
+
+        all_periods = np.unique(np.concatenate([periods for periods, _ in sums.values()] or [np.empty(0, np.int64)]))
+        result = {'dates': _from_days(all_periods)}
+        for key in series:
+            column = [None] * len(all_periods)
+            if key in sums:
+                periods, totals = sums[key]
+                for index, total in zip(np.searchsorted(all_periods, periods).tolist(), totals.tolist()):
+                    column[index] = total
+            result[tuple(key)] = column
+        return result
+
+    def dimension_totals(self, metric, query):
+        """То же, что ``rollups.dimension_totals``, по фактам в памяти."""
+        lo, hi, mask = self._rows(metric, query)
+        codes = self._select(self.dimension_codes, lo, hi, mask)
+        values = self._select(self.values, lo, hi, mask)
+        totals = np.bincount(codes, weights=values, minlength=len(self.dimension_names))
+        present = np.flatnonzero(np.bincount(codes, minlength=len(self.dimension_names)))
+        rows = [(self.dimension_names[code], total) for code, total in zip(present.tolist(), totals[present].tolist())]
+        return sorted(rows, key=lambda row: (-row[1], row[0]))
+
+
+_dataset = None
+_dataset_version = None
+_dataset_lock = threading.Lock()
+
+
+def get_dataset():
+    """Общий для всех сессий набор фактов текущей версии агрегатов."""
+    global _dataset, _dataset_version
+    # Версия целиком: факты, закоммиченные не по порядку id, учитываются в
+    # агрегатах без сдвига last_fact_id (см. dashboard.fact_cursor)
+    version = chart_cache.watermark()
+    if _dataset_version != version:
+        with _dataset_lock:
+            if _dataset_version != version:
+                _dataset = Dataset.from_facts(upper_id=version[0])
+                _dataset_version = version
+    return _dataset
+
+
+class CrossFilterQuery(queries.DashboardQuery):
+    """Срез, выборки которого считаются по ``Dataset``, а не в базе."""
+
+    def __init__(self, dataset, **kwargs):
+        super().__init__(**kwargs)
+        self.dataset = dataset
+
+
+def period_end(start, granularity):
+    """Последний день периода, начинающегося с ``start``."""
+    if granularity == 'day':
+        return start
+    if granularity == 'week':
+        return start + datetime.timedelta(days=6)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    month = start.month + months - 1
+    year, month = start.year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+
+def applies(name, spec):
+    """Сужает ли фильтр клика ``name`` данные графика ``spec``."""
+    if not spec.metrics:
+        return False
+    return name == PERIOD_FILTER or bool(set(queries.DIMENSION_FILTERS[name]) & set(spec.metrics))
+
+
+def is_source(spec, specs):
+    """Можно ли фильтровать кликом по ``spec``: его фильтр сужает другой график из ``specs``."""
+    if spec.cross_filter is None:
+        return False
+    name = spec.cross_filter[0]
+    return any(other.chart_id != spec.chart_id and applies(name, other) for other in specs)
+
+
+def effective_query(base, state, dataset, spec):
+    """Срез для графика ``spec``: базовый срез и чужие фильтры клика, которые его сужают.
+
+    Графику без фактов в наборе (демонстрационные данные пустой базы)
+    фильтры клика не применяются.
+    """
+    since, until = base.since, base.until
+    filters = dict(base.filters)
+    if not dataset.has_facts(spec.metrics):
+        state = {}
+    for name, selection in state.items():
+        if selection['chart'] == spec.chart_id or not applies(name, spec):
+            continue
+        if name == PERIOD_FILTER:
+            start = datetime.date.fromisoformat(selection['value'])
+            end = period_end(start, base.granularity)
+            since = max(since, start) if since else start
+            until = min(until, end) if until else end
+        else:
+            filters[name] = [selection['value']]
+    return CrossFilterQuery(dataset, since=since, until=until, granularity=base.granularity, filters=filters)
+
+
+def parse_state(raw):
+    """Проверенное состояние фильтров из JSON-объекта клиента."""
+    if not isinstance(raw, dict):
+        raise ValueError('Состояние фильтров должно быть объектом')
+    state = {}
+    for name, selection in raw.items():
+        if name not in FILTER_NAMES or not isinstance(selection, dict):
+            raise ValueError(f'Неизвестный фильтр: {name}')
+        value, chart_id = selection.get('value'), selection.get('chart')
+        if not isinstance(value, str) or not isinstance(chart_id, str):
+            raise ValueError(f'Некорректный фильтр: {name}')
+        if name == PERIOD_FILTER:
+            datetime.date.fromisoformat(value)
+        state[name] = {'value': value, 'chart': chart_id}
+    return state
+
+
+def _plain(value):
+    # JSON-совместимые значения: массивы - списки, даты - ISO-строки
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+
+def chart_traces(spec, query):
+    """Атрибуты трасс графика для среза (без построения фигуры Plotly)."""
+    data = spec.prepare_data(spec.get_data(query))
+    return [{key: _plain(value) for key, value in trace.items()} for trace in spec.traces(data)]
+
+
+def _normalize(name, value):
+    # Даты демонстрационных рядов - Timestamp с временем, а Plotly присылает
+    # дату оси как '2024-03-01' или '2024-03-01 00:00'
+    return value[:10] if name == PERIOD_FILTER else value
+
+
+def point_values(spec, query):
+    """Значения фильтра, которые можно выбрать кликом по графику ``spec``.
+
+    Берутся из полных данных среза ``query``, а не из прореженных или
+    обрезанных под отображение: клиент присылает значение, а не номер точки.
+    """
+    name, key = spec.cross_filter[:2]
+    return [_normalize(name, _plain(value)) for value in spec.get_data(query)[key]]
+
+
+def select(spec, base, state, dataset, value):
+    """Новое состояние после клика по элементу графика ``spec`` со значением ``value``.
+
+    ``value`` - значение из точки события ``plotly_click`` (см.
+    ``ChartSpec.cross_filter``); если его нет среди значений графика в
+    текущем срезе, ``ValueError``. Повторный клик по выбранному элементу
+    снимает фильтр.
+    """
+    name = spec.cross_filter[0]
+    value = _normalize(name, value)
+    if value not in point_values(spec, effective_query(base, state, dataset, spec)):
+        raise ValueError(f'Значения {value!r} нет на графике {spec.chart_id}')
+    state = dict(state)
+    if state.get(name) == {'value': value, 'chart': spec.chart_id}:
+        del state[name]
+    else:
+        state[name] = {'value': value, 'chart': spec.chart_id}
+    return state
+
+
+def changes(specs, base, previous, current, dataset):
+    """Изменившиеся трассы: ``{chart_id: [{'trace': i, 'update': {...}}]}``.
+
+    Графики, срез которых не изменился (изменились только не сужающие их
+    фильтры), не пересчитываются; для остальных возвращаются только трассы и
+    атрибуты с новыми значениями.
+    """
+    result = {}
+    for spec in specs:
+        if spec.traces is None:
+            continue
+        old_query = effective_query(base, previous, dataset, spec)
+        new_query = effective_query(base, current, dataset, spec)
+        if old_query == new_query:
+            continue
+        old_traces, new_traces = chart_traces(spec, old_query), chart_traces(spec, new_query)
+        ops = []
+        for index, (old, new) in enumerate(zip(old_traces, new_traces)):
+            update = {key: value for key, value in new.items() if old.get(key) != value}
+            if update:
+                ops.append({'trace': index, 'update': update})
+        if ops:
+            result[spec.chart_id] = ops
+    return result
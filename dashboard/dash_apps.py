@@ -0,0 +1,369 @@
+"""Интерактивная версия дашбордов на django-plotly-dash.
+
+Приложение ``DjangoDash`` с именем ``APP_NAME`` выводит графики реестра
+``dashboard.charts`` с элементами управления: диапазон месяцев (слайдер),
+гранулярность и фильтры по измерениям (``queries.DIMENSION_FILTERS``).
+Страница и django-plotly-dash подключаются только при
+``DASHBOARD_INTERACTIVE = True``: модели и URL django-plotly-dash
+импортируют dash и plotly уже при ``django.setup()``. Само приложение
+создаётся при первом обращении (``load_app`` - загрузчик
+``PLOTLY_DASH['stateless_loader']``).
+
+- У каждого графика свой колбэк, и его входы - только те элементы, от
+  которых зависят данные графика: фильтр по каналу пересчитывает лишь
+  графики метрик с каналами, остальные фигуры в ответ не попадают.
+- Фигуры кэшируются в процессе (``CallbackCache``: LRU на
+  ``DASHBOARD_DASH_CACHE_SIZE`` записей со временем жизни
+  ``DASHBOARD_DASH_CACHE_TTL`` секунд) по графику, нормализованному срезу и
+  версии данных; одинаковые запросы, пришедшие во время расчёта, ждут один
+  и тот же расчёт.
+- Расчёт выполняется в пуле потоков (``DASHBOARD_DASH_WORKERS``): колбэк
+  ждёт не дольше ``DASHBOARD_DASH_CALLBACK_TIMEOUT`` секунд, а затем
+  показывает заглушку и включает ``dcc.Interval`` графика. Интервал раз в
+  ``RETRY_INTERVAL_MS`` повторяет колбэк, пока результат, досчитанный в
+  пуле, не окажется в кэше. Лайаут фигур не строит: первые фигуры приходят
+  из тех же колбэков.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import calendar
+import contextvars
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max, Min
+
+from . import chart_cache, charts, queries, rollups
+from .models import MetricRollup
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = 'dashboards'
+
+# Как часто график с незавершённым расчётом повторяет запрос фигуры
+RETRY_INTERVAL_MS = 1000
+
+GRANULARITY_LABELS = {
+    'day': 'По дням',
+    'week': 'По неделям',
+    'month': 'По месяцам',
+    'quarter': 'По кварталам',
+    'year': 'По годам',
+}
+
+FILTER_LABELS = {
+    'category': 'Статья расходов',
+    'stage': 'Этап воронки',
+    'direction': 'Направление',
+    'channel': 'Канал',
+    'bucket': 'Срок просрочки',
+}
+
+
+class CallbackCache:
+    """LRU-кэш результатов колбэков со временем жизни записей.
+
+    ``submit`` возвращает ``Future``: готовый результат из кэша, уже идущий
+    расчёт с тем же ключом или новое задание в пуле. Ошибки не кэшируются.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()  # ключ -> (момент истечения, результат)
+        self._pending = {}           # ключ -> Future идущего расчёта
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def submit(self, key, compute, executor):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(item[1])
+                return future
+            future = self._pending.get(key)
+            if future is not None:
+                self.hits += 1
+                return future
+            self.misses += 1
+            # Задание выполняется в копии контекста запроса (профиль, см. profiling)
+            future = executor.submit(contextvars.copy_context().run, compute)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._store(key, done))
+        return future
+
+    def _store(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._items[key] = (time.monotonic() + self.ttl, future.result())
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+
+_cache = CallbackCache(
+    maxsize=getattr(settings, 'DASHBOARD_DASH_CACHE_SIZE', 256),
+    ttl=getattr(settings, 'DASHBOARD_DASH_CACHE_TTL', 300),
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'DASHBOARD_DASH_WORKERS', 4),
+                    thread_name_prefix='dash-callback',
+                )
+    return _executor
+
+
+def _build_figure(spec, query):
+    # Поток пула живёт дольше запроса: соединение с базой, открытое в нём,
+    # закрывается по тем же правилам (CONN_MAX_AGE), что и у запросов
+    close_old_connections()
+    try:
+        figure = spec.build_figure(spec.get_data(query)).to_dict()
+    finally:
+        close_old_connections()
+    # Шаблон plotly по умолчанию - десятки килобайт на каждый ответ колбэка;
+    # оформление графика задаёт общий LAYOUT_TEMPLATE, уже вошедший в layout
+    figure['layout'].pop('template', None)
+    return figure
+
+
+def placeholder(text):
+    """Пустая фигура с надписью вместо графика."""
+    return {
+        'data': [],
+        'layout': {
+            'xaxis': {'visible': False},
+            'yaxis': {'visible': False},
+            'annotations': [{
+                'text': text, 'showarrow': False, 'font': {'size': 16, 'color': '#6c757d'},
+                'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 0.5,
+            }],
+        },
+    }
+
+
+def figure(spec, query):
+    """``(фигура, готова ли)`` графика ``spec`` для среза ``query``.
+
+    Если расчёт не уложился в ``DASHBOARD_DASH_CALLBACK_TIMEOUT``, вместо
+    фигуры возвращается заглушка: расчёт продолжается в пуле, и повторный
+    вызов возьмёт результат из кэша. Ошибка расчёта тоже даёт заглушку, но
+    готовую: повторять такой расчёт по таймеру незачем.
+    """
+    key = (spec.chart_id, query.normalized(), chart_cache.data_version())
+    future = _cache.submit(key, lambda: _build_figure(spec, query), _get_executor())
+    try:
+        return future.result(timeout=getattr(settings, 'DASHBOARD_DASH_CALLBACK_TIMEOUT', 1)), True
+    except FutureTimeoutError:
+        return placeholder('Расчёт графика...'), False
+    except Exception:
+        logger.exception('Не удалось построить график %s', spec.chart_id)
+        return placeholder('Не удалось построить график'), True
+
+
+# ---------------------------------------------------------------------------
+# Элементы управления
+# ---------------------------------------------------------------------------
+
+def month_index(date):
+    return date.year * 12 + date.month - 1
+
+
+def month_start(index):
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_end(index):
+    start = month_start(index)
+    return start.replace(day=calendar.monthrange(start.year, start.month)[1])
+
+
+def month_range():
+    """Индексы первого и последнего месяца с агрегатами; ``None`` без данных."""
+    bounds = MetricRollup.objects.filter(period=MetricRollup.PERIOD_MONTH).aggregate(
+        first=Min('period_start'), last=Max('period_start'))
+    if bounds['first'] is None:
+        return None
+    return month_index(bounds['first']), month_index(bounds['last'])
+
+
+def month_marks(first, last):
+    """Подписи слайдера: крайние месяцы и начало каждого года между ними."""
+    marks = {index: str(index // 12) for index in range(first, last + 1) if index % 12 == 0}
+    for index in (first, last):
+        marks[index] = f'{rollups.month_label(month_start(index))} {index // 12}'
+    return marks
+
+
+def filter_options(name):
+    """Значения фильтра - измерения его метрик в агрегатах."""
+    values = {
+        dimension
+        for metric in queries.DIMENSION_FILTERS[name]
+        for dimension, _ in rollups.dimension_totals(metric)
+        if dimension
+    }
+    return sorted(values)
+
+
+def make_query(period, bounds, granularity, filters):
+    """Срез по значениям элементов управления.
+
+    Крайние положения слайдера не ограничивают диапазон, так что срез без
+    изменённых элементов совпадает со срезом страницы по умолчанию (и
+    берётся из тех же кэшей).
+    """
+    since = until = None
+    if period and bounds:
+        lo, hi = period
+        if lo > bounds[0]:
+            since = month_start(lo)
+        if hi < bounds[1]:
+            until = month_end(hi)
+    return queries.DashboardQuery(
+        since=since, until=until,
+        granularity=granularity or queries.DEFAULT_GRANULARITY,
+        filters=filters,
+    )
+
+
+def chart_filters(spec):
+    """Фильтры по измерениям, которые меняют данные графика ``spec``."""
+    return [name for name, metrics in queries.DIMENSION_FILTERS.items() if set(metrics) & set(spec.metrics)]
+
+
+# ---------------------------------------------------------------------------
+# Приложение
+# ---------------------------------------------------------------------------
+
+def _controls():
+    import dash_bootstrap_components as dbc
+    from dash import dcc, html
+
+    bounds = month_range()
+    first, last = bounds or (month_index(datetime.date.today()),) * 2
+    period = dcc.RangeSlider(
+        id='period', min=first, max=last, step=1, value=[first, last],
+        marks=month_marks(first, last), updatemode='mouseup', allowCross=False,
+        disabled=bounds is None,
+    )
+    granularity = dcc.Dropdown(
+        id='granularity', value=queries.DEFAULT_GRANULARITY, clearable=False,
+        options=[{'label': GRANULARITY_LABELS[name], 'value': name} for name in queries.GRANULARITIES],
+    )
+    columns = [
+        dbc.Col([html.Label('Период', className='small text-muted'), period], lg=8),
+        dbc.Col([html.Label('Шаг', className='small text-muted'), granularity], lg=4),
+    ]
+    for name in queries.DIMENSION_FILTERS:
+        columns.append(dbc.Col([
+            html.Label(FILTER_LABELS[name], className='small text-muted'),
+            dcc.Dropdown(id=f'filter-{name}', options=filter_options(name), multi=True, placeholder='Все'),
+        ], md=6, lg=4))
+    return dbc.Row(columns, className='g-3 mb-4')
+
+
+def serve_layout():
+    """Лайаут строится при каждой загрузке страницы: границы и значения
+    элементов управления берутся из текущих агрегатов."""
+    import dash_bootstrap_components as dbc
+    from dash import dcc, html
+
+    cards = []
+    for spec in charts.get_specs():
+        # Фигуру присылает колбэк графика сразу после загрузки страницы
+        graph = dcc.Graph(id=f'chart-{spec.chart_id}', figure=placeholder(''), config={'displaylogo': False})
+        retry = dcc.Interval(id=f'retry-{spec.chart_id}', interval=RETRY_INTERVAL_MS, disabled=True)
+        cards.append(dbc.Col(dbc.Card([
+            dbc.CardHeader(spec.title),
+            dbc.CardBody([dcc.Loading(graph, delay_show=300), retry]),
+        ], className='h-100'), lg=6, className='mb-4'))
+    return html.Div([_controls(), dbc.Row(cards)])
+
+
+def _make_callback(spec, filter_names):
+    # Dash передаёт сначала значения Input (таймер повтора, слайдер, шаг,
+    # фильтры), затем State (границы слайдера). Второй выход выключает таймер,
+    # когда фигура готова.
+    def update(n_intervals, *args):
+        if not spec.metrics:
+            # Графику без метрик элементы управления не нужны
+            query = queries.DEFAULT_QUERY
+        else:
+            period, granularity, *args = args
+            values, (bounds_min, bounds_max) = args[:len(filter_names)], args[len(filter_names):]
+            bounds = (bounds_min, bounds_max) if bounds_min is not None else None
+            query = make_query(period, bounds, granularity, dict(zip(filter_names, values)))
+        return figure(spec, query)
+    update.__name__ = f'update_{spec.chart_id}'
+    return update
+
+
+def create_app():
+    import dash_bootstrap_components as dbc
+    from dash import Input, Output, State
+    from django_plotly_dash import DjangoDash
+
+    app = DjangoDash(APP_NAME, external_stylesheets=[dbc.themes.BOOTSTRAP])
+    app.layout = serve_layout
+    for spec in charts.get_specs():
+        inputs = [Input(f'retry-{spec.chart_id}', 'n_intervals')]
+        states = []
+        filter_names = []
+        if spec.metrics:
+            filter_names = chart_filters(spec)
+            inputs += [Input('period', 'value'), Input('granularity', 'value')]
+            inputs += [Input(f'filter-{name}', 'value') for name in filter_names]
+            states = [State('period', 'min'), State('period', 'max')]
+        app.callback(
+            [Output(f'chart-{spec.chart_id}', 'figure'), Output(f'retry-{spec.chart_id}', 'disabled')],
+            inputs, states,
+        )(_make_callback(spec, filter_names))
+    return app
+
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def get_app():
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
+
+def load_app(name):
+    """Загрузчик приложений для ``PLOTLY_DASH['stateless_loader']``."""
+    if name == APP_NAME:
+        return get_app()
+    return None
@@ -0,0 +1,107 @@
+"""Прореживание временных рядов перед отправкой в Plotly.
+
+Функции возвращают индексы точек, которые нужно оставить, поэтому одну
+выборку можно применить сразу к нескольким рядам с общей осью X (например,
+к слоям stacked area). Целевое число точек задаётся шириной графика в
+пикселях: рисовать больше точек, чем пикселей, нет смысла.
+
+- ``lttb`` - Largest-Triangle-Three-Buckets: сохраняет визуальную форму ряда;
+- ``minmax`` - минимум и максимум в каждой корзине: сохраняет выбросы.
+"""
+import numpy as np
+import pandas as pd
+
+METHODS = ('lttb', 'minmax')
+
+
+def to_numeric_x(x):
+    """Ось X в виде float64: даты переводятся в наносекунды от эпохи."""
+    values = np.asarray(x)
+    if values.dtype.kind in 'iuf':
+        return values.astype(float)
+    return pd.to_datetime(values).asi8.astype(float)
+
+
+def _clean(y):
+    return np.nan_to_num(np.asarray(y, dtype=float))
+
+
+def lttb(x, y, n_out):
+    """Индексы точек, выбранных алгоритмом Largest-Triangle-Three-Buckets."""
+    x = np.asarray(x, dtype=float)
+    y = _clean(y)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Первая и последняя точки фиксированы, остальные делятся на n_out - 2 корзины
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, n_buckets):
+    """Индексы минимума и максимума в каждой из ``n_buckets`` корзин."""
+    y = _clean(y)
+    n = len(y)
+    if 2 * n_buckets >= n or n_buckets < 1:
+        return np.arange(n)
+
+    bounds = np.arange(n_buckets + 1) * n // n_buckets
+    counts = np.diff(bounds)
+    bucket = np.repeat(np.arange(n_buckets), counts)
+    picks = [[0, n - 1]]
+    for reduce in (np.minimum, np.maximum):
+        extremes = np.repeat(reduce.reduceat(y, bounds[:-1]), counts)
+        matches = np.flatnonzero(y == extremes)
+        # Первое совпадение в каждой корзине
+        _, first = np.unique(bucket[matches], return_index=True)
+        picks.append(matches[first])
+    return np.unique(np.concatenate(picks))
+
+
+def select(x, ys, n_points, method='lttb'):
+    """Общая выборка индексов для нескольких рядов с одной осью X.
+
+    Бюджет точек делится между рядами, а выбранные для каждого ряда индексы
+    объединяются, чтобы ряды остались выровненными по X.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Неизвестный метод прореживания: {method}')
+    x_num = to_numeric_x(x)
+    if len(x_num) <= n_points:
+        return np.arange(len(x_num))
+    per_series = max(n_points // max(len(ys), 1), 3)
+    if method == 'minmax':
+        # Две точки на корзину и ещё две - крайние точки ряда
+        picks = [minmax(x_num, y, max((per_series - 2) // 2, 1)) for y in ys]
+    else:
+        picks = [lttb(x_num, y, per_series) for y in ys]
+    return np.unique(np.concatenate(picks))
+
+
+def time_range(x, start=None, end=None):
+    """Срез ``[lo, hi)`` отсортированной оси X по границам диапазона."""
+    if start is None and end is None:
+        return 0, len(x)
+    x_num = to_numeric_x(x)
+    lo = 0 if start is None else int(np.searchsorted(x_num, to_numeric_x([start])[0], side='left'))
+    hi = len(x_num) if end is None else int(np.searchsorted(x_num, to_numeric_x([end])[0], side='right'))
+    return lo, hi
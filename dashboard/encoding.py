@@ -0,0 +1,140 @@
+"""Компактная бинарная сериализация фигур Plotly.
+
+Обычный ``fig.to_json()`` пишет каждый числовой массив текстом - по одному
+числу с плавающей точкой на элемент. ``figure_to_json(fig, binary=True)``
+вместо этого отдаёт числовые массивы трасс как typed arrays plotly.js
+(``{"dtype": "f8", "bdata": "<base64>"}``, поддерживаются с plotly.js 2.28):
+байты берутся напрямую из буфера NumPy, без поэлементного форматирования.
+Даты переводятся в миллисекунды от эпохи, а соответствующая ось получает
+``type: 'date'``.
+"""
+import base64
+import datetime
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+# Массивы короче этого порога остаются текстом: для нескольких чисел base64
+# получается длиннее JSON-списка.
+MIN_BINARY_LENGTH = 64
+
+ARRAY_KEYS = ('x', 'y', 'z', 'values')
+
+TYPED_ARRAY_DTYPES = {
+    'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2',
+    'int32': 'i4', 'uint32': 'u4', 'float32': 'f4', 'float64': 'f8',
+}
+
+
+def typed_array(values):
+    """Спецификация typed array plotly.js для одномерного массива NumPy."""
+    values = np.ascontiguousarray(values)
+    if values.dtype.byteorder == '>':
+        values = values.astype(values.dtype.newbyteorder('<'))
+    return {
+        'dtype': TYPED_ARRAY_DTYPES[values.dtype.name],
+        'bdata': base64.b64encode(memoryview(values)).decode('ascii'),
+    }
+
+
+def from_typed_array(spec):
+    """Обратное преобразование: список значений из спецификации typed array."""
+    dtype = np.dtype(spec['dtype']).newbyteorder('<')
+    values = np.frombuffer(base64.b64decode(spec['bdata']), dtype=dtype)
+    if 'shape' in spec:
+        values = values.reshape([int(size) for size in str(spec['shape']).split(',')])
+    return values.tolist()
+
+
+def _is_date_like(value):
+    # Строки не считаются датами: подписи вроде '1-30' pandas распознал бы как дату
+    return isinstance(value, (datetime.date, np.datetime64))
+
+
+def _to_array(values):
+    """Числовой массив для кодирования или ``None``, если данные не числовые.
+
+    Второе значение - признак того, что массив получен из дат.
+    """
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == 'M':
+            millis = values.astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+            millis[np.isnat(values)] = np.nan
+            return millis, True
+        if values.dtype.name in TYPED_ARRAY_DTYPES:
+            return values, False
+        if values.dtype.kind in 'iu':
+            values = values.astype(np.float64)
+            return values, False
+    if not isinstance(values, (list, tuple, np.ndarray)):
+        return None, False
+    try:
+        return np.asarray(values, dtype=np.float64), False
+    except (TypeError, ValueError):
+        pass
+    first = next((value for value in values if value is not None), None)
+    if not _is_date_like(first):
+        return None, False
+    try:
+        dates = pd.to_datetime(pd.Series(values))
+    except (TypeError, ValueError):
+        return None, False
+    millis = dates.to_numpy(dtype='datetime64[ms]').astype(np.int64).astype(np.float64)
+    millis[dates.isna().to_numpy()] = np.nan
+    return millis, True
+
+
+def _axis_layout_key(axis_ref, letter):
+    # 'x' -> 'xaxis', 'x2' -> 'xaxis2'
+    return f'{letter}axis{axis_ref[1:]}'
+
+
+def encode_traces(fig_dict, min_length=MIN_BINARY_LENGTH):
+    """Копия словаря фигуры с длинными числовыми массивами в виде typed arrays.
+
+    Копируются только словари трасс и осей, которые меняются: сами массивы
+    не дублируются.
+    """
+    layout = dict(fig_dict.get('layout', {}))
+    data = []
+    for source in fig_dict.get('data', []):
+        trace = dict(source)
+        for key in ARRAY_KEYS:
+            values = trace.get(key)
+            if values is None or isinstance(values, dict) or len(values) < min_length:
+                continue
+            array, from_dates = _to_array(values)
+            if array is None:
+                continue
+            trace[key] = typed_array(array)
+            if from_dates and key in ('x', 'y'):
+                axis = _axis_layout_key(trace.get(f'{key}axis', key), key)
+                layout[axis] = dict(layout.get(axis, {}), type='date')
+        data.append(trace)
+    return {'data': data, 'layout': layout}
+
+
+def figure_to_json(fig, binary=False, min_length=MIN_BINARY_LENGTH):
+    """JSON фигуры; при ``binary=True`` числовые массивы кодируются в base64."""
+    if not binary:
+        return fig.to_json()
+    return pio.to_json(encode_traces(fig.to_dict(), min_length), validate=False)
+
+
+def as_arrays(data, keys):
+    """Копия ``data`` с рядами ``keys`` в виде массивов NumPy.
+
+    ``fig.to_dict()`` копирует списки Python поэлементно, а массивы NumPy -
+    одним memcpy, поэтому для бинарной сериализации ряды лучше передавать в
+    фигуру массивами. Для текстового JSON так делать нельзя: plotly.py сам
+    закодирует массивы NumPy в base64.
+    """
+    result = dict(data)
+    for key in keys:
+        values = result[key]
+        if isinstance(values, (list, tuple)):
+            array, from_dates = _to_array(values)
+            if array is not None and not from_dates:
+                result[key] = array
+    return result
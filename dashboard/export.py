@@ -0,0 +1,136 @@
+"""Потоковая выгрузка фактов, на которых построены графики.
+
+Строки ``MetricFact`` читаются итератором QuerySet порциями по
+``DASHBOARD_EXPORT_CHUNK_SIZE`` (на PostgreSQL - серверным курсором) и сразу
+кодируются в CSV или Parquet: каждая порция превращается в байты и
+отдаётся ``StreamingHttpResponse`` до чтения следующей. В памяти процесса
+одновременно находится не больше одной порции, сколько бы строк ни
+выгружалось.
+
+Parquet пишется группами строк по одной на порцию; для него нужен пакет
+``pyarrow`` (необязательная зависимость).
+"""
+import csv
+import io
+import itertools
+
+from django.conf import settings
+
+from .models import MetricFact
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow - необязательная зависимость
+    pyarrow = None
+
+COLUMNS = ('metric', 'dimension', 'date', 'value')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def formats():
+    """Форматы, доступные в текущем окружении."""
+    return [fmt for fmt in CONTENT_TYPES if fmt != 'parquet' or pyarrow is not None]
+
+
+def chunk_size():
+    return getattr(settings, 'DASHBOARD_EXPORT_CHUNK_SIZE', 5000)
+
+
+def fact_rows(metrics, query, size=None):
+    """Кортежи ``COLUMNS`` фактов ``metrics`` в срезе ``query``."""
+    facts = query.filter_facts(MetricFact.objects.order_by('metric', 'date'), metrics)
+    return facts.values_list(*COLUMNS).iterator(chunk_size=size or chunk_size())
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def stream_csv(rows, size=None):
+    """Байты CSV с заголовком: по одному куску на порцию строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode('utf-8')
+    for batch in batches(rows, size or chunk_size()):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink:
+    """Файл для ``ParquetWriter``, который накапливает байты до ``take()``."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _schema():
+    return pyarrow.schema([
+        ('metric', pyarrow.string()),
+        ('dimension', pyarrow.string()),
+        ('date', pyarrow.date32()),
+        ('value', pyarrow.float64()),
+    ])
+
+
+def stream_parquet(rows, size=None):
+    """Байты файла Parquet: группа строк на порцию, в конце - футер."""
+    if pyarrow is None:
+        raise RuntimeError('Для выгрузки в Parquet нужен пакет pyarrow')
+    schema = _schema()
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    try:
+        for batch in batches(rows, size or chunk_size()):
+            columns = [list(column) for column in zip(*batch)]
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+STREAMS = {
+    'csv': stream_csv,
+    'parquet': stream_parquet,
+}
+
+
+def stream(fmt, specs, query, size=None):
+    """Генератор байтов выгрузки фактов графиков ``specs`` в формате ``fmt``."""
+    metrics = sorted({metric for spec in specs for metric in spec.metrics})
+    return STREAMS[fmt](fact_rows(metrics, query, size), size)
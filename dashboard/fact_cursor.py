@@ -0,0 +1,99 @@
+"""Курсор инкрементальной обработки фактов ``MetricFact``.
+
+Новые факты ищутся по ``id`` больше последнего обработанного. Но ``id``
+выдаётся при вставке, а видимой строка становится при коммите: на
+PostgreSQL при параллельных вставках транзакция с меньшим ``id`` может
+закоммититься позже транзакции с большим, и курсор ``id > last_id``
+пропустил бы её факты навсегда.
+
+Поэтому курсор, кроме ``last_id``, помнит пропуски - диапазоны ``id`` не
+больше ``last_id``, строк которых не было видно при обработке. На следующем
+проходе факты, появившиеся в пропусках, попадают в порцию ровно один раз
+(диапазон сразу сужается). Пропуски старше ``DASHBOARD_FACT_GAP_TIMEOUT``
+секунд забываются: это ``id`` откатившихся транзакций и значения
+последовательности, которые так и не были использованы.
+
+Состояние курсора - ``(last_id, gaps)``, где ``gaps`` - JSON-совместимый
+список ``[первый id, последний id, время обнаружения]``; его сохраняют вместе
+с результатом обработки порции.
+"""
+import bisect
+import functools
+import operator
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from .models import MetricFact
+
+# Не больше стольких диапазонов пропусков: самые старые забываются первыми
+MAX_GAPS = 1000
+
+
+def gap_timeout():
+    return getattr(settings, 'DASHBOARD_FACT_GAP_TIMEOUT', 3600)
+
+
+def _ranges_q(ranges):
+    return functools.reduce(operator.or_, (Q(id__gte=lo, id__lte=hi) for lo, hi in ranges))
+
+
+def missing_ranges(ids, lo, hi):
+    """Диапазоны ``id`` из ``(lo, hi]``, которых нет в возрастающей последовательности ``ids``."""
+    ranges = []
+    expected = lo + 1
+    for fact_id in ids:
+        if fact_id > expected:
+            ranges.append((expected, fact_id - 1))
+        expected = fact_id + 1
+    if expected <= hi:
+        ranges.append((expected, hi))
+    return ranges
+
+
+def advance(last_id, gaps, upper_id=None, now=None):
+    """Следующая порция необработанных фактов после курсора ``(last_id, gaps)``.
+
+    Возвращает ``(facts, last_id, gaps)``: QuerySet порции и новое состояние
+    курсора. ``upper_id`` ограничивает новые факты сверху. Строки, которые
+    станут видны между запросами, в порцию не попадают, а остаются в
+    пропусках до следующего прохода.
+    """
+    now = time.time() if now is None else now
+    old_gaps = [gap for gap in gaps if now - gap[2] < gap_timeout()]
+    selected = []
+    gaps = []
+
+    if old_gaps:
+        old_q = _ranges_q((lo, hi) for lo, hi, _ in old_gaps)
+        found = list(MetricFact.objects.filter(old_q).order_by('id').values_list('id', flat=True))
+        if found:
+            for lo, hi, seen_at in old_gaps:
+                within = found[bisect.bisect_left(found, lo):bisect.bisect_right(found, hi)]
+                gaps += [[start, end, seen_at] for start, end in missing_ranges(within, lo - 1, hi)]
+            late_q = old_q & ~_ranges_q((lo, hi) for lo, hi, _ in gaps) if gaps else old_q
+            selected.append(late_q)
+        else:
+            gaps = [list(gap) for gap in old_gaps]
+
+    new_facts = MetricFact.objects.filter(id__gt=last_id)
+    if upper_id is not None:
+        new_facts = new_facts.filter(id__lte=upper_id)
+    summary = new_facts.aggregate(upper=Max('id'), total=Count('id'))
+    if summary['upper'] is not None:
+        upper = summary['upper']
+        new_q = Q(id__gt=last_id, id__lte=upper)
+        if summary['total'] < upper - last_id:
+            # Видны не все id диапазона: запоминаем пропуски
+            ids = new_facts.filter(id__lte=upper).order_by('id').values_list('id', flat=True)
+            missing = missing_ranges(ids.iterator(chunk_size=100_000), last_id, upper)
+            if missing:
+                new_q &= ~_ranges_q(missing)
+                gaps += [[lo, hi, now] for lo, hi in missing]
+        selected.append(new_q)
+        last_id = upper
+
+    gaps = sorted(gaps, key=operator.itemgetter(2))[-MAX_GAPS:]
+    facts = MetricFact.objects.filter(functools.reduce(operator.or_, selected)) if selected else MetricFact.objects.none()
+    return facts, last_id, gaps
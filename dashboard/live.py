@@ -0,0 +1,190 @@
+"""Живое обновление графиков дашборда через WebSocket (Django Channels).
+
+Страница подписывается на свои графики (``consumers.ChartUpdatesConsumer``),
+а изменения данных рассылает один общий производитель на процесс - не по
+одному на клиента. Производитель периодически проверяет версию агрегатов
+(``chart_cache.watermark``) и, если она изменилась, перестраивает фигуры,
+сравнивает их с предыдущим снимком и отправляет в группу графика небольшую
+дельту:
+
+- ``extend`` - к рядам трассы дописаны точки (``Plotly.extendTraces``);
+- ``restyle`` - изменились значения или свойства трассы (``Plotly.restyle``);
+- ``relayout`` - изменился макет (``Plotly.relayout``);
+- ``react`` - изменился состав трасс, отправляется фигура целиком.
+
+Сообщение сериализуется один раз и уходит в группу как готовый текст, так
+что тысяча открытых дашбордов стоит одного построения фигур на обновление.
+В сообщении есть ``base`` - версия данных, к которой применима дельта: если
+страница отрисована с другой версией, клиент перезапрашивает фигуру целиком.
+
+При ``InMemoryChannelLayer`` производитель запускается внутри ASGI-процесса
+при первой подписке; для общего слоя каналов (Redis) его можно вынести в
+отдельный процесс командой ``publish_chart_updates``.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections
+from plotly.utils import PlotlyJSONEncoder
+
+from . import chart_cache, charts, encoding
+
+logger = logging.getLogger(__name__)
+
+GROUP_PREFIX = 'dashboard-chart.'
+
+
+def group_name(chart_id):
+    return f'{GROUP_PREFIX}{chart_id}'
+
+
+def get_interval():
+    return getattr(settings, 'DASHBOARD_LIVE_INTERVAL', 5)
+
+
+def current_version():
+    """Версия данных, с которой отрисованы графики: водяной знак агрегатов строкой.
+
+    Время обновления входит в версию, потому что поздно закоммиченные факты
+    меняют агрегаты, не сдвигая id последнего факта (см.
+    ``dashboard.fact_cursor``).
+    """
+    fact_id, updated_at = chart_cache.watermark()
+    return f'{fact_id}.{updated_at.timestamp() if updated_at else 0:.6f}'
+
+
+def _decode(value):
+    # Typed arrays plotly.py раскрываем в списки, чтобы сравнивать значения
+    # и дописывать точки к рядам поэлементно
+    if isinstance(value, dict):
+        if 'bdata' in value and 'dtype' in value:
+            return encoding.from_typed_array(value)
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def snapshot(spec):
+    """Фигура графика в виде JSON-совместимого словаря (как на странице)."""
+    fig = spec.build_figure(spec.get_data())
+    return _decode(json.loads(json.dumps(fig.to_dict(), cls=PlotlyJSONEncoder)))
+
+
+def _trace_ops(index, old, new):
+    changed = [key for key in old.keys() | new.keys() if old.get(key) != new.get(key)]
+    if not changed:
+        return []
+    appended = {}
+    for key in changed:
+        before, after = old.get(key), new.get(key)
+        if not (isinstance(before, list) and isinstance(after, list)
+                and len(after) > len(before) and after[:len(before)] == before):
+            break
+        appended[key] = after[len(before):]
+    else:
+        if len({len(values) for values in appended.values()}) == 1:
+            return [{'op': 'extend', 'trace': index, 'update': appended}]
+    # restyle заменяет значение атрибута целиком; None удаляет атрибут
+    return [{'op': 'restyle', 'trace': index, 'update': {key: new.get(key) for key in changed}}]
+
+
+def diff_figures(old, new):
+    """Список операций, переводящих фигуру ``old`` в ``new``."""
+    if len(old['data']) != len(new['data']):
+        return [{'op': 'react', 'figure': new}]
+    ops = []
+    for index, (old_trace, new_trace) in enumerate(zip(old['data'], new['data'])):
+        ops.extend(_trace_ops(index, old_trace, new_trace))
+    old_layout, new_layout = old.get('layout', {}), new.get('layout', {})
+    layout = {key: new_layout.get(key) for key in old_layout.keys() | new_layout.keys()
+              if old_layout.get(key) != new_layout.get(key)}
+    if layout:
+        ops.append({'op': 'relayout', 'update': layout})
+    return ops
+
+
+class ChartPublisher:
+    """Снимки фигур и расчёт дельт для набора графиков.
+
+    Методы синхронные (обращаются к базе); из асинхронного кода их нужно
+    вызывать через ``sync_to_async``.
+    """
+
+    def __init__(self, chart_ids=None):
+        self.specs = charts.get_specs(chart_ids)
+        self.version = None
+        self.snapshots = {}
+
+    def prime(self):
+        self.version = current_version()
+        self.snapshots = {spec.chart_id: snapshot(spec) for spec in self.specs}
+
+    def poll(self):
+        """Список ``(chart_id, text)`` сообщений; пустой, если данные не менялись."""
+        version = current_version()
+        if self.version is None:
+            self.prime()
+            return []
+        if version == self.version:
+            return []
+        messages = []
+        for spec in self.specs:
+            figure = snapshot(spec)
+            ops = diff_figures(self.snapshots[spec.chart_id], figure)
+            self.snapshots[spec.chart_id] = figure
+            if ops:
+                payload = {'chart': spec.chart_id, 'base': self.version, 'version': version, 'ops': ops}
+                messages.append((spec.chart_id, json.dumps(payload, ensure_ascii=False)))
+        self.version = version
+        return messages
+
+
+async def publish(publisher, channel_layer):
+    """Один цикл проверки: рассылает дельты, возвращает их число."""
+    # Производитель работает, пока жив процесс: соединение, закрытое базой
+    # или превысившее CONN_MAX_AGE, заменяется перед каждой проверкой
+    await sync_to_async(close_old_connections)()
+    messages = await sync_to_async(publisher.poll)()
+    for chart_id, text in messages:
+        await channel_layer.group_send(group_name(chart_id), {'type': 'chart.delta', 'text': text})
+    return len(messages)
+
+
+async def run_producer(chart_ids=None, interval=None, channel_layer=None):
+    """Бесконечный цикл производителя: проверка данных каждые ``interval`` секунд."""
+    publisher = ChartPublisher(chart_ids)
+    channel_layer = channel_layer or get_channel_layer()
+    interval = interval or get_interval()
+    await sync_to_async(publisher.prime)()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await publish(publisher, channel_layer)
+        except Exception:
+            # Ошибка одного цикла (например, база недоступна) не должна
+            # останавливать рассылку для всех подписчиков
+            logger.exception('Не удалось разослать обновления графиков')
+
+
+_producers = {}
+
+
+def ensure_producer():
+    """Запускает производитель в текущем цикле событий, если он ещё не запущен.
+
+    При ``DASHBOARD_LIVE_PRODUCER = 'command'`` производитель работает
+    отдельным процессом, и здесь ничего не делается.
+    """
+    if getattr(settings, 'DASHBOARD_LIVE_PRODUCER', 'inprocess') != 'inprocess':
+        return None
+    loop = asyncio.get_running_loop()
+    task = _producers.get(loop)
+    if task is None or task.done():
+        task = loop.create_task(run_producer())
+        _producers[loop] = task
+    return task
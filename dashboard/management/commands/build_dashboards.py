@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import prerender
+
+
+class Command(BaseCommand):
+    help = 'Отрисовывает страницы сайта в статические HTML-файлы (с gzip и brotli).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Перерисовать все страницы, даже без изменений.')
+
+    def handle(self, *args, **options):
+        if prerender.brotli is None:
+            self.stderr.write(self.style.WARNING('Пакет Brotli не установлен: .br-файлы не создаются.'))
+        built = prerender.build(force=options['force'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перерисовано страниц: {len(built)} -> {prerender.get_root()}'
+        ))
+        if built:
+            self.stdout.write('WhiteNoise читает список файлов при старте: перезапустите воркеры.')
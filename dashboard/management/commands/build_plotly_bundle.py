@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import charts, plotlyjs
+
+
+class Command(BaseCommand):
+    help = ('Собирает Plotly.js с типами трасс зарегистрированных графиков в статику приложения '
+            '(запускать перед collectstatic).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source',
+                            help='Готовый файл сборки Plotly.js вместо загрузки с CDN.')
+        parser.add_argument('--offline', action='store_true',
+                            help='Не обращаться к CDN: взять полную сборку из пакета plotly.')
+
+    def handle(self, *args, **options):
+        if plotlyjs.brotli is None:
+            self.stderr.write(self.style.WARNING('Пакет Brotli не установлен: размер в brotli не считается.'))
+        info = plotlyjs.build(charts.get_specs(), source=options['source'], offline=options['offline'],
+                              log=lambda message: self.stderr.write(self.style.WARNING(message)))
+        self.stdout.write(f'Типы трасс: {", ".join(info["types"])}')
+        sizes = f'{info["size"] / 1024:.0f} КБ, gzip {info["gzip"] / 1024:.0f} КБ'
+        if 'brotli' in info:
+            sizes += f', brotli {info["brotli"] / 1024:.0f} КБ'
+        self.stdout.write(self.style.SUCCESS(
+            f'Plotly.js {info["version"]} ({info["bundle"]}): {sizes} -> {info["path"]}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import chart_cache
+
+
+class Command(BaseCommand):
+    help = ('Показывает статистику кэша фрагментов графиков и сбрасывает его '
+            '(нужен общий для процессов бэкенд кэша, например Redis).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invalidate', action='store_true',
+                            help='Сделать устаревшими все закэшированные фрагменты.')
+        parser.add_argument('--reset-stats', action='store_true',
+                            help='Обнулить счётчики попаданий и промахов.')
+
+    def handle(self, *args, **options):
+        if not chart_cache.is_shared():
+            # Команда - отдельный процесс: LocMemCache у неё свой, пустой
+            raise CommandError(
+                f'Кэш "{chart_cache.CACHE_ALIAS}" хранится в памяти процесса '
+                f'({type(chart_cache.get_cache()).__name__}): команда не видит кэш сервера. '
+                'Задайте общий бэкенд (CHART_CACHE_BACKEND, CHART_CACHE_LOCATION). '
+                'После refresh_rollups кэш устаревает сам: его версия включает водяной знак агрегатов.'
+            )
+        if options['invalidate']:
+            version = chart_cache.invalidate()
+            self.stdout.write(self.style.SUCCESS(f'Кэш графиков сброшен, номер инвалидации: {version}'))
+        if options['reset_stats']:
+            chart_cache.reset_stats()
+
+        stats = chart_cache.stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} "
+            f"hit_ratio={stats['hit_ratio']:.2%} version={stats['version']}"
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import charts, precompute
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает данные и фигуры графиков по расписанию и сохраняет готовые '
+            'артефакты, которые отдают представления (DASHBOARD_PRECOMPUTED_CHARTS).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--charts', nargs='+', help='Графики (по умолчанию все).')
+        parser.add_argument('--once', action='store_true',
+                            help='Один проход по графикам, которые пора пересчитать, и выход.')
+        parser.add_argument('--force', action='store_true',
+                            help='В первом проходе пересчитать графики, не дожидаясь их периода.')
+
+    def handle(self, *args, **options):
+        if not precompute.is_enabled():
+            self.stderr.write(self.style.WARNING(
+                'DASHBOARD_PRECOMPUTED_CHARTS выключен: представления не читают артефакты, '
+                'планировщик можно остановить.'))
+        specs = charts.get_specs(options['charts'])
+        try:
+            precompute.run(specs, once=options['once'], force=options['force'], log=self.stdout.write)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,29 @@
+import asyncio
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from dashboard import live
+
+
+class Command(BaseCommand):
+    help = ('Рассылает WebSocket-подписчикам дельты графиков при изменении данных '
+            '(один производитель на все ASGI-процессы, нужен общий слой каналов).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Период проверки данных в секундах (DASHBOARD_LIVE_INTERVAL).')
+        parser.add_argument('--charts', nargs='+', help='Графики (по умолчанию все).')
+
+    def handle(self, *args, **options):
+        channel_layer = get_channel_layer()
+        if type(channel_layer).__name__ == 'InMemoryChannelLayer':
+            self.stderr.write(self.style.WARNING(
+                'Слой каналов в памяти не виден другим процессам: '
+                'настройте CHANNEL_LAYER_BACKEND или используйте DASHBOARD_LIVE_PRODUCER=inprocess.'))
+        interval = options['interval'] or live.get_interval()
+        self.stdout.write(f'Проверка обновлений каждые {interval:g} с')
+        try:
+            asyncio.run(live.run_producer(options['charts'], interval, channel_layer))
+        except KeyboardInterrupt:
+            pass
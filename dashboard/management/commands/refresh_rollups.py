@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import rollups
+
+
+class Command(BaseCommand):
+    help = 'Инкрементально обновляет дневные и месячные агрегаты метрик.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Пересчитать агрегаты с нуля по всем фактам.')
+
+    def handle(self, *args, **options):
+        processed = rollups.refresh(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано фактов: {processed}'))
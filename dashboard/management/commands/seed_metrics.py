@@ -0,0 +1,73 @@
+import datetime
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from dashboard.models import MetricFact
+
+# (метрика, измерение, среднее дневное значение)
+DEMO_SERIES = [
+    ('revenue', '', 1.75),
+    ('profit', '', 0.48),
+    ('plan', '', 0.82),
+    ('actual', '', 0.84),
+    ('overdue_debt', '1-30', 0.045),
+    ('overdue_debt', '31-60', 0.02),
+    ('overdue_debt', '60-90', 0.008),
+    ('expenses', 'ФОТ', 45),
+    ('expenses', 'Закупка сырья', 25),
+    ('expenses', 'Маркетинг', 10),
+    ('expenses', 'Налоги', 8),
+    ('expenses', 'Аренда', 7),
+    ('expenses', 'Прочие', 5),
+    ('funnel', 'Лиды', 33),
+    ('funnel', 'Квалифицированные', 20),
+    ('funnel', 'Предложение', 13),
+    ('funnel', 'Переговоры', 8),
+    ('funnel', 'Сделка', 5),
+    ('income', 'Направление A', 1.7),
+    ('income', 'Направление B', 2.7),
+    ('income', 'Направление C', 1.0),
+    ('income', 'Направление D', 2.2),
+    ('costs', 'Направление A', 0.7),
+    ('costs', 'Направление B', 1.7),
+    ('costs', 'Направление C', 0.8),
+    ('costs', 'Направление D', 1.0),
+    ('channel_leads', 'Партнеры', 10),
+    ('channel_leads', 'Сайт', 40),
+    ('channel_leads', 'Кол-центр', 20),
+    ('channel_leads', 'Соц. сети', 30),
+    ('channel_leads', 'Прямые продажи', 8),
+    ('channel_deals', 'Партнеры', 2.2),
+    ('channel_deals', 'Сайт', 6),
+    ('channel_deals', 'Кол-центр', 3.6),
+    ('channel_deals', 'Соц. сети', 3),
+    ('channel_deals', 'Прямые продажи', 2),
+]
+
+
+class Command(BaseCommand):
+    help = 'Заполняет таблицу фактов демонстрационными дневными данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', default='2024-01-01', help='Первая дата (YYYY-MM-DD).')
+        parser.add_argument('--days', type=int, default=181, help='Число дней истории.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        start = datetime.date.fromisoformat(options['start'])
+        dates = [start + datetime.timedelta(days=i) for i in range(options['days'])]
+        trend = np.linspace(0.9, 1.15, len(dates))
+
+        facts = []
+        for metric, dimension, mean in DEMO_SERIES:
+            values = mean * trend * rng.normal(1.0, 0.1, len(dates)).clip(0.5)
+            for date, value in zip(dates, values.round(4)):
+                facts.append(MetricFact(metric=metric, dimension=dimension, date=date, value=float(value)))
+
+        MetricFact.objects.bulk_create(facts, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено фактов: {len(facts)}. Запустите refresh_rollups для обновления агрегатов.'
+        ))
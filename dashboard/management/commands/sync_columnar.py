@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import columnar, rollups
+
+
+class Command(BaseCommand):
+    help = ('Дописывает в файловое колоночное хранилище факты, уже учтённые в агрегатах '
+            '(DASHBOARD_COLUMNAR_ROOT).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Пересобрать хранилище с нуля по всем фактам.')
+
+    def handle(self, *args, **options):
+        store = columnar.get_store()
+        upper_id, _ = rollups.data_version()
+        processed = store.sync(upper_id=upper_id, rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено фактов: {processed}, последний факт в хранилище: {store.last_fact_id}'))
@@ -0,0 +1,119 @@
+import cProfile
+import os
+import random
+import re
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import chart_cache, profiling
+
+
+class PrerenderedWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, который также отдаёт заранее отрисованные страницы.
+
+    Страницы из ``WHITENOISE_ROOT`` (см. ``dashboard.prerender``) отдаются
+    только на запросы без query string: ``/dashboards/?charts=...`` и другие
+    параметризованные запросы по-прежнему обрабатываются представлениями.
+    Страницу с графиками, собранную по другой версии агрегатов (после
+    ``refresh_rollups``), тоже отрисовывает представление. WhiteNoise
+    запоминает файлы при запуске, поэтому версии берутся из манифеста на тот
+    же момент.
+
+    Страницы отдаются до ``XFrameOptionsMiddleware``, поэтому заголовок
+    ``X-Frame-Options`` добавляется здесь.
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.data_versions = {}
+        if getattr(settings, 'WHITENOISE_ROOT', None):
+            # Модуль сборки нужен только при включённых заранее отрисованных страницах
+            from . import prerender
+
+            self.data_versions = prerender.data_versions()
+        self.x_frame_options = getattr(settings, 'X_FRAME_OPTIONS', 'DENY').upper()
+
+    def __call__(self, request):
+        path = request.path_info
+        if request.META.get('QUERY_STRING') and not path.startswith(self.static_prefix):
+            return self.get_response(request)
+        version = self.data_versions.get(path)
+        if version is not None:
+            from . import prerender
+
+            if version != prerender.data_version():
+                return self.get_response(request)
+        return super().__call__(request)
+
+    def serve(self, static_file, request):
+        response = super().serve(static_file, request)
+        if not request.path_info.startswith(self.static_prefix):
+            response.setdefault('X-Frame-Options', self.x_frame_options)
+        return response
+
+
+class DataVersionMiddleware:
+    """Одна версия данных на запрос (см. ``chart_cache.request_scope``).
+
+    Без неё каждая выборка графика заново читала бы водяной знак агрегатов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with chart_cache.request_scope():
+            return self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """Профилирование запросов (включается ``DASHBOARD_PROFILING = True``).
+
+    Добавляет к ответу заголовок ``Server-Timing`` с этапами запроса (см.
+    ``dashboard.profiling``) и пишет длительности в гистограммы ``/metrics/``.
+    Если задан ``DASHBOARD_PROFILE_DIR``, доля ``DASHBOARD_PROFILE_SAMPLE_RATE``
+    запросов выполняется под cProfile, и дамп сохраняется, когда запрос длился
+    дольше ``DASHBOARD_PROFILE_THRESHOLD_MS``. cProfile видит только поток
+    запроса: построение графиков в пуле потоков отражено лишь в Server-Timing.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DASHBOARD_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.dump_dir = getattr(settings, 'DASHBOARD_PROFILE_DIR', None)
+        self.sample_rate = getattr(settings, 'DASHBOARD_PROFILE_SAMPLE_RATE', 0.1)
+        self.threshold = getattr(settings, 'DASHBOARD_PROFILE_THRESHOLD_MS', 500) / 1e3
+
+    def __call__(self, request):
+        profiler = None
+        if self.dump_dir and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+        profile, token = profiling.start()
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            profiling.finish(token)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = profiling.server_timing(profile, total)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        profiling.observe(view, response.status_code, total, profile)
+        if profiler is not None and total >= self.threshold:
+            self._dump(profiler, request, total)
+        return response
+
+    def _dump(self, profiler, request, total):
+        os.makedirs(self.dump_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        profiler.dump_stats(os.path.join(self.dump_dir, f'{stamp}-{slug}-{total * 1e3:.0f}ms.prof'))
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.23 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=64, verbose_name='Метрика')),
+                ('dimension', models.CharField(blank=True, default='', max_length=128, verbose_name='Измерение')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('value', models.FloatField(verbose_name='Значение')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Факт метрики',
+                'verbose_name_plural': 'Факты метрик',
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=64, verbose_name='Метрика')),
+                ('dimension', models.CharField(blank=True, default='', max_length=128, verbose_name='Измерение')),
+                ('period', models.CharField(choices=[('day', 'День'), ('month', 'Месяц')], max_length=8, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('value_sum', models.FloatField(default=0, verbose_name='Сумма')),
+                ('row_count', models.PositiveIntegerField(default=0, verbose_name='Число фактов')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Агрегат метрики',
+                'verbose_name_plural': 'Агрегаты метрик',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_fact_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='metricrollup',
+            constraint=models.UniqueConstraint(fields=('metric', 'period', 'period_start', 'dimension'), name='rollup_unique_bucket'),
+        ),
+        migrations.AddIndex(
+            model_name='metricfact',
+            index=models.Index(fields=['metric', 'date'], name='fact_metric_date_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chart_id', models.CharField(max_length=64, unique=True, verbose_name='График')),
+                ('html', models.TextField(blank=True, default='', verbose_name='HTML-фрагмент')),
+                ('figure_json', models.TextField(blank=True, default='', verbose_name='JSON фигуры')),
+                ('content_hash', models.CharField(blank=True, default='', max_length=16, verbose_name='Хэш содержимого')),
+                ('data_version', models.BigIntegerField(default=0, verbose_name='Версия агрегатов')),
+                ('revision', models.PositiveIntegerField(default=0, verbose_name='Ревизия')),
+                ('computed_at', models.DateTimeField(blank=True, null=True, verbose_name='Рассчитано')),
+                ('duration_ms', models.FloatField(default=0, verbose_name='Время расчёта, мс')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Пересчёт занят до')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=128, verbose_name='Пересчитывает')),
+            ],
+            options={
+                'verbose_name': 'Готовый график',
+                'verbose_name_plural': 'Готовые графики',
+            },
+        ),
+    ]
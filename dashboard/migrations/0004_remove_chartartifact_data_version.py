@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_rollupwatermark_gaps'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='chartartifact',
+            name='data_version',
+        ),
+    ]
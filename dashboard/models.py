@@ -1,3 +1,96 @@
 from django.db import models
 
-# Create your models here.
+
+class MetricFact(models.Model):
+    """Сырой факт метрики: одно значение за дату в разрезе измерения.
+
+    Таблица только дополняется, поэтому ``refresh_rollups`` обрабатывает
+    новые строки по возрастанию ``id`` (см. ``dashboard.fact_cursor``).
+    """
+    metric = models.CharField('Метрика', max_length=64)
+    dimension = models.CharField('Измерение', max_length=128, blank=True, default='')
+    date = models.DateField('Дата')
+    value = models.FloatField('Значение')
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Факт метрики'
+        verbose_name_plural = 'Факты метрик'
+        indexes = [
+            models.Index(fields=['metric', 'date'], name='fact_metric_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.metric}[{self.dimension}] {self.date}: {self.value}'
+
+
+class MetricRollup(models.Model):
+    """Предагрегированное значение метрики за день или месяц."""
+    PERIOD_DAY = 'day'
+    PERIOD_MONTH = 'month'
+    PERIOD_CHOICES = [
+        (PERIOD_DAY, 'День'),
+        (PERIOD_MONTH, 'Месяц'),
+    ]
+
+    metric = models.CharField('Метрика', max_length=64)
+    dimension = models.CharField('Измерение', max_length=128, blank=True, default='')
+    period = models.CharField('Период', max_length=8, choices=PERIOD_CHOICES)
+    period_start = models.DateField('Начало периода')
+    value_sum = models.FloatField('Сумма', default=0)
+    row_count = models.PositiveIntegerField('Число фактов', default=0)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Агрегат метрики'
+        verbose_name_plural = 'Агрегаты метрик'
+        # Уникальный индекс начинается с (metric, period, period_start) и
+        # одновременно обслуживает выборки графиков по диапазону периодов.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['metric', 'period', 'period_start', 'dimension'],
+                name='rollup_unique_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.metric}[{self.dimension}] {self.period} {self.period_start}: {self.value_sum}'
+
+
+class RollupWatermark(models.Model):
+    """Последний факт, учтённый в агрегатах (для инкрементального обновления)."""
+    name = models.CharField(max_length=64, unique=True)
+    last_fact_id = models.BigIntegerField(default=0)
+    # Диапазоны id до last_fact_id, строки которых ещё не были видны (см.
+    # dashboard.fact_cursor)
+    gaps = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.last_fact_id}'
+
+
+class ChartArtifact(models.Model):
+    """Заранее построенный график (см. ``dashboard.precompute``).
+
+    Одна строка на график: HTML-фрагмент и JSON фигуры для среза по
+    умолчанию, ревизия содержимого и аренда пересчёта
+    (``locked_until``/``locked_by``), чтобы один график не считали
+    одновременно несколько процессов.
+    """
+    chart_id = models.CharField('График', max_length=64, unique=True)
+    html = models.TextField('HTML-фрагмент', blank=True, default='')
+    figure_json = models.TextField('JSON фигуры', blank=True, default='')
+    content_hash = models.CharField('Хэш содержимого', max_length=16, blank=True, default='')
+    revision = models.PositiveIntegerField('Ревизия', default=0)
+    computed_at = models.DateTimeField('Рассчитано', null=True, blank=True)
+    duration_ms = models.FloatField('Время расчёта, мс', default=0)
+    locked_until = models.DateTimeField('Пересчёт занят до', null=True, blank=True)
+    locked_by = models.CharField('Пересчитывает', max_length=128, blank=True, default='')
+
+    class Meta:
+        verbose_name = 'Готовый график'
+        verbose_name_plural = 'Готовые графики'
+
+    def __str__(self):
+        return f'{self.chart_id} r{self.revision} ({self.computed_at})'
@@ -0,0 +1,152 @@
+"""Собственная копия Plotly.js для страницы дашбордов.
+
+``manage.py build_plotly_bundle`` (вызывается в ``build.sh`` перед
+``collectstatic``) кладёт в ``dashboard/static/dashboard/vendor/`` наименьшую
+официальную частичную сборку Plotly.js, в которую входят все типы трасс
+зарегистрированных графиков. Версия сборки - та же, что у plotly.js из
+пакета plotly: под неё plotly.py сериализует фигуры.
+
+Дальше файл обрабатывается как обычная статика: ``collectstatic`` с
+``CompressedManifestStaticFilesStorage`` добавляет к имени хэш содержимого и
+пишет варианты ``.gz`` и ``.br``, а WhiteNoise отдаёт файл с хэшем с
+``Cache-Control: immutable``.
+
+Сборка скачивается с CDN Plotly только при построении. В закрытом контуре
+её можно передать файлом (``--source``); без сети и без файла копируется
+полная сборка из пакета plotly.
+"""
+import functools
+import gzip
+import os
+import urllib.request
+from pathlib import Path
+
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+try:
+    import brotli
+except ImportError:  # Brotli - необязательная зависимость
+    brotli = None
+
+BUNDLE_NAME = 'dashboard/vendor/plotly.min.js'
+
+# Официальные частичные сборки Plotly.js и их типы трасс, от меньшей к
+# большей (https://github.com/plotly/plotly.js/blob/master/dist/README.md)
+PARTIAL_BUNDLES = [
+    ('basic', {'bar', 'pie', 'scatter'}),
+    ('finance', {'bar', 'candlestick', 'funnel', 'funnelarea', 'histogram', 'indicator', 'ohlc', 'pie',
+                 'scatter', 'waterfall'}),
+    ('cartesian', {'bar', 'box', 'contour', 'heatmap', 'histogram', 'histogram2d', 'histogram2dcontour',
+                   'image', 'pie', 'scatter', 'scatterternary', 'violin'}),
+]
+
+CDN_URL = 'https://cdn.plot.ly/plotly-{version}.min.js'
+PARTIAL_CDN_URL = 'https://cdn.plot.ly/plotly-{bundle}-{version}.min.js'
+
+
+def get_output_path():
+    return Path(__file__).resolve().parent / 'static' / BUNDLE_NAME
+
+
+def get_version():
+    """Версия plotly.js, под которую сериализует фигуры установленный plotly."""
+    from plotly.offline import get_plotlyjs_version
+
+    return get_plotlyjs_version()
+
+
+def trace_types(specs):
+    """Типы трасс графиков ``specs``.
+
+    Фигуры строятся по пустому набору данных в памяти (с демонстрационными
+    значениями), поэтому база для этого не нужна.
+    """
+    from . import crossfilter
+
+    query = crossfilter.CrossFilterQuery(crossfilter.Dataset([], [], [], []))
+    return {trace.type for spec in specs for trace in spec.build_figure(spec.get_data(query)).data}
+
+
+def choose_bundle(types):
+    """Наименьшая частичная сборка с трассами ``types``; ``None`` - нужна полная."""
+    for name, bundle_types in PARTIAL_BUNDLES:
+        if types <= bundle_types:
+            return name
+    return None
+
+
+def download(bundle, version, timeout=30):
+    url = PARTIAL_CDN_URL.format(bundle=bundle, version=version)
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        content = response.read()
+    # Первая строка сборки - баннер с именем и версией
+    banner = content[:200].decode('utf-8', 'replace')
+    if f'v{version}' not in banner:
+        raise ValueError(f'{url}: в файле нет баннера plotly.js v{version}')
+    return content
+
+
+def package_bundle():
+    """Полная сборка plotly.min.js из пакета plotly (доступна без сети)."""
+    import plotly
+
+    return (Path(plotly.__file__).resolve().parent / 'package_data' / 'plotly.min.js').read_bytes()
+
+
+def compressed_sizes(content):
+    sizes = {'size': len(content), 'gzip': len(gzip.compress(content, 9))}
+    if brotli is not None:
+        sizes['brotli'] = len(brotli.compress(content))
+    return sizes
+
+
+def build(specs, source=None, offline=False, log=None):
+    """Записывает сборку Plotly.js для графиков ``specs`` в ``get_output_path()``.
+
+    ``source`` - готовый файл сборки (например, скачанный заранее);
+    ``offline`` - не обращаться к CDN. Если частичная сборка недоступна,
+    записывается полная из пакета plotly. Возвращает сведения о сборке и её
+    размерах без сжатия, в gzip и brotli.
+    """
+    types = trace_types(specs)
+    version = get_version()
+    bundle = choose_bundle(types)
+    if source is not None:
+        content = Path(source).read_bytes()
+        bundle = f'файл {source}'
+    elif bundle is None or offline:
+        content = package_bundle()
+        bundle = 'full'
+    else:
+        try:
+            content = download(bundle, version)
+        except (OSError, ValueError) as exc:
+            if log:
+                log(f'Частичная сборка {bundle} недоступна ({exc}), используется полная из пакета plotly')
+            content = package_bundle()
+            bundle = 'full'
+
+    path = get_output_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+    get_url.cache_clear()
+    return dict(bundle=bundle, version=version, types=sorted(types), path=path, **compressed_sizes(content))
+
+
+@functools.lru_cache(maxsize=None)
+def get_url():
+    """Адрес Plotly.js для шаблонов: собственная сборка или, пока её нет, CDN.
+
+    Статика меняется только при деплое (WhiteNoise тоже читает её при
+    запуске), поэтому адрес определяется один раз на процесс.
+    """
+    if finders.find(BUNDLE_NAME):
+        try:
+            return staticfiles_storage.url(BUNDLE_NAME)
+        except ValueError:
+            # Сборка есть, но collectstatic после неё не запускался
+            pass
+    return CDN_URL.format(version=get_version())
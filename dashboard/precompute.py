@@ -0,0 +1,180 @@
+"""Предварительный расчёт графиков вне запросов пользователей.
+
+Планировщик (``manage.py precompute_charts``) периодически пересчитывает
+данные каждого графика и сериализует фигуру, а результат сохраняет в
+``ChartArtifact``. При ``DASHBOARD_PRECOMPUTED_CHARTS = True`` представления
+для среза по умолчанию читают готовый артефакт одним запросом и не
+обращаются к агрегатам, так что время ответа не зависит от стоимости
+выборок.
+
+- Период пересчёта задаётся для графика (``refresh_interval`` в
+  ``register_chart``) или общий - ``DASHBOARD_PRECOMPUTE_INTERVAL``.
+- Проверка «пора ли» и захват пересчёта - один ``UPDATE`` строки артефакта
+  с арендой до ``locked_until``: если планировщиков несколько, график
+  считает ровно один из них, а аренда упавшего процесса истекает через
+  ``DASHBOARD_PRECOMPUTE_LOCK_TIMEOUT`` секунд.
+- ``revision`` растёт при каждом изменении содержимого (входит в ETag).
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Max, Q, Sum
+from django.utils import timezone
+
+from . import chart_cache, queries
+from .models import ChartArtifact
+
+logger = logging.getLogger(__name__)
+
+# Параметры JSON фигуры в артефакте: так график запрашивает ленивая страница
+JSON_OPTIONS = {'encoding': 'binary'}
+
+
+def is_enabled():
+    return getattr(settings, 'DASHBOARD_PRECOMPUTED_CHARTS', False)
+
+
+def get_interval(spec):
+    return spec.refresh_interval or getattr(settings, 'DASHBOARD_PRECOMPUTE_INTERVAL', 60)
+
+
+def _lock_timeout():
+    return timedelta(seconds=getattr(settings, 'DASHBOARD_PRECOMPUTE_LOCK_TIMEOUT', 300))
+
+
+def serves(options):
+    """Подходит ли JSON из артефакта запросу с параметрами отображения ``options``.
+
+    В артефакте ряды прорежены под ширину по умолчанию: для более узкого
+    графика точек лишь больше, чем нужно, а диапазон или другой метод
+    прореживания требуют расчёта.
+    """
+    width = options.get('width', getattr(settings, 'DASHBOARD_CHART_WIDTH', 1200))
+    return (
+        options.get('encoding') == JSON_OPTIONS['encoding']
+        and set(options) <= {'encoding', 'width'}
+        and width <= getattr(settings, 'DASHBOARD_CHART_WIDTH', 1200)
+    )
+
+
+def load(chart_ids, field):
+    """``{chart_id: содержимое}`` готовых артефактов одним запросом.
+
+    ``field`` - ``'html'`` или ``'figure_json'``. Графиков, которые ещё ни
+    разу не считались, в словаре нет.
+    """
+    rows = ChartArtifact.objects.filter(chart_id__in=chart_ids, computed_at__isnull=False)
+    return dict(rows.values_list('chart_id', field))
+
+
+def revision():
+    """``(сумма ревизий, время последнего расчёта)`` артефактов.
+
+    Сумма меняется при любом изменении графика. Время расчёта обновляется и
+    без изменений, поэтому как ``Last-Modified`` оно лишь верхняя оценка.
+    """
+    state = ChartArtifact.objects.aggregate(total=Sum('revision'), computed_at=Max('computed_at'))
+    return state['total'] or 0, state['computed_at']
+
+
+def make_owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def claim(spec, owner, force=False):
+    """Захватывает пересчёт графика ``spec``.
+
+    ``False``, если пересчитывать ещё рано (без ``force``) или график сейчас
+    считает другой процесс.
+    """
+    now = timezone.now()
+    ChartArtifact.objects.get_or_create(chart_id=spec.chart_id)
+    rows = ChartArtifact.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now), chart_id=spec.chart_id,
+    )
+    if not force:
+        due = now - timedelta(seconds=get_interval(spec))
+        rows = rows.filter(Q(computed_at__isnull=True) | Q(computed_at__lte=due))
+    return rows.update(locked_until=now + _lock_timeout(), locked_by=owner) == 1
+
+
+def _release(spec, owner, **fields):
+    return ChartArtifact.objects.filter(chart_id=spec.chart_id, locked_by=owner).update(
+        locked_until=None, locked_by='', **fields)
+
+
+def refresh(spec, owner, force=False):
+    """Пересчитывает график, если пора и он не занят.
+
+    Возвращает ``(изменился ли, время расчёта в мс)`` или ``None``, если
+    пересчёт не выполнялся.
+    """
+    if not claim(spec, owner, force):
+        return None
+    started = time.perf_counter()
+    try:
+        data = spec.get_data(queries.DEFAULT_QUERY)
+        html = spec.render_html(data)
+        figure_json = spec.render_json(data, JSON_OPTIONS)
+    except Exception:
+        _release(spec, owner)
+        raise
+    duration_ms = (time.perf_counter() - started) * 1e3
+
+    content_hash = chart_cache.inputs_hash(html, figure_json)
+    previous = ChartArtifact.objects.filter(chart_id=spec.chart_id).values_list('content_hash', flat=True).first()
+    changed = content_hash != previous
+    updated = _release(
+        spec, owner,
+        html=html, figure_json=figure_json, content_hash=content_hash,
+        revision=F('revision') + int(changed), computed_at=timezone.now(), duration_ms=duration_ms,
+    )
+    if not updated:
+        # Аренда истекла, и график уже пересчитал другой процесс
+        logger.warning('Результат пересчёта графика %s отброшен: аренда истекла', spec.chart_id)
+        return None
+    return changed, duration_ms
+
+
+def seconds_until_due(specs):
+    """Сколько ждать до ближайшего графика, который пора пересчитать."""
+    now = timezone.now()
+    computed = dict(
+        ChartArtifact.objects.filter(chart_id__in=[spec.chart_id for spec in specs])
+        .values_list('chart_id', 'computed_at')
+    )
+    waits = [
+        (computed[spec.chart_id] + timedelta(seconds=get_interval(spec)) - now).total_seconds()
+        if computed.get(spec.chart_id) else 0
+        for spec in specs
+    ]
+    # Не чаще раза в секунду: график может быть занят другим планировщиком
+    return max(min(waits, default=0), 1.)
+
+
+def run(specs, once=False, force=False, log=None):
+    """Цикл планировщика: пересчитывает графики ``specs`` по их периодам."""
+    owner = make_owner()
+    while True:
+        # Процесс живёт долго: соединение, закрытое базой или превысившее
+        # CONN_MAX_AGE, заменяется до первого запроса прохода
+        close_old_connections()
+        for spec in specs:
+            try:
+                result = refresh(spec, owner, force)
+            except Exception:
+                logger.exception('Ошибка пересчёта графика %s', spec.chart_id)
+                continue
+            if result is not None and log:
+                changed, duration_ms = result
+                log(f'{spec.chart_id}: {duration_ms:.0f} мс{"" if changed else ", без изменений"}')
+        if once:
+            return
+        force = False
+        time.sleep(seconds_until_due(specs))
@@ -0,0 +1,150 @@
+"""Предварительная отрисовка страниц в статические файлы.
+
+Страницы ``/``, ``/dashboards/`` и ``/about/`` меняются только вместе с
+данными и шаблонами, поэтому их можно отрисовать заранее и отдавать через
+WhiteNoise, не доходя до Python-представлений. Для каждой страницы пишутся
+``<path>/index.html`` (короткий max-age + ETag) и сжатые варианты ``.gz`` и
+``.br`` (brotli - если установлен пакет Brotli).
+
+Страница перерисовывается, только если изменился её отпечаток входных
+данных: содержимое шаблонов и, для дашбордов, хэш данных всех графиков. Для
+страниц с данными в манифесте запоминается версия данных на момент сборки:
+после ``refresh_rollups`` она перестаёт совпадать, и такую страницу до
+следующей сборки отрисовывает представление (см.
+``PrerenderedWhiteNoiseMiddleware``).
+"""
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.template.loader import get_template
+from django.urls import resolve, reverse
+
+try:
+    import brotli
+except ImportError:  # Brotli - необязательная зависимость
+    brotli = None
+
+BASE_TEMPLATES = ['base.html']
+
+
+def _dashboards_inputs():
+    from . import charts, plotlyjs
+
+    # Адрес Plotly.js с хэшем содержимого меняется вместе со сборкой
+    return [plotlyjs.get_url()] + [spec.cache_inputs(spec.get_data()) for spec in charts.get_specs()]
+
+
+def data_version():
+    """Версия агрегатов, по которым отрисованы графики страницы (строкой для манифеста)."""
+    from . import chart_cache
+
+    fact_id, updated_at = chart_cache.watermark()
+    return f'{fact_id}.{updated_at.isoformat() if updated_at else ""}'
+
+
+# (имя URL, шаблон страницы, функция дополнительных входных данных, есть ли
+# на странице данные графиков)
+PAGES = [
+    ('dashboard:home', 'dashboard/index.html', None, False),
+    ('dashboard:dashboards', 'dashboard/dashboards.html', _dashboards_inputs, True),
+    ('dashboard:about', 'dashboard/about.html', None, False),
+]
+
+
+def get_root():
+    return Path(settings.DASHBOARD_PRERENDER_ROOT)
+
+
+def get_manifest_path():
+    return Path(settings.DASHBOARD_PRERENDER_MANIFEST)
+
+
+def data_versions():
+    """``{путь URL: версия данных}`` собранных страниц с графиками."""
+    path = get_manifest_path()
+    manifest = json.loads(path.read_text()) if path.exists() else {}
+    return {url: entry['data_version'] for url, entry in manifest.items() if entry.get('data_version')}
+
+
+def _template_source(name):
+    return Path(get_template(name).origin.name).read_bytes()
+
+
+def page_fingerprint(template_name, extra_inputs=None):
+    """Отпечаток входных данных страницы без её отрисовки."""
+    from . import chart_cache
+
+    digest = hashlib.sha256()
+    for name in BASE_TEMPLATES + [template_name]:
+        digest.update(_template_source(name))
+    if extra_inputs is not None:
+        digest.update(chart_cache.inputs_hash(extra_inputs()).encode('ascii'))
+    return digest.hexdigest()[:16]
+
+
+def render_page(url):
+    """Отрисовывает страницу так же, как на обычный GET-запрос."""
+    from django.test import RequestFactory  # нужен только при сборке страниц
+
+    request = RequestFactory().get(url)
+    request.user = AnonymousUser()
+    match = resolve(url)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response.content
+
+
+def _write_if_changed(path, content):
+    # Не трогаем файл без изменений, чтобы mtime и ETag WhiteNoise не менялись
+    if path.exists() and path.read_bytes() == content:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def _write_variants(path, content):
+    _write_if_changed(path, content)
+    _write_if_changed(path.with_name(path.name + '.gz'), gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write_if_changed(path.with_name(path.name + '.br'), brotli.compress(content))
+
+
+def _output_dir(url):
+    return get_root() / url.strip('/')
+
+
+def build(force=False, log=None):
+    """Перерисовывает изменившиеся страницы. Возвращает список путей URL."""
+    manifest_path = get_manifest_path()
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    built = []
+    for url_name, template_name, extra_inputs, has_data in PAGES:
+        url = reverse(url_name)
+        fingerprint = page_fingerprint(template_name, extra_inputs)
+        version = data_version() if has_data else None
+        entry = manifest.get(url)
+        if not force and entry and entry['fingerprint'] == fingerprint and (_output_dir(url) / 'index.html').exists():
+            # Данные графиков те же, но водяной знак мог сдвинуться
+            entry['data_version'] = version
+            if log:
+                log(f'{url}: без изменений')
+            continue
+
+        content = render_page(url)
+        _write_variants(_output_dir(url) / 'index.html', content)
+        manifest[url] = {'fingerprint': fingerprint, 'data_version': version, 'size': len(content)}
+        built.append(url)
+        if log:
+            log(f'{url}: {len(content)} байт')
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False))
+    return built
@@ -0,0 +1,148 @@
+"""Замеры времени этапов обработки запроса.
+
+``span('figure', chart='trend')`` измеряет блок кода и записывает его в
+профиль текущего запроса (если профилирование включено, иначе ничего не
+делает). Профиль хранится в ``contextvars``: пул потоков построения графиков
+получает копию контекста (см. ``charts._parallel_map``), поэтому этапы,
+выполненные в других потоках, попадают в тот же запрос.
+
+По завершении запроса ``ProfilingMiddleware`` (``dashboard.middleware``)
+отдаёт этапы в заголовке ``Server-Timing`` и добавляет их в гистограммы
+процесса, доступные на ``/metrics/`` в текстовом формате Prometheus.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+_current = contextvars.ContextVar('dashboard_profile', default=None)
+
+
+class RequestProfile:
+    """Этапы одного запроса: список ``(имя, график, секунды)``."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, chart, seconds):
+        with self._lock:
+            self.spans.append((name, chart, seconds))
+
+    def totals(self):
+        """Суммарная длительность по ``(имя, график)`` в порядке появления."""
+        result = {}
+        with self._lock:
+            for name, chart, seconds in self.spans:
+                result[name, chart] = result.get((name, chart), 0.) + seconds
+        return result
+
+
+def start():
+    """Начинает профиль запроса; возвращает токен для ``finish``."""
+    profile = RequestProfile()
+    return profile, _current.set(profile)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(name, chart=None):
+    """Замер блока кода в профиле текущего запроса."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, chart, time.perf_counter() - started)
+
+
+def server_timing(profile, total=None):
+    """Значение заголовка ``Server-Timing`` (длительности в миллисекундах)."""
+    entries = []
+    for (name, chart), seconds in profile.totals().items():
+        metric = f'{chart}.{name}' if chart else name
+        entries.append(f'{metric};dur={seconds * 1e3:.2f}')
+    if total is not None:
+        entries.append(f'total;dur={total * 1e3:.2f}')
+    return ', '.join(entries)
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами по наборам меток."""
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0., 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _labels(self, labels, **extra):
+        pairs = [f'{key}="{value}"' for key, value in zip(self.label_names, labels) if value]
+        pairs += [f'{key}="{value}"' for key, value in extra.items()]
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def exposition(self):
+        """Строки в текстовом формате Prometheus."""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: tuple(str(v) for v in item[0]))
+            for labels, (counts, total, count) in series:
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{self._labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{self.name}_bucket{self._labels(labels, le="+Inf")} {count}')
+                lines.append(f'{self.name}_sum{self._labels(labels)} {total:.6f}')
+                lines.append(f'{self.name}_count{self._labels(labels)} {count}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('dashboard_request_seconds', 'Время обработки запроса.', ('view', 'status'))
+SPAN_SECONDS = Histogram('dashboard_span_seconds', 'Время этапов обработки запроса.', ('span', 'chart'))
+
+HISTOGRAMS = (REQUEST_SECONDS, SPAN_SECONDS)
+
+
+def observe(view, status, total, profile):
+    REQUEST_SECONDS.observe((view, str(status)), total)
+    for (name, chart), seconds in profile.totals().items():
+        SPAN_SECONDS.observe((name, chart), seconds)
+
+
+def exposition():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.exposition())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,192 @@
+"""Параметры среза данных дашборда: диапазон дат, гранулярность, фильтры.
+
+``DashboardQuery.from_params(request.GET)`` разбирает параметры URL:
+
+- ``since``/``until`` - границы диапазона дат (ISO, включительно);
+- ``granularity`` - шаг временных рядов: ``day``, ``week``, ``month``
+  (по умолчанию), ``quarter``, ``year``;
+- фильтры по измерениям из ``DIMENSION_FILTERS``, например
+  ``?channel=Сайт,Партнеры&category=ФОТ``.
+
+Запрос нормализуется (даты в ISO, значения фильтров отсортированы), так
+что одинаковые срезы с разным порядком параметров дают один ключ кэша
+результатов (``cached``). Группировка и суммирование выполняются в базе
+(см. ``dashboard.rollups``), а результат хранится в кэше графиков до
+следующего обновления агрегатов.
+"""
+import datetime
+
+from django.db.models import Q
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from django.utils.http import urlencode
+
+from . import chart_cache
+from .models import MetricRollup
+
+# Гранулярность -> (функция усечения даты, самый крупный подходящий агрегат)
+GRANULARITIES = {
+    'day': (TruncDay, MetricRollup.PERIOD_DAY),
+    'week': (TruncWeek, MetricRollup.PERIOD_DAY),
+    'month': (TruncMonth, MetricRollup.PERIOD_MONTH),
+    'quarter': (TruncQuarter, MetricRollup.PERIOD_MONTH),
+    'year': (TruncYear, MetricRollup.PERIOD_MONTH),
+}
+DEFAULT_GRANULARITY = 'month'
+
+# Параметр фильтра -> метрики, у которых измерение (dimension) имеет этот смысл
+DIMENSION_FILTERS = {
+    'category': ('expenses',),
+    'stage': ('funnel',),
+    'direction': ('income', 'costs'),
+    'channel': ('channel_leads', 'channel_deals'),
+    'bucket': ('overdue_debt',),
+}
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value[:10])
+
+
+def _is_month_start(date):
+    return date.day == 1
+
+
+def _is_month_end(date):
+    return (date + datetime.timedelta(days=1)).day == 1
+
+
+class DashboardQuery:
+    """Нормализованный срез данных дашборда."""
+
+    # Набор данных в памяти, по которому считаются выборки среза (см.
+    # dashboard.crossfilter); None - выборки выполняются в базе.
+    dataset = None
+
+    def __init__(self, since=None, until=None, granularity=DEFAULT_GRANULARITY, filters=None):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'Неизвестная гранулярность: {granularity}')
+        if since and until and since > until:
+            raise ValueError('Начало диапазона позже конца')
+        self.since = since
+        self.until = until
+        self.granularity = granularity
+        self.filters = {
+            name: tuple(sorted(set(values)))
+            for name, values in (filters or {}).items() if values
+        }
+
+    @classmethod
+    def from_params(cls, params):
+        """Запрос из ``QueryDict``; ``ValueError`` при некорректных значениях."""
+        since = params.get('since')
+        until = params.get('until')
+        filters = {}
+        for name in DIMENSION_FILTERS:
+            values = [value for raw in params.getlist(name) for value in raw.split(',') if value]
+            if values:
+                filters[name] = values
+        return cls(
+            since=_parse_date(since) if since else None,
+            until=_parse_date(until) if until else None,
+            granularity=params.get('granularity') or DEFAULT_GRANULARITY,
+            filters=filters,
+        )
+
+    def __repr__(self):
+        return f'<DashboardQuery {self.urlencode() or "default"}>'
+
+    def __eq__(self, other):
+        return isinstance(other, DashboardQuery) and self.normalized() == other.normalized()
+
+    def __hash__(self):
+        return hash(self.normalized())
+
+    def normalized(self):
+        return (
+            self.since.isoformat() if self.since else None,
+            self.until.isoformat() if self.until else None,
+            self.granularity,
+            tuple(sorted(self.filters.items())),
+        )
+
+    def params(self):
+        """Параметры URL в каноническом виде (без значений по умолчанию)."""
+        params = {}
+        if self.since:
+            params['since'] = self.since.isoformat()
+        if self.until:
+            params['until'] = self.until.isoformat()
+        if self.granularity != DEFAULT_GRANULARITY:
+            params['granularity'] = self.granularity
+        for name, values in sorted(self.filters.items()):
+            params[name] = ','.join(values)
+        return params
+
+    @property
+    def is_default(self):
+        return not self.params()
+
+    def urlencode(self):
+        return urlencode(self.params())
+
+    @property
+    def trunc(self):
+        return GRANULARITIES[self.granularity][0]
+
+    @property
+    def source_period(self):
+        """Агрегат, из которого читается срез.
+
+        Месячные агрегаты подходят, только если границы диапазона совпадают
+        с границами месяцев; иначе суммируются дневные.
+        """
+        period = GRANULARITIES[self.granularity][1]
+        if period == MetricRollup.PERIOD_MONTH:
+            if (self.since and not _is_month_start(self.since)) or (self.until and not _is_month_end(self.until)):
+                return MetricRollup.PERIOD_DAY
+        return period
+
+    def filter_rollups(self, queryset, metrics):
+        """Ограничивает агрегаты ``metrics`` периодом, диапазоном и фильтрами."""
+        queryset = queryset.filter(period=self.source_period, metric__in=metrics)
+        if self.since:
+            queryset = queryset.filter(period_start__gte=self.since)
+        if self.until:
+            queryset = queryset.filter(period_start__lte=self.until)
+        return self._filter_dimensions(queryset, metrics)
+
+    def filter_facts(self, queryset, metrics):
+        """Ограничивает сырые факты ``metrics`` диапазоном дат и фильтрами."""
+        queryset = queryset.filter(metric__in=metrics)
+        if self.since:
+            queryset = queryset.filter(date__gte=self.since)
+        if self.until:
+            queryset = queryset.filter(date__lte=self.until)
+        return self._filter_dimensions(queryset, metrics)
+
+    def _filter_dimensions(self, queryset, metrics):
+        # Фильтр по измерению касается только метрик, у которых оно есть
+        for name, values in self.filters.items():
+            filtered = set(DIMENSION_FILTERS[name]) & set(metrics)
+            if filtered:
+                queryset = queryset.filter(~Q(metric__in=filtered) | Q(dimension__in=values))
+        return queryset
+
+
+DEFAULT_QUERY = DashboardQuery()
+
+
+def cached(name, args, query, compute):
+    """Результат ``compute()`` из кэша по имени выборки, аргументам и срезу.
+
+    Ключ включает версию данных кэша графиков, а в неё входит водяной знак
+    агрегатов в базе: после ``refresh_rollups`` в любом процессе все воркеры
+    читают выборки заново, даже с кэшем в памяти процесса.
+    """
+    cache = chart_cache.get_cache()
+    key = f'query:v{chart_cache.data_version()}:{name}:{chart_cache.inputs_hash(args, query.normalized())}'
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result)
+    return result
@@ -0,0 +1,206 @@
+"""Предагрегированные (rollup) таблицы метрик.
+
+``refresh()`` инкрементально переносит новые строки ``MetricFact`` в дневные
+и месячные агрегаты ``MetricRollup``. Графики читают только агрегаты через
+индекс (metric, period, period_start), поэтому время ответа страницы не
+зависит от объёма истории фактов. Выборки принимают срез ``query`` (диапазон,
+гранулярность, фильтры - см. ``dashboard.queries``).
+
+Вместо базы выборки могут считаться по набору в памяти (``query.dataset``,
+см. ``dashboard.crossfilter``) или по файловому колоночному хранилищу
+(``DASHBOARD_COLUMNAR_STORE``, см. ``dashboard.columnar``).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+
+from . import chart_cache, fact_cursor, queries
+from .models import MetricRollup, RollupWatermark
+
+WATERMARK_NAME = 'metric_rollups'
+
+PERIOD_TRUNCS = {
+    MetricRollup.PERIOD_DAY: TruncDay,
+    MetricRollup.PERIOD_MONTH: TruncMonth,
+}
+
+MONTH_LABELS = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+
+
+def _merge_deltas(period, deltas):
+    """Прибавляет приращения к существующим агрегатам одного периода."""
+    if not deltas:
+        return 0
+    bucket_key = lambda row: (row['metric'], row['dimension'], row['period_start'])
+    existing = MetricRollup.objects.filter(
+        period=period,
+        metric__in={row['metric'] for row in deltas},
+        period_start__in={row['period_start'] for row in deltas},
+    ).values('metric', 'dimension', 'period_start', 'value_sum', 'row_count')
+    current = {bucket_key(row): row for row in existing}
+
+    rollups = []
+    for row in deltas:
+        base = current.get(bucket_key(row), {'value_sum': 0, 'row_count': 0})
+        rollups.append(MetricRollup(
+            metric=row['metric'],
+            dimension=row['dimension'],
+            period=period,
+            period_start=row['period_start'],
+            value_sum=base['value_sum'] + row['value_sum'],
+            row_count=base['row_count'] + row['row_count'],
+        ))
+    MetricRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['metric', 'period', 'period_start', 'dimension'],
+        update_fields=['value_sum', 'row_count', 'updated_at'],
+    )
+    return len(rollups)
+
+
+def refresh(rebuild=False):
+    """Учитывает в агрегатах факты, добавленные после прошлого запуска.
+
+    Возвращает число обработанных фактов. При ``rebuild=True`` агрегаты
+    пересчитываются с нуля. Новые факты выбирает курсор
+    ``dashboard.fact_cursor``: факты, закоммиченные позже фактов с большим
+    ``id``, тоже учитываются, и каждый - ровно один раз. Водяной знак
+    сохраняется, только если что-то изменилось, поэтому ``data_version()``
+    меняется вместе с агрегатами.
+    """
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        if rebuild:
+            MetricRollup.objects.all().delete()
+            watermark.last_fact_id = 0
+            watermark.gaps = []
+
+        facts, last_id, gaps = fact_cursor.advance(watermark.last_fact_id, watermark.gaps)
+        processed = 0
+        for period, trunc in PERIOD_TRUNCS.items():
+            deltas = list(
+                facts
+                .annotate(period_start=trunc('date', output_field=DateField()))
+                .values('metric', 'dimension', 'period_start')
+                .annotate(value_sum=Sum('value'), row_count=Count('id'))
+                .order_by()
+            )
+            _merge_deltas(period, deltas)
+            # Каждый период учитывает все факты порции: число одно и то же
+            processed = sum(row['row_count'] for row in deltas)
+
+        if processed or rebuild or last_id != watermark.last_fact_id:
+            watermark.last_fact_id = last_id
+            watermark.gaps = gaps
+            watermark.save()
+        elif gaps != watermark.gaps:
+            # Забытые пропуски данных не меняют: время обновления прежнее
+            watermark.gaps = gaps
+            watermark.save(update_fields=['gaps'])
+
+    if getattr(settings, 'DASHBOARD_COLUMNAR_STORE', False):
+        from . import columnar
+
+        # Хранилище содержит те же факты, что и агрегаты
+        columnar.get_store().sync(upper_id=last_id, rebuild=rebuild)
+    if processed or rebuild:
+        chart_cache.invalidate()
+    return processed
+
+
+def data_version():
+    """Версия агрегатов: ``(id последнего учтённого факта, время обновления)``.
+
+    Один запрос по уникальному индексу; ``(0, None)``, пока агрегаты не
+    строились.
+    """
+    version = (
+        RollupWatermark.objects
+        .filter(name=WATERMARK_NAME)
+        .values_list('last_fact_id', 'updated_at')
+        .first()
+    )
+    return version or (0, None)
+
+
+def _source(query):
+    """Источник выборок вместо базы: набор среза, хранилище или ``None``."""
+    if query.dataset is not None:
+        return query.dataset
+    if getattr(settings, 'DASHBOARD_COLUMNAR_STORE', False):
+        from . import columnar
+
+        return columnar.get_store()
+    return None
+
+
+def _period_series(series, query):
+    metrics = sorted({metric for metric, _ in series})
+    rows = (
+        query.filter_rollups(MetricRollup.objects, metrics)
+        .annotate(bucket=query.trunc('period_start', output_field=DateField()))
+        .values('metric', 'dimension', 'bucket')
+        .annotate(value=Sum('value_sum'))
+        .order_by('bucket')
+        .values_list('metric', 'dimension', 'bucket', 'value')
+    )
+    wanted = set(series)
+    values = {}
+    dates = []
+    for metric, dimension, bucket, value in rows:
+        if (metric, dimension) not in wanted:
+            continue
+        if not dates or dates[-1] != bucket:
+            dates.append(bucket)
+        values[(metric, dimension, bucket)] = value
+
+    result = {'dates': dates}
+    for key in series:
+        result[key] = [values.get(key + (date,)) for date in dates]
+    return result
+
+
+def period_series(series, query=queries.DEFAULT_QUERY):
+    """Ряды по периодам среза ``query`` для списка пар ``(metric, dimension)``.
+
+    Возвращает ``{'dates': [...], (metric, dimension): [...]}`` с общей осью
+    дат (начала периодов); пропущенные периоды заполняются ``None``. Пустой
+    список дат означает, что в срезе нет данных. Суммирование по периодам
+    выполняется в базе, результат кэшируется по срезу.
+    """
+    series = [tuple(key) for key in series]
+    source = _source(query)
+    if source is not None:
+        return source.period_series(series, query)
+    return queries.cached('period_series', series, query, lambda: _period_series(series, query))
+
+
+def dimension_totals(metric, query=queries.DEFAULT_QUERY):
+    """Итоги метрики по измерениям за диапазон среза, по убыванию."""
+    source = _source(query)
+    if source is not None:
+        return source.dimension_totals(metric, query)
+    return queries.cached('dimension_totals', metric, query, lambda: list(
+        query.filter_rollups(MetricRollup.objects, [metric])
+        .values('dimension')
+        .annotate(total=Sum('value_sum'))
+        .order_by('-total', 'dimension')
+        .values_list('dimension', 'total')
+    ))
+
+
+def month_label(date):
+    return MONTH_LABELS[date.month - 1]
+
+
+def period_label(date, granularity=queries.DEFAULT_GRANULARITY):
+    """Подпись периода для категориальной оси X."""
+    if granularity == 'month':
+        return month_label(date)
+    if granularity == 'quarter':
+        return f'{(date.month - 1) // 3 + 1} кв. {date.year}'
+    if granularity == 'year':
+        return str(date.year)
+    return date.strftime('%d.%m.%Y')
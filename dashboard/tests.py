@@ -1,3 +1,847 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    chart_cache, charts, columnar, conditional, crossfilter, dash_apps, downsample, encoding, export, fact_cursor,
+    live, metrics, plotlyjs, precompute, prerender, profiling, queries, rollups,
+)
+from .middleware import PrerenderedWhiteNoiseMiddleware
+from .models import ChartArtifact, MetricFact, MetricRollup, RollupWatermark
+from .routing import websocket_urlpatterns
+
+# Стек графиков и интерактивных дашбордов: не должен загружаться при запуске
+HEAVY_MODULES = ('dash', 'plotly', 'pandas', 'numpy')
+
+STARTUP_SNIPPET = '''
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+import django
+django.setup()
+from django.test import Client
+client = Client(HTTP_HOST='localhost')
+statuses = [client.get(path).status_code for path in ('/', '/about/')]
+print(json.dumps({'statuses': statuses, 'heavy': [name for name in %r if name in sys.modules]}))
+'''
+
+# Обработчик WSGI загружает всю цепочку middleware, как рабочий процесс
+MIDDLEWARE_SNIPPET = '''
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'superset_presentation.settings')
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+print(json.dumps([name for name in ('django.test', 'dashboard.prerender') if name in sys.modules]))
+'''
+
+
+class StartupTests(SimpleTestCase):
+    """Запуск Django и лёгкие страницы не импортируют plotly, pandas, numpy и dash."""
+
+    def test_setup_does_not_import_heavy_modules(self):
+        env = dict(os.environ, DASHBOARD_INTERACTIVE='', DASHBOARD_PRERENDER='')
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SNIPPET % (HEAVY_MODULES,)],
+            cwd=settings.BASE_DIR, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        self.assertEqual(result['statuses'], [200, 200])
+        self.assertEqual(result['heavy'], [])
+
+    def test_middleware_does_not_import_prerender(self):
+        env = dict(os.environ, DASHBOARD_PRERENDER='')
+        output = subprocess.run(
+            [sys.executable, '-c', MIDDLEWARE_SNIPPET],
+            cwd=settings.BASE_DIR, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        self.assertEqual(json.loads(output.strip().splitlines()[-1]), [])
+
+
+def add_facts(metric, values, dimension='', start=datetime.date(2024, 1, 1)):
+    """Факты метрики по одному на месяц, начиная с ``start``."""
+    facts = []
+    for offset, value in enumerate(values):
+        month = start.month - 1 + offset
+        date = datetime.date(start.year + month // 12, month % 12 + 1, 1)
+        facts.append(MetricFact(metric=metric, dimension=dimension, date=date, value=value))
+    MetricFact.objects.bulk_create(facts)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    DASHBOARD_LIVE_PRODUCER='command',
+    DASHBOARD_LIVE_UPDATES=True,
+)
+class LiveUpdatesTests(TestCase):
+    """Дельта производителя доходит до подписчика через слой каналов."""
+
+    def test_socket_refused_when_disabled(self):
+        with override_settings(DASHBOARD_LIVE_UPDATES=False, DASHBOARD_LIVE_PRODUCER='inprocess'), \
+                mock.patch.object(live, 'ensure_producer') as ensure:
+            connected = async_to_sync(self._connect)()
+        self.assertFalse(connected)
+        ensure.assert_not_called()
+
+    async def _connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/dashboards/')
+        connected, _ = await communicator.connect()
+        if connected:
+            await communicator.disconnect()
+        return connected
+
+    def test_publish_refreshes_connections(self):
+        publisher = live.ChartPublisher(['trend'])
+        with mock.patch.object(live, 'close_old_connections') as close:
+            async_to_sync(live.publish)(publisher, get_channel_layer())
+        close.assert_called_once_with()
+
+    def test_subscriber_receives_extend_delta(self):
+        add_facts('revenue', [10, 20])
+        add_facts('profit', [1, 2])
+        rollups.refresh()
+        async_to_sync(self._exchange)()
+
+    async def _exchange(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/dashboards/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({'subscribe': ['trend', 'unknown']})
+        # Подписка обрабатывается асинхронно: дожидаемся её до рассылки
+        self.assertTrue(await communicator.receive_nothing())
+
+        publisher = live.ChartPublisher(['trend'])
+        await sync_to_async(publisher.prime)()
+        base = publisher.version
+
+        def add_month():
+            add_facts('revenue', [30], start=datetime.date(2024, 3, 1))
+            add_facts('profit', [3], start=datetime.date(2024, 3, 1))
+            rollups.refresh()
+
+        await sync_to_async(add_month)()
+        sent = await live.publish(publisher, get_channel_layer())
+        self.assertEqual(sent, 1)
+
+        message = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(message['chart'], 'trend')
+        self.assertEqual(message['base'], base)
+        self.assertEqual(message['version'], publisher.version)
+        self.assertNotEqual(message['version'], base)
+        self.assertEqual(message['ops'], [
+            {'op': 'extend', 'trace': 0, 'update': {'x': ['2024-03-01'], 'y': [30.0]}},
+            {'op': 'extend', 'trace': 1, 'update': {'x': ['2024-03-01'], 'y': [3.0]}},
+        ])
+
+        # Без новых данных производитель ничего не рассылает
+        self.assertEqual(await live.publish(publisher, get_channel_layer()), 0)
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+class MetricsTests(SimpleTestCase):
+    """Векторизованные расчёты совпадают с прежними расчётами на списках."""
+
+    def test_margin_and_sizeref(self):
+        income, costs = [45, 80, 35, 60, 0], [20, 50, 25, 30, 5]
+        profitability = metrics.margin_pct(income, costs)
+        expected = [((i - c) / i) * 100 if i else 0. for i, c in zip(income, costs)]
+        self.assertEqual(profitability.tolist(), expected)
+        self.assertEqual(metrics.bubble_sizeref(profitability), 2. * max(expected) / (40. ** 2))
+        self.assertEqual(metrics.bubble_sizeref([]), 1.)
+
+    def test_conversion(self):
+        converted, total = [22, 0, 18], [100, 0, 7]
+        expected = [round(c / t * 100, 1) if t else 0. for c, t in zip(converted, total)]
+        self.assertEqual(metrics.conversion_pct(converted, total).tolist(), expected)
+
+    def test_waterfall_labels(self):
+        values = [100, 50, -15, -40, 0, None]
+        self.assertEqual(metrics.waterfall_labels(values),
+                         [f'+{v}' if v > 0 else str(v) for v in values if v is not None])
+        self.assertEqual(metrics.waterfall_labels([1.5, -2.25]), ['+1.5', '-2.25'])
+
+
+class DownsampleTests(SimpleTestCase):
+    """Прореживание сохраняет крайние точки и укладывается в бюджет точек."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = np.arange('2020-01-01', '2024-01-01', dtype='datetime64[D]')
+        self.ys = [rng.normal(size=len(self.x)).cumsum() for _ in range(3)]
+
+    def assertValidIndices(self, indices, n, limit):
+        self.assertLessEqual(len(indices), limit)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], n - 1)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+
+    def test_lttb(self):
+        x = downsample.to_numeric_x(self.x)
+        for n_out in (3, 10, 500):
+            indices = downsample.lttb(x, self.ys[0], n_out)
+            self.assertValidIndices(indices, len(x), n_out)
+            self.assertEqual(len(indices), n_out)
+
+    def test_minmax_keeps_extremes(self):
+        y = self.ys[0]
+        for n_buckets in (1, 7, 200):
+            indices = downsample.minmax(None, y, n_buckets)
+            self.assertValidIndices(indices, len(y), 2 * n_buckets + 2)
+            self.assertIn(int(np.argmin(y)), indices)
+            self.assertIn(int(np.argmax(y)), indices)
+
+    def test_select_within_budget(self):
+        for method in downsample.METHODS:
+            for ys in (self.ys[:1], self.ys):
+                for n_points in (12, 100, 1000):
+                    with self.subTest(method=method, series=len(ys), n_points=n_points):
+                        indices = downsample.select(self.x, ys, n_points, method)
+                        self.assertValidIndices(indices, len(self.x), n_points)
+
+    def test_short_series_unchanged(self):
+        indices = downsample.select(self.x[:50], [self.ys[0][:50]], 100)
+        self.assertEqual(indices.tolist(), list(range(50)))
+        with self.assertRaises(ValueError):
+            downsample.select(self.x, self.ys, 100, 'median')
+
+
+class EncodingTests(SimpleTestCase):
+    """Typed arrays plotly.js раскодируются в исходные значения."""
+
+    def test_typed_array_round_trip(self):
+        for values in (np.linspace(-1, 1, 100), np.arange(100, dtype=np.int32), np.arange(10, dtype='>f8')):
+            spec = encoding.typed_array(values)
+            self.assertEqual(encoding.from_typed_array(spec), values.tolist())
+
+    def test_binary_figure_matches_text_figure(self):
+        spec, = charts.get_specs(['trend'])
+        dates = [datetime.date(2024, 1, 1) + timedelta(days=day) for day in range(100)]
+        data = {'dates': dates, 'revenue': [float(day) for day in range(100)], 'profit': [None] * 100}
+        fig = spec.build_figure(data)
+        binary = json.loads(encoding.figure_to_json(fig, binary=True))
+        text = json.loads(encoding.figure_to_json(fig))
+        self.assertEqual(binary['data'][0]['y'], encoding.typed_array(np.arange(100, dtype=float)))
+        self.assertEqual(live._decode(binary['data'][0]['y']), text['data'][0]['y'])
+        self.assertEqual(binary['layout']['xaxis']['type'], 'date')
+        # Пропуски (None) кодируются как NaN - разрывы линии в plotly.js
+        self.assertTrue(np.isnan(live._decode(binary['data'][1]['y'])).all())
+
+
+def seed_facts():
+    """Дневные факты за два с лишним года: ряды, измерения и корзины задолженности."""
+    rng = np.random.default_rng(1)
+    start = datetime.date(2023, 1, 1)
+    facts = []
+    for day in range(0, 800, 3):
+        date = start + timedelta(days=day)
+        facts.append(MetricFact(metric='revenue', date=date, value=float(rng.integers(1, 100))))
+        for bucket in ('1-30', '31-60', '60-90'):
+            facts.append(MetricFact(metric='overdue_debt', dimension=bucket, date=date,
+                                    value=float(rng.integers(1, 10))))
+        for channel in ('Сайт', 'Партнеры'):
+            facts.append(MetricFact(metric='channel_leads', dimension=channel, date=date,
+                                    value=float(rng.integers(1, 50))))
+    MetricFact.objects.bulk_create(facts)
+
+
+class SourceEquivalenceTests(TestCase):
+    """Агрегаты в базе, колоночное хранилище и набор перекрёстных фильтров дают одни и те же выборки."""
+
+    SERIES = [('revenue', ''), ('overdue_debt', '1-30'), ('overdue_debt', '31-60'), ('overdue_debt', '60-90')]
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        seed_facts()
+        rollups.refresh()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = columnar.ColumnarStore(directory.name)
+        self.store.sync()
+        self.dataset = crossfilter.Dataset.from_facts()
+
+    def queries(self):
+        for granularity in queries.GRANULARITIES:
+            yield queries.DashboardQuery(granularity=granularity)
+            yield queries.DashboardQuery(granularity=granularity, filters={'bucket': ['1-30', '60-90']})
+            # Границы не по месяцам: суммируются дневные агрегаты
+            yield queries.DashboardQuery(since=datetime.date(2023, 2, 10), until=datetime.date(2024, 8, 20),
+                                         granularity=granularity, filters={'channel': ['Сайт']})
+
+    def assertSeriesEqual(self, expected, actual):
+        self.assertEqual(list(expected['dates']), list(actual['dates']))
+        for key in self.SERIES:
+            self.assertEqual(len(expected[key]), len(actual[key]))
+            for left, right in zip(expected[key], actual[key]):
+                if left is None or right is None:
+                    self.assertEqual(left, right)
+                else:
+                    self.assertAlmostEqual(left, right)
+
+    def assertTotalsEqual(self, expected, actual):
+        self.assertEqual([name for name, _ in expected], [name for name, _ in actual])
+        for (_, left), (_, right) in zip(expected, actual):
+            self.assertAlmostEqual(left, right)
+
+    def test_period_series(self):
+        for query in self.queries():
+            with self.subTest(query=query):
+                expected = rollups.period_series(self.SERIES, query)
+                self.assertTrue(expected['dates'])
+                self.assertSeriesEqual(expected, self.store.period_series(self.SERIES, query))
+                self.assertSeriesEqual(expected, self.dataset.period_series(self.SERIES, query))
+
+    def test_dimension_totals(self):
+        for query in self.queries():
+            for metric in ('overdue_debt', 'channel_leads'):
+                with self.subTest(query=query, metric=metric):
+                    expected = rollups.dimension_totals(metric, query)
+                    self.assertTotalsEqual(expected, self.store.dimension_totals(metric, query))
+                    self.assertTotalsEqual(expected, self.dataset.dimension_totals(metric, query))
+
+    def test_open_partitions_are_bounded(self):
+        store = columnar.ColumnarStore(self.store.root, cache_size=3)
+        query = queries.DashboardQuery()
+        self.assertSeriesEqual(self.store.period_series(self.SERIES, query), store.period_series(self.SERIES, query))
+        self.assertEqual(len(store._arrays), 3)
+
+    def test_bucket_filter(self):
+        query = queries.DashboardQuery(filters={'bucket': ['31-60']})
+        self.assertEqual([name for name, _ in rollups.dimension_totals('overdue_debt', query)], ['31-60'])
+        # Фильтр по корзине не касается других метрик
+        self.assertEqual(rollups.dimension_totals('channel_leads', query),
+                         rollups.dimension_totals('channel_leads'))
+
+    def test_crossfilter_period_click(self):
+        base = queries.DashboardQuery()
+        trend, debt, hbar = charts.get_specs(['trend', 'debt', 'hbar'])
+        # Plotly присылает дату оси со временем
+        state = crossfilter.select(trend, base, {}, self.dataset, '2023-03-01 00:00')
+        self.assertEqual(state, {'period': {'value': '2023-03-01', 'chart': 'trend'}})
+        with self.assertRaises(ValueError):
+            crossfilter.select(trend, base, {}, self.dataset, '1999-03-01')
+        query = crossfilter.effective_query(base, state, self.dataset, hbar)
+        self.assertEqual((query.since, query.until), (datetime.date(2023, 3, 1), datetime.date(2023, 3, 31)))
+        db_query = queries.DashboardQuery(since=query.since, until=query.until)
+        self.assertTotalsEqual(rollups.dimension_totals('channel_leads', db_query),
+                               self.dataset.dimension_totals('channel_leads', query))
+        # Источник своим фильтром не ограничивается
+        self.assertEqual(crossfilter.effective_query(base, state, self.dataset, trend), base)
+        self.assertTrue(crossfilter.is_source(trend, [trend, debt]))
+        self.assertFalse(crossfilter.is_source(hbar, [trend, debt, hbar]))
+
+    def test_crossfilter_click_by_value(self):
+        client = Client(HTTP_HOST='localhost')
+        params = {'charts': 'trend,plan_fact,debt,hbar', 'select': 'debt', 'value': '2024-06-01'}
+        # Точка не зависит от прореживания: по номеру точки выбрался бы другой период
+        response = client.get('/dashboards/crossfilter.json', dict(params, granularity='day', since='2024-05-01'))
+        self.assertEqual(response.status_code, 400)
+        params['value'] = '2024-06-03'
+        response = client.get('/dashboards/crossfilter.json', dict(params, granularity='day', since='2024-05-01'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['state'], {'period': {'value': '2024-06-03', 'chart': 'debt'}})
+        self.assertIn('trend', response.json()['charts'])
+        # План-факт без фактов: демонстрационные данные, дата периода в customdata
+        response = client.get('/dashboards/crossfilter.json',
+                              dict(params, select='plan_fact', value='2024-02-01T00:00:00'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['state'], {'period': {'value': '2024-02-01', 'chart': 'plan_fact'}})
+        # Клик по графику, который не фильтрует другие графики страницы
+        response = client.get('/dashboards/crossfilter.json', dict(params, select='hbar', value='Сайт'))
+        self.assertEqual(response.status_code, 400)
+
+
+class IncrementalRefreshTests(TestCase):
+    """Курсор фактов учитывает поздно закоммиченные факты ровно один раз."""
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+
+    def create(self, fact_id, value, date=datetime.date(2024, 1, 5)):
+        MetricFact.objects.create(id=fact_id, metric='revenue', date=date, value=value)
+
+    def test_late_fact_is_counted_once(self):
+        for fact_id in (1, 2, 4):
+            self.create(fact_id, 1)
+        self.assertEqual(rollups.refresh(), 3)
+        self.assertEqual(list(RollupWatermark.objects.values_list('gaps', flat=True))[0][0][:2], [3, 3])
+        before = rollups.data_version()
+
+        # Факт с id 3 закоммичен после факта с id 4
+        self.create(3, 10)
+        self.assertEqual(rollups.refresh(), 1)
+        self.assertEqual(rollups.refresh(), 0)
+        self.assertEqual(rollups.data_version()[0], before[0])
+        self.assertNotEqual(rollups.data_version(), before)
+        self.assertEqual(rollups.dimension_totals('revenue'), [('', 13.0)])
+
+        incremental = sorted(MetricRollup.objects.values_list('period', 'period_start', 'value_sum', 'row_count'))
+        rollups.refresh(rebuild=True)
+        rebuilt = sorted(MetricRollup.objects.values_list('period', 'period_start', 'value_sum', 'row_count'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_old_gaps_are_forgotten(self):
+        for fact_id in (1, 3):
+            self.create(fact_id, 1)
+        _, last_id, gaps = fact_cursor.advance(0, [], now=0)
+        self.assertEqual((last_id, [gap[:2] for gap in gaps]), (3, [[2, 2]]))
+        _, _, gaps = fact_cursor.advance(last_id, gaps, now=fact_cursor.gap_timeout() + 1)
+        self.assertEqual(gaps, [])
+
+
+class ConditionalRequestTests(TestCase):
+    """ETag страницы дашбордов меняется вместе с данными."""
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        self.client = Client(HTTP_HOST='localhost')
+
+    def test_not_modified_until_refresh(self):
+        response = self.client.get('/dashboards/?mode=lazy')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/dashboards/?mode=lazy', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get('/dashboards/?mode=lazy', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            304)
+
+        MetricFact.objects.create(metric='revenue', date=datetime.date(2024, 1, 1), value=1)
+        rollups.refresh()
+        response = self.client.get('/dashboards/?mode=lazy', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_watermark_read_once_per_request(self):
+        seed_facts()
+        rollups.refresh()
+        self.client.get('/dashboards/')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get('/dashboards/').status_code, 200)
+        table = RollupWatermark._meta.db_table
+        self.assertEqual(sum(table in query['sql'] for query in captured.captured_queries), 1)
+
+    def test_etag_follows_plotly_url(self):
+        etag = self.client.get('/dashboards/?mode=lazy')['ETag']
+        with mock.patch('dashboard.plotlyjs.get_url', return_value='/static/dashboard/vendor/plotly.abc.min.js'):
+            response = self.client.get('/dashboards/?mode=lazy', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_code_version_ignores_tests(self):
+        self.assertIn('charts.py', conditional._CODE_FILES)
+        self.assertNotIn('tests.py', conditional._CODE_FILES)
+
+    def test_static_page(self):
+        etag = self.client.get('/about/')['ETag']
+        self.assertEqual(self.client.get('/about/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_bad_request_has_no_validators(self):
+        response = self.client.get('/dashboards/chart/trend.json', {'since': 'вчера'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class ChartRegistryTests(TestCase):
+    """Страница строит только запрошенные графики реестра, параллельно и так же, как по одному."""
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+
+    def test_get_specs(self):
+        self.assertEqual([spec.chart_id for spec in charts.get_specs()], list(charts.REGISTRY))
+        self.assertEqual([spec.chart_id for spec in charts.get_specs(['debt', 'trend'])], ['debt', 'trend'])
+        with self.assertRaises(Http404):
+            charts.get_specs(['unknown'])
+
+    def test_page_builds_requested_charts(self):
+        client = Client(HTTP_HOST='localhost')
+        with mock.patch.object(charts.ChartSpec, 'build_figure', autospec=True,
+                               side_effect=charts.ChartSpec.build_figure) as build:
+            response = client.get('/dashboards/', {'charts': 'funnel,trend'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(call.args[0].chart_id for call in build.call_args_list), ['funnel', 'trend'])
+        self.assertEqual(client.get('/dashboards/', {'charts': 'unknown'}).status_code, 404)
+
+    def test_parallel_matches_sequential(self):
+        specs = charts.get_specs()
+        parallel = charts.render_charts(specs, fmt='json')
+        chart_cache.get_cache().clear()
+        with override_settings(DASHBOARD_CHART_WORKERS=1):
+            sequential = charts.render_charts(specs, fmt='json')
+        self.assertEqual(parallel, sequential)
+
+
+class LazyChartsTests(TestCase):
+    """Скелет страницы без фигур и JSON каждого графика по отдельному адресу."""
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        self.client = Client(HTTP_HOST='localhost')
+
+    def test_skeleton_builds_no_figures(self):
+        with mock.patch.object(charts.ChartSpec, 'build_figure') as build:
+            response = self.client.get('/dashboards/', {'mode': 'lazy'})
+        self.assertEqual(response.status_code, 200)
+        build.assert_not_called()
+        content = response.content.decode('utf-8')
+        for chart_id in charts.REGISTRY:
+            self.assertIn(f'data-src="/dashboards/chart/{chart_id}.json"', content)
+        # Фрагменты plotly.py вызывают Plotly.newPlot с id div в кавычках
+        self.assertNotRegex(content, r'Plotly\.newPlot\(\s*"')
+
+    def test_chart_json(self):
+        response = self.client.get('/dashboards/chart/funnel.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        figure = json.loads(response.content)
+        self.assertEqual(figure['data'][0]['type'], 'funnel')
+        self.assertIn('layout', figure)
+        self.assertEqual(self.client.get('/dashboards/chart/unknown.json').status_code, 404)
+        self.assertEqual(self.client.get('/dashboards/chart/trend.json', {'width': 'широко'}).status_code, 400)
+
+
+class ChartCacheTests(TestCase):
+    """Фрагмент графика строится один раз на входные данные и версию данных."""
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+
+    def test_render_many(self):
+        calls = []
+
+        def render(inputs='a'):
+            return chart_cache.render_many([('trend', inputs, lambda: calls.append(inputs) or f'<div>{inputs}</div>')])
+
+        self.assertEqual(render(), {'trend': '<div>a</div>'})
+        self.assertEqual(render(), {'trend': '<div>a</div>'})
+        self.assertEqual(calls, ['a'])
+        self.assertEqual((chart_cache.stats()['hits'], chart_cache.stats()['misses']), (1, 1))
+
+        render('b')  # другие входные данные - другой ключ
+        chart_cache.invalidate()
+        render()
+        MetricFact.objects.create(metric='revenue', date=datetime.date(2024, 1, 1), value=1)
+        rollups.refresh()
+        render()
+        self.assertEqual(calls, ['a', 'b', 'a', 'a'])
+
+    def test_dashboards_page_reuses_fragments(self):
+        client = Client(HTTP_HOST='localhost')
+        client.get('/dashboards/')
+        chart_cache.reset_stats()
+        self.assertEqual(client.get('/dashboards/').status_code, 200)
+        stats = chart_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (len(charts.REGISTRY), 0))
+
+
+class PrerenderTests(TestCase):
+    """Заранее отрисованные страницы: сжатые варианты, пересборка изменившихся, отдача без представлений."""
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name) / 'www'
+        settings_override = override_settings(
+            DASHBOARD_PRERENDER_ROOT=self.root, DASHBOARD_PRERENDER_MANIFEST=Path(directory.name) / 'manifest.json')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_build_only_changed_pages(self):
+        self.assertEqual(prerender.build(), ['/', '/dashboards/', '/about/'])
+        page = self.root / 'about' / 'index.html'
+        self.assertEqual(gzip.decompress((self.root / 'about' / 'index.html.gz').read_bytes()), page.read_bytes())
+        if prerender.brotli is not None:
+            self.assertEqual(prerender.brotli.decompress((self.root / 'about' / 'index.html.br').read_bytes()),
+                             page.read_bytes())
+        self.assertEqual(prerender.build(), [])
+
+        add_facts('revenue', [10, 20])
+        rollups.refresh()
+        self.assertEqual(prerender.build(), ['/dashboards/'])
+
+    def test_middleware_serves_pages(self):
+        prerender.build()
+        view = mock.Mock(return_value=HttpResponse('из представления'))
+        with override_settings(WHITENOISE_ROOT=self.root, WHITENOISE_INDEX_FILE=True):
+            middleware = PrerenderedWhiteNoiseMiddleware(view)
+        factory = RequestFactory()
+
+        response = middleware(factory.get('/about/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertTrue(response.has_header('ETag'))
+        view.assert_not_called()
+
+        middleware(factory.get('/about/', {'utm': 'mail'}))
+        self.assertEqual(view.call_count, 1)
+
+        # После обновления агрегатов страницу с графиками рисует представление
+        middleware(factory.get('/dashboards/'))
+        self.assertEqual(view.call_count, 1)
+        add_facts('revenue', [10, 20])
+        rollups.refresh()
+        middleware(factory.get('/dashboards/'))
+        self.assertEqual(view.call_count, 2)
+
+
+class ProfilingTests(TestCase):
+    """Этапы запроса попадают в Server-Timing и гистограммы /metrics/."""
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        for histogram in profiling.HISTOGRAMS:
+            histogram.reset()
+
+    def test_span_outside_request_is_noop(self):
+        with profiling.span('figure', 'trend'):
+            pass
+        self.assertIsNone(profiling.current())
+
+    def test_server_timing(self):
+        profile, token = profiling.start()
+        try:
+            with profiling.span('figure', 'trend'):
+                pass
+            with profiling.span('template'):
+                pass
+        finally:
+            profiling.finish(token)
+        header = profiling.server_timing(profile, total=0.5)
+        self.assertRegex(header, r'^trend\.figure;dur=[\d.]+, template;dur=[\d.]+, total;dur=500\.00$')
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = profiling.Histogram('test_seconds', 'Тест.', ('span',), buckets=(0.1, 1.))
+        for seconds in (0.05, 0.5, 5.):
+            histogram.observe(('figure',), seconds)
+        lines = histogram.exposition()
+        self.assertIn('test_seconds_bucket{span="figure",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{span="figure",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{span="figure",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{span="figure"} 3', lines)
+
+    @override_settings(DASHBOARD_PROFILING=True)
+    def test_dashboards_page(self):
+        client = Client(HTTP_HOST='localhost')
+        response = client.get('/dashboards/')
+        self.assertEqual(response.status_code, 200)
+        metrics = {entry.split(';')[0] for entry in response['Server-Timing'].split(', ')}
+        # Этапы графиков строятся в пуле потоков, но попадают в профиль запроса
+        self.assertTrue({'charts', 'template', 'total', 'trend.figure', 'trend.to_html'} <= metrics, metrics)
+
+        body = client.get('/metrics/').content.decode()
+        self.assertIn('dashboard_request_seconds_count{view="dashboard:dashboards",status="200"} 1', body)
+        self.assertIn('dashboard_span_seconds_count{span="figure",chart="trend"} 1', body)
+
+    def test_disabled(self):
+        client = Client(HTTP_HOST='localhost')
+        self.assertNotIn('Server-Timing', client.get('/about/'))
+        self.assertEqual(client.get('/metrics/').status_code, 404)
+        with override_settings(DASHBOARD_PROFILING=True):
+            self.assertEqual(client.get('/metrics/', REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+
+class PlotlyBundleTests(SimpleTestCase):
+    """Частичная сборка Plotly.js покрывает все графики, адрес - статика или CDN."""
+
+    def tearDown(self):
+        plotlyjs.get_url.cache_clear()
+
+    def test_registry_fits_finance_bundle(self):
+        types = plotlyjs.trace_types(charts.get_specs())
+        self.assertIn('waterfall', types)
+        self.assertEqual(plotlyjs.choose_bundle(types), 'finance')
+        self.assertEqual(plotlyjs.choose_bundle({'scatter', 'bar'}), 'basic')
+        self.assertIsNone(plotlyjs.choose_bundle({'sankey'}))
+
+    def test_build_from_source(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / 'plotly-finance.min.js'
+            source.write_bytes(b'/** plotly.js (finance) v2 */' + b' ' * 1000)
+            output = Path(tmp) / 'vendor' / 'plotly.min.js'
+            with mock.patch.object(plotlyjs, 'get_output_path', return_value=output):
+                info = plotlyjs.build(charts.get_specs(), source=source)
+            self.assertEqual(output.read_bytes(), source.read_bytes())
+        self.assertEqual(info['size'], 1029)
+        self.assertLess(info['gzip'], info['size'])
+
+    def test_url(self):
+        cdn = plotlyjs.CDN_URL.format(version=plotlyjs.get_version())
+        with mock.patch.object(plotlyjs.finders, 'find', return_value=None):
+            plotlyjs.get_url.cache_clear()
+            self.assertEqual(plotlyjs.get_url(), cdn)
+
+        with mock.patch.object(plotlyjs.finders, 'find', return_value='/static/plotly.min.js'), \
+                mock.patch.object(plotlyjs.staticfiles_storage, 'url', return_value='/static/plotly.0123abcd.min.js'):
+            plotlyjs.get_url.cache_clear()
+            self.assertEqual(plotlyjs.get_url(), '/static/plotly.0123abcd.min.js')
+
+        # Сборка есть, но collectstatic не запускался: остаётся CDN
+        with mock.patch.object(plotlyjs.finders, 'find', return_value='/static/plotly.min.js'), \
+                mock.patch.object(plotlyjs.staticfiles_storage, 'url', side_effect=ValueError):
+            plotlyjs.get_url.cache_clear()
+            self.assertEqual(plotlyjs.get_url(), cdn)
+
+
+class ExportTests(TestCase):
+    """Выгрузка CSV содержит факты графика в срезе."""
+
+    def test_csv(self):
+        seed_facts()
+        query = queries.DashboardQuery(since=datetime.date(2023, 1, 1), until=datetime.date(2023, 1, 31))
+        spec, = charts.get_specs(['debt'])
+        content = b''.join(export.stream('csv', [spec], query, size=7)).decode('utf-8').splitlines()
+        self.assertEqual(content[0], ','.join(export.COLUMNS))
+        expected = query.filter_facts(MetricFact.objects.all(), spec.metrics).count()
+        self.assertEqual(len(content) - 1, expected)
+        self.assertTrue(all('overdue_debt' in line for line in content[1:]))
+
+        response = Client(HTTP_HOST='localhost').get('/dashboards/export/debt.csv', {'until': '2023-01-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8').splitlines()), expected + 1)
+
+    @skipIf(export.pyarrow is None, 'pyarrow не установлен')
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        seed_facts()
+        query = queries.DashboardQuery(since=datetime.date(2023, 1, 1), until=datetime.date(2023, 1, 31))
+        spec, = charts.get_specs(['debt'])
+        content = b''.join(export.stream('parquet', [spec], query, size=7))
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(content))
+        self.assertEqual(table.column_names, list(export.COLUMNS))
+        self.assertEqual(table.num_rows, query.filter_facts(MetricFact.objects.all(), spec.metrics).count())
+
+    def test_parquet_unavailable_without_pyarrow(self):
+        with mock.patch.object(export, 'pyarrow', None):
+            self.assertNotIn('parquet', export.formats())
+            response = Client(HTTP_HOST='localhost').get('/dashboards/export/debt.parquet')
+        self.assertEqual(response.status_code, 404)
+
+
+class PrecomputeLeaseTests(TestCase):
+    """Пересчёт графика захватывает один владелец, пока не истечёт аренда."""
+
+    def test_claim(self):
+        spec, = charts.get_specs(['waterfall'])
+        self.assertTrue(precompute.claim(spec, 'first'))
+        self.assertFalse(precompute.claim(spec, 'second', force=True))
+
+        ChartArtifact.objects.filter(chart_id=spec.chart_id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(precompute.claim(spec, 'second', force=True))
+        self.assertEqual(precompute.refresh(spec, 'first'), None)
+
+        ChartArtifact.objects.filter(chart_id=spec.chart_id).update(locked_until=None, locked_by='')
+        changed, _ = precompute.refresh(spec, 'third', force=True)
+        self.assertTrue(changed)
+        self.assertEqual(precompute.revision()[0], 1)
+        # Пересчитывать ещё рано
+        self.assertFalse(precompute.claim(spec, 'fourth'))
+
+    def test_run_refreshes_connections(self):
+        specs = charts.get_specs(['waterfall'])
+        with mock.patch.object(precompute, 'close_old_connections') as close:
+            precompute.run(specs, once=True, force=True)
+        close.assert_called_once_with()
+        self.assertEqual(precompute.revision()[0], 1)
+
+
+class ImmediateExecutor:
+    """Пул, который выполняет задание сразу в вызывающем потоке.
+
+    ``Future`` возвращается уже завершённым, поэтому ``CallbackCache``
+    сохраняет результат до возврата из ``submit``, без ожидания колбэков.
+    """
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+class CallbackCacheTests(SimpleTestCase):
+    """Кэш колбэков Dash: один расчёт на ключ, LRU, время жизни, ошибки не кэшируются."""
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_concurrent_requests_share_computation(self):
+        cache = dash_apps.CallbackCache(maxsize=4, ttl=60)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'figure'
+
+        first = cache.submit('key', compute, self.executor)
+        started.wait(5)
+        second = cache.submit('key', compute, self.executor)
+        release.set()
+        self.assertEqual((first.result(5), second.result(5)), ('figure', 'figure'))
+        self.assertEqual(cache.submit('key', compute, self.executor).result(5), 'figure')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_lru_and_ttl(self):
+        executor = ImmediateExecutor()
+        cache = dash_apps.CallbackCache(maxsize=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            cache.submit(key, lambda key=key: key, executor).result(5)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('a', cache._items)
+
+        cache = dash_apps.CallbackCache(maxsize=2, ttl=0)
+        cache.submit('a', lambda: 1, executor).result(5)
+        cache.submit('a', lambda: 2, executor).result(5)
+        self.assertEqual(cache.misses, 2)
+
+    def test_errors_are_not_cached(self):
+        executor = ImmediateExecutor()
+        cache = dash_apps.CallbackCache()
+
+        def fail():
+            raise RuntimeError('база недоступна')
+
+        with self.assertRaises(RuntimeError):
+            cache.submit('key', fail, executor).result(5)
+        self.assertEqual(cache.submit('key', lambda: 'figure', executor).result(5), 'figure')
+        self.assertEqual(cache.misses, 2)
+
+
+class DashFigureTests(TestCase):
+    """Фигура колбэка Dash: без шаблона plotly, соединения с базой обновляются."""
+
+    def test_build_figure(self):
+        spec, = charts.get_specs(['trend'])
+        with mock.patch.object(dash_apps, 'close_old_connections') as close:
+            figure = dash_apps._build_figure(spec, queries.DEFAULT_QUERY)
+        self.assertEqual(close.call_count, 2)
+        self.assertNotIn('template', figure['layout'])
+        self.assertEqual(figure['layout']['plot_bgcolor'], charts.PLOT_BGCOLOR)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -6,5 +7,13 @@ app_name = 'dashboard'
 urlpatterns = [
     path('', views.dashboard_home, name='home'),
     path('dashboards/', views.dashboards_view, name='dashboards'),
+    path('dashboards/chart/<slug:chart_id>.json', views.chart_json_view, name='chart_json'),
+    path('dashboards/crossfilter.json', views.crossfilter_view, name='crossfilter'),
+    path('dashboards/export.<str:fmt>', views.export_view, name='export'),
+    path('dashboards/export/<slug:chart_id>.<str:fmt>', views.export_view, name='chart_export'),
     path('about/', views.about_view, name='about'),
-]
\ No newline at end of file
+    path('metrics/', views.metrics_view, name='metrics'),
+]
+
+if getattr(settings, 'DASHBOARD_INTERACTIVE', False):
+    urlpatterns.append(path('dashboards/interactive/', views.interactive_view, name='interactive'))
\ No newline at end of file
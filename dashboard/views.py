@@ -1,12 +1,67 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import HttpResponse
-import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.utils.safestring import mark_safe
-from datetime import datetime, timedelta
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition
+from datetime import datetime
+import functools
+import json
 
+from . import conditional, profiling, queries
 
+# Модули графиков (charts, downsample, live) тянут за собой plotly, pandas и
+# numpy, поэтому импортируются внутри представлений: главная страница, «О
+# проекте» и команды manage.py (migrate, collectstatic) их не загружают. В
+# gunicorn они импортируются заранее в мастер-процессе (см. gunicorn.conf.py).
+
+
+def _conditional(validators):
+    """``condition`` с валидаторами из ``dashboard.conditional``.
+
+    Ответы с ошибкой (400 на некорректные параметры) уходят без ETag и
+    Last-Modified: валидаторы описывают данные, а не ошибку.
+    """
+    etag_func, last_modified_func = validators
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code >= 400:
+                for header in ('ETag', 'Last-Modified'):
+                    if response.has_header(header):
+                        del response[header]
+            return response
+        return wrapper
+    return decorator
+
+
+def _precomputed(specs, query, field, options=None):
+    """Готовые графики из планировщика (см. ``dashboard.precompute``).
+
+    Артефакты есть только для среза по умолчанию и параметров отображения,
+    которые они покрывают; ``{}``, если они выключены или не подходят.
+    """
+    if not getattr(settings, 'DASHBOARD_PRECOMPUTED_CHARTS', False) or not query.is_default:
+        return {}
+    from . import precompute
+
+    if options is not None and not precompute.serves(options):
+        return {}
+    return precompute.load([spec.chart_id for spec in specs], field)
+
+
+def _click_attribute(spec, specs):
+    """Атрибут точки ``plotly_click`` со значением фильтра или ``None``, если график не источник."""
+    from . import crossfilter
+
+    return spec.cross_filter[2] if crossfilter.is_source(spec, specs) else None
+
+
+@_conditional(conditional.static_page('dashboard/index.html'))
 def dashboard_home(request):
     """Главная страница dashboard с продающим контентом."""
     context = {
@@ -37,212 +92,234 @@ def dashboard_home(request):
     return render(request, 'dashboard/index.html', context)
 
 
+@_conditional(conditional.data_page('dashboard/dashboards.html'))
 def dashboards_view(request):
-    """Страница дашбордов с 8 профессиональными финансовыми графиками в консервативном стиле."""
-    
-    # ЕДИНАЯ СТРОГАЯ ЦВЕТОВАЯ СХЕМА
-    color_primary = '#1f4b99'  # Темно-синий (основной)
-    color_secondary = '#2ca02c' # Темно-зеленый
-    color_tertiary = '#8b0000'  # Бордовый
-    color_grey = '#404040'      # Темно-серый для текста
-    plot_bgcolor = 'white'      # Фон графиков
-    grid_color = '#e6e6e6'      # Цвет сетки
-
-    # ЕДИНЫЙ ШАБЛОН ДЛЯ НАСТРОЙКИ ЛАЙАУТА
-    layout_template = {
-        'font': {'family': 'Roboto, Arial, sans-serif', 'color': color_grey, 'size': 12},
-        'title': {'x': 0.5, 'xanchor': 'center', 'font': {'size': 16, 'color': color_grey}},
-        'plot_bgcolor': plot_bgcolor,
-        'paper_bgcolor': 'rgba(0,0,0,0)', # Прозрачный фон для легкой интеграции в сайт
-        'xaxis': {
-            'showgrid': True,
-            'gridcolor': grid_color,
-            'gridwidth': 1,
-            'zeroline': False,
-            'showline': True,
-            'linecolor': color_grey,
-            'linewidth': 1,
-            'tickfont': {'size': 11}
-        },
-        'yaxis': {
-            'showgrid': True,
-            'gridcolor': grid_color,
-            'gridwidth': 1,
-            'zeroline': False,
-            'showline': True,
-            'linecolor': color_grey,
-            'linewidth': 1,
-            'tickfont': {'size': 11},
-            'tickprefix': '₽', # Добавляем символ рубля для финансовых графиков
-        },
-        'legend': {
-            'orientation': 'h',
-            'yanchor': 'bottom',
-            'y': 1.02,
-            'xanchor': 'right',
-            'x': 1
-        },
-        'hoverlabel': {
-            'bgcolor': 'white',
-            'font_size': 11,
-            'font_family': 'Roboto, Arial, sans-serif'
-        },
-        'margin': {'l': 50, 'r': 20, 't': 60, 'b': 50},
-        'height': 400,
-    }
+    """Страница дашбордов с профессиональными финансовыми графиками в консервативном стиле.
 
-    # 1. ГРАФИК 1: Динамика ключевых показателей (Линейный)
-    dates = pd.date_range(start='2024-01-01', periods=6, freq='ME')
-    revenue = [45.2, 48.5, 52.1, 49.8, 55.3, 58.9] # млн руб.
-    profit = [12.1, 13.0, 14.5, 13.2, 15.8, 17.2]  # млн руб.
-
-    fig_trend = go.Figure()
-    fig_trend.add_trace(go.Scatter(x=dates, y=revenue, mode='lines+markers', name='Выручка', line=dict(color=color_primary, width=3)))
-    fig_trend.add_trace(go.Scatter(x=dates, y=profit, mode='lines+markers', name='Чистая прибыль', line=dict(color=color_secondary, width=3)))
-    fig_trend.update_layout(layout_template)
-    fig_trend.update_layout(title='Динамика выручки и прибыли (млн руб.)')
-
-    # 2. ГРАФИК 2: Структура расходов (Круговая)
-    expenses_labels = ['ФОТ', 'Закупка сырья', 'Маркетинг', 'Налоги', 'Аренда', 'Прочие']
-    expenses_values = [45, 25, 10, 8, 7, 5]
-
-    fig_expenses = go.Figure(data=[go.Pie(
-        labels=expenses_labels,
-        values=expenses_values,
-        hole=.4,
-        marker=dict(colors=[color_primary, color_secondary, color_tertiary, '#7f7f7f', '#17becf', '#bcbd22']),
-        textinfo='label+percent',
-        textfont_size=13
-    )])
-    fig_expenses.update_layout(layout_template)
-    fig_expenses.update_layout(title='Структура операционных расходов (%)', showlegend=False)
-
-    # 3. ГРАФИК 3: Плановые vs Фактические показатели (Столбчатый с группойми)
-    months = ['Янв', 'Фев', 'Мар', 'Апр']
-    planned = [22, 25, 23, 28]
-    actual = [20, 26, 25, 30]
-
-    fig_plan_vs_fact = go.Figure()
-    fig_plan_vs_fact.add_trace(go.Bar(name='План', x=months, y=planned, marker_color=color_primary, opacity=0.9))
-    fig_plan_vs_fact.add_trace(go.Bar(name='Факт', x=months, y=actual, marker_color=color_secondary, opacity=0.9))
-    fig_plan_vs_fact.update_layout(layout_template)
-    fig_plan_vs_fact.update_layout(
-        title='Выполнение плана по месяцам (млн руб.)',
-        barmode='group',
-        yaxis={'tickprefix': '₽'}
-    )
+    Графики берутся из реестра ``dashboard.charts``. Параметр ``?charts=trend,funnel``
+    ограничивает страницу перечисленными графиками; без него выводятся все.
+    HTML-фрагменты кэшируются (см. ``dashboard.chart_cache``), а при промахе
+    фигуры строятся параллельно.
 
-    # 4. ГРАФИК 4: Воронка продаж
-    funnel_labels = ['Лиды', 'Квалифицированные', 'Предложение', 'Переговоры', 'Сделка']
-    funnel_values = [1000, 600, 400, 250, 150]
-
-    fig_funnel = go.Figure(go.Funnel(
-        y=funnel_labels,
-        x=funnel_values,
-        textinfo = "value+percent initial",
-        marker={"color": [color_primary, '#3d72a4', '#5a93cb', '#87bcde', '#b4d4e7']},
-        textfont={"size": 12}
-    ))
-    fig_funnel.update_layout(layout_template)
-    fig_funnel.update_layout(title='Воронка продаж')
-
-    # 5. ГРАФИК 5: Динамика просроченной задолженности (Область)
-    debt_dates = pd.date_range(start='2024-01-01', periods=5, freq='ME')
-    debt_1_30 = [1.2, 1.5, 1.0, 1.8, 1.3]
-    debt_31_60 = [0.5, 0.7, 0.4, 0.9, 0.6]
-    debt_60_90 = [0.2, 0.3, 0.1, 0.4, 0.2]
-
-    fig_debt = go.Figure()
-    fig_debt.add_trace(go.Scatter(x=debt_dates, y=debt_1_30, mode='none', name='1-30 дней', stackgroup='one', fillcolor='#ff9999'))
-    fig_debt.add_trace(go.Scatter(x=debt_dates, y=debt_31_60, mode='none', name='31-60 дней', stackgroup='one', fillcolor='#ff6666'))
-    fig_debt.add_trace(go.Scatter(x=debt_dates, y=debt_60_90, mode='none', name='60-90 дней', stackgroup='one', fillcolor='#ff0000'))
-    fig_debt.update_layout(layout_template)
-    fig_debt.update_layout(title='Динамика просроченной дебиторской задолженности (млн руб.)', hovermode='x unified')
-
-    # 6. ГРАФИК 6: Соотношение затрат и доходов по направлениям (Scatter)
-    categories = ['Направление A', 'Направление B', 'Направление C', 'Направление D']
-    income = [50, 80, 30, 65]
-    costs = [20, 50, 25, 30]
-    profitability = [((i - c) / i) * 100 for i, c in zip(income, costs)]  # Расчет рентабельности в %
-
-    fig_scatter = go.Figure()
-    fig_scatter.add_trace(go.Scatter(
-        x=income,
-        y=costs,
-        mode='markers+text',
-        marker=dict(size=profitability, sizemode='area', sizeref=2.*max(profitability)/(40.**2), sizemin=4, color=profitability, colorscale='Blues', showscale=True),
-        text=categories,
-        textposition='middle right',
-        hovertemplate='<b>%{text}</b><br>Доход: ₽%{x} млн<br>Затраты: ₽%{y} млн<br>Рентабельность: %{marker.size:.1f}%<extra></extra>'
-    ))
-    fig_scatter.update_layout(layout_template)
-    fig_scatter.update_layout(
-        title='Соотношение доходов и затрат по направлениям',
-        xaxis_title='Доходы (млн руб.)',
-        yaxis_title='Затраты (млн руб.)',
-        yaxis={'tickprefix': '₽'},
-        xaxis={'tickprefix': '₽'}
-    )
+    В режиме ``?mode=lazy`` (или при ``DASHBOARD_LAZY_CHARTS = True``) страница
+    отдаётся скелетом с плейсхолдерами, а каждый график подгружается из
+    ``chart_json_view``, когда попадает в область видимости.
 
-    # 7. ГРАФИК 7: Отклонение от плана (Waterfall)
-    waterfall_labels = ['Нач. остаток', 'Продажи', 'Возвраты', 'Закупки', 'Корректировки', 'Кон. остаток']
-    waterfall_values = [100, 50, -15, -40, 5, None]  # None для конечного остатка
-
-    fig_waterfall = go.Figure(go.Waterfall(
-        name="Склад",
-        orientation="v",
-        measure=["absolute", "relative", "relative", "relative", "relative", "total"],
-        x=waterfall_labels,
-        textposition="outside",
-        text=[f"+{v}" if v > 0 else str(v) for v in waterfall_values if v is not None],
-        y=waterfall_values,
-        connector={"line":{"color":"rgb(63, 63, 63)"}},
-        increasing={"marker":{"color":color_secondary}},
-        decreasing={"marker":{"color":color_tertiary}},
-        totals={"marker":{"color":color_primary}}
-    ))
-    fig_waterfall.update_layout(layout_template)
-    fig_waterfall.update_layout(title='Движение товарных запасов (тыс. ед.)')
-
-    # 8. ГРАФИК 8: Эффективность каналов продаж (Horizontal Bar)
-    channels = ['Партнеры', 'Сайт', 'Кол-центр', 'Соц. сети', 'Прямые продажи']
-    conversion = [22, 15, 18, 10, 25]  # %
-
-    fig_hbar = go.Figure()
-    fig_hbar.add_trace(go.Bar(
-        y=channels,
-        x=conversion,
-        orientation='h',
-        marker_color=color_primary,
-        text=conversion,
-        texttemplate='%{text}%',
-        textposition='auto'
-    ))
-    fig_hbar.update_layout(layout_template)
-    fig_hbar.update_layout(
-        title='Конверсия по каналам продаж',
-        xaxis_title='Конверсия, %',
-        yaxis={'autorange': 'reversed'}  # Чтобы список шел сверху вниз
-    )
+    При ``DASHBOARD_LIVE_UPDATES = True`` страница подписывается на изменения
+    графиков по WebSocket (см. ``dashboard.live``).
+
+    При ``DASHBOARD_PRECOMPUTED_CHARTS = True`` графики среза по умолчанию
+    берутся готовыми из ``manage.py precompute_charts``; в запросе строятся
+    только те, что ещё ни разу не считались.
+
+    Параметры ``since``, ``until``, ``granularity`` и фильтры по измерениям
+    (``?channel=Сайт``) задают срез данных всех графиков (см.
+    ``dashboard.queries``).
+    """
+    from . import charts, crossfilter, export, plotlyjs
+
+    chart_ids = [chart_id for chart_id in request.GET.get('charts', '').split(',') if chart_id]
+    specs = charts.get_specs(chart_ids)
+    try:
+        query = queries.DashboardQuery.from_params(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest('Некорректные параметры среза данных')
+
+    mode = request.GET.get('mode')
+    lazy = mode == 'lazy' if mode else getattr(settings, 'DASHBOARD_LAZY_CHARTS', False)
+
+    if lazy:
+        chart_list = [
+            {'id': spec.chart_id, 'title': spec.title, 'div_id': spec.div_id, 'zoomable': spec.zoomable,
+             'cross_filter': _click_attribute(spec, specs), 'export': bool(spec.metrics)}
+            for spec in specs
+        ]
+    else:
+        fragments = _precomputed(specs, query, 'html')
+        missing = [spec for spec in specs if spec.chart_id not in fragments]
+        if missing:
+            fragments.update((spec.chart_id, html) for spec, html in charts.render_charts(missing, query=query))
+        chart_list = [
+            {'id': spec.chart_id, 'title': spec.title, 'div_id': spec.div_id, 'zoomable': spec.zoomable,
+             'cross_filter': _click_attribute(spec, specs), 'export': bool(spec.metrics),
+             'html': mark_safe(fragments[spec.chart_id])}
+            for spec in specs
+        ]
 
-    # Преобразование всех графиков в HTML
     context = {
-        'plot_div_trend': mark_safe(fig_trend.to_html(full_html=False, include_plotlyjs=False, div_id='trend-chart')),
-        'plot_div_expenses': mark_safe(fig_expenses.to_html(full_html=False, include_plotlyjs=False, div_id='expenses-chart')),
-        'plot_div_plan_fact': mark_safe(fig_plan_vs_fact.to_html(full_html=False, include_plotlyjs=False, div_id='plan-fact-chart')),
-        'plot_div_funnel': mark_safe(fig_funnel.to_html(full_html=False, include_plotlyjs=False, div_id='funnel-chart')),
-        'plot_div_debt': mark_safe(fig_debt.to_html(full_html=False, include_plotlyjs=False, div_id='debt-chart')),
-        'plot_div_scatter': mark_safe(fig_scatter.to_html(full_html=False, include_plotlyjs=False, div_id='scatter-chart')),
-        'plot_div_waterfall': mark_safe(fig_waterfall.to_html(full_html=False, include_plotlyjs=False, div_id='waterfall-chart')),
-        'plot_div_hbar': mark_safe(fig_hbar.to_html(full_html=False, include_plotlyjs=False, div_id='hbar-chart')),
+        'charts': chart_list,
+        'lazy': lazy,
+        'live': getattr(settings, 'DASHBOARD_LIVE_UPDATES', False),
+        'query': query,
+        'query_params': query.params(),
+        'granularities': list(queries.GRANULARITIES),
+        'export_formats': export.formats(),
+        'plotly_js_url': plotlyjs.get_url(),
     }
+    if context['live']:
+        from . import live
+
+        # Версия данных страницы: с ней сверяются дельты из WebSocket
+        context['data_version'] = live.current_version()
+
+    with profiling.span('template'):
+        return render(request, 'dashboard/dashboards.html', context)
 
-    return render(request, 'dashboard/dashboards.html', context)
 
+def _chart_options(request):
+    """Параметры отображения временных рядов из query string.
 
+    ``width`` - ширина графика в пикселях, ``start``/``end`` - видимый
+    диапазон дат (ISO), ``downsample`` - метод прореживания, ``encoding`` -
+    ``json`` (по умолчанию) или ``binary`` (числовые массивы в base64).
+    """
+    options = {}
+    width = request.GET.get('width')
+    if width:
+        options['width'] = min(max(int(width), 100), 4000)
+    for key in ('start', 'end'):
+        value = request.GET.get(key)
+        if value:
+            options[key] = datetime.fromisoformat(value).isoformat()
+    method = request.GET.get('downsample')
+    if method:
+        from . import downsample
+
+        if method not in downsample.METHODS:
+            raise ValueError(method)
+        options['downsample'] = method
+    encoding = request.GET.get('encoding', 'json')
+    if encoding not in ('json', 'binary'):
+        raise ValueError(encoding)
+    if encoding == 'binary':
+        options['encoding'] = encoding
+    return options
+
+
+@_conditional(conditional.data_page('dashboard/dashboards.html'))
+def chart_json_view(request, chart_id):
+    """JSON одной фигуры Plotly для ленивой подгрузки графика на странице.
+
+    Принимает те же параметры среза данных, что и ``dashboards_view``.
+    """
+    from . import charts
+
+    spec, = charts.get_specs([chart_id])
+    try:
+        options = _chart_options(request)
+        query = queries.DashboardQuery.from_params(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest('Некорректные параметры графика')
+    figure_json = _precomputed([spec], query, 'figure_json', options).get(spec.chart_id)
+    if figure_json is None:
+        (_, figure_json), = charts.render_charts([spec], fmt='json', options=options, query=query)
+    return HttpResponse(figure_json, content_type='application/json')
+
+
+@_conditional(conditional.data_page('dashboard/dashboards.html'))
+def crossfilter_view(request):
+    """Изменившиеся трассы графиков после клика по элементу графика.
+
+    Параметры: срез данных страницы (как у ``dashboards_view``), ``charts`` -
+    графики страницы, ``state`` - текущие фильтры клика (JSON, см.
+    ``dashboard.crossfilter``) и либо ``select=<chart_id>`` с ``value`` -
+    значением из точки клика, либо ``clear=<фильтр>`` (``clear=all`` - снять
+    все). Ответ - новое состояние и операции ``Plotly.restyle`` для
+    изменившихся трасс.
+    """
+    from . import charts, crossfilter
+
+    chart_ids = [chart_id for chart_id in request.GET.get('charts', '').split(',') if chart_id]
+    specs = charts.get_specs(chart_ids)
+    try:
+        base = queries.DashboardQuery.from_params(request.GET)
+        state = crossfilter.parse_state(json.loads(request.GET.get('state') or '{}'))
+        dataset = crossfilter.get_dataset()
+        selected = request.GET.get('select')
+        cleared = request.GET.get('clear')
+        if selected:
+            spec, = charts.get_specs([selected])
+            value = request.GET.get('value')
+            if value is None or not crossfilter.is_source(spec, specs):
+                raise ValueError(selected)
+            new_state = crossfilter.select(spec, base, state, dataset, value)
+        elif cleared == 'all':
+            new_state = {}
+        else:
+            new_state = {name: value for name, value in state.items() if name != cleared}
+    except ValueError:
+        return HttpResponseBadRequest('Некорректные параметры фильтра')
+    return JsonResponse(
+        {'state': new_state, 'charts': crossfilter.changes(specs, base, state, new_state, dataset)},
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+@_conditional(conditional.data_page('dashboard/dashboards.html'))
+def export_view(request, fmt, chart_id=None):
+    """Выгрузка фактов графика (или всех графиков страницы) в CSV или Parquet.
+
+    Принимает срез данных (как ``dashboards_view``) и, для всей страницы,
+    ``charts``. Файл не собирается в памяти, а отдаётся потоком по мере
+    чтения строк из базы (см. ``dashboard.export``).
+    """
+    from . import charts, export
+
+    if fmt not in export.formats():
+        raise Http404(f'Формат выгрузки недоступен: {fmt}')
+    if chart_id is None:
+        chart_ids = [chart_id for chart_id in request.GET.get('charts', '').split(',') if chart_id]
+        specs = charts.get_specs(chart_ids)
+        filename = 'dashboards'
+    else:
+        specs = charts.get_specs([chart_id])
+        filename = chart_id
+    if not any(spec.metrics for spec in specs):
+        raise Http404('График построен не на фактах')
+    try:
+        query = queries.DashboardQuery.from_params(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest('Некорректные параметры среза данных')
+    response = StreamingHttpResponse(export.stream(fmt, specs, query), content_type=export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+def interactive_view(request):
+    """Дашборды с элементами управления на django-plotly-dash.
+
+    Графики те же, что на ``dashboards_view``, но срез меняется без
+    перезагрузки страницы: колбэки пересчитывают только затронутые графики
+    и кэшируют фигуры (см. ``dashboard.dash_apps``).
+    """
+    from django_plotly_dash.middleware import ContentCollector
+
+    from . import dash_apps
+
+    # Теги plotly_header/plotly_footer собирают скрипты Dash в коллектор;
+    # он подставляется только здесь, а не middleware для каждого ответа
+    request.dpd_content_handler = ContentCollector()
+    response = render(request, 'dashboard/interactive.html', {'app_name': dash_apps.APP_NAME})
+    return request.dpd_content_handler.adjust_response(response)
+
+
+@_conditional(conditional.static_page('dashboard/about.html'))
 def about_view(request):
     """Страница 'О проекте'."""
     context = {
         'page_title': 'О проекте',
     }
     return render(request, 'dashboard/about.html', context)
+
+
+@never_cache
+def metrics_view(request):
+    """Гистограммы времени запросов и их этапов в текстовом формате Prometheus.
+
+    Доступно только при ``DASHBOARD_PROFILING = True`` и только с адресов из
+    ``DASHBOARD_METRICS_ALLOWED_IPS``.
+    """
+    allowed = getattr(settings, 'DASHBOARD_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if not getattr(settings, 'DASHBOARD_PROFILING', False) or request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(profiling.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
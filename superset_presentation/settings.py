@@ -46,12 +46,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'dashboard',
 ]
 
 MIDDLEWARE = [
+    'dashboard.middleware.ProfilingMiddleware',  # Server-Timing и /metrics/ (при DASHBOARD_PROFILING=true)
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Для обслуживания статики в продакшне
+    'dashboard.middleware.DataVersionMiddleware',  # водяной знак агрегатов читается раз за запрос
+    'dashboard.middleware.PrerenderedWhiteNoiseMiddleware',  # WhiteNoise: статика и заранее отрисованные страницы
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -93,6 +96,45 @@ DATABASES = {
 }
 
 
+# Кэш
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Отрисованные фрагменты графиков хранятся в отдельном кэше "charts".
+# Команде manage.py chart_cache нужен общий для процессов бэкенд.
+# Бэкенд и TTL задаются переменными окружения, например для Redis:
+# CHART_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CHART_CACHE_LOCATION=redis://localhost:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'charts': {
+        'BACKEND': os.environ.get('CHART_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CHART_CACHE_LOCATION', 'dashboard-charts'),
+        'TIMEOUT': int(os.environ.get('CHART_CACHE_TTL', 600)),  # секунды
+    },
+}
+
+DASHBOARD_CHART_CACHE_ALIAS = 'charts'
+
+
+# Django Channels: WebSocket-обновления графиков (только при запуске через ASGI)
+# https://channels.readthedocs.io/en/stable/topics/channel_layers.html
+
+ASGI_APPLICATION = 'superset_presentation.asgi.application'
+
+# По умолчанию слой каналов в памяти процесса. Для нескольких процессов нужен
+# общий слой, например CHANNEL_LAYER_BACKEND=channels_redis.core.RedisChannelLayer
+# и CHANNEL_LAYER_LOCATION=redis://localhost:6379/2
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': os.environ.get('CHANNEL_LAYER_BACKEND', 'channels.layers.InMemoryChannelLayer'),
+    },
+}
+if 'CHANNEL_LAYER_LOCATION' in os.environ:
+    CHANNEL_LAYERS['default']['CONFIG'] = {'hosts': [os.environ['CHANNEL_LAYER_LOCATION']]}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -143,6 +185,14 @@ else:
 # Общие настройки
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Заранее отрисованные страницы (manage.py build_dashboards). При
+# DASHBOARD_PRERENDER=true WhiteNoise отдаёт их вместо вызова представлений.
+DASHBOARD_PRERENDER_ROOT = BASE_DIR / 'prerendered' / 'www'
+DASHBOARD_PRERENDER_MANIFEST = BASE_DIR / 'prerendered' / 'manifest.json'
+if os.environ.get('DASHBOARD_PRERENDER', '') == 'true':
+    WHITENOISE_ROOT = DASHBOARD_PRERENDER_ROOT
+    WHITENOISE_INDEX_FILE = True
+
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -151,3 +201,72 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Размер пула потоков для построения графиков дашборда (1 - последовательно)
+DASHBOARD_CHART_WORKERS = int(os.environ.get('DASHBOARD_CHART_WORKERS', 4))
+
+# Отдавать страницу дашбордов скелетом с ленивой подгрузкой графиков по умолчанию
+DASHBOARD_LAZY_CHARTS = os.environ.get('DASHBOARD_LAZY_CHARTS', '') == 'true'
+
+# Ширина графика по умолчанию (px) - предел числа точек временного ряда
+DASHBOARD_CHART_WIDTH = int(os.environ.get('DASHBOARD_CHART_WIDTH', 1200))
+
+# Живое обновление графиков через WebSocket (нужен ASGI-сервер, например daphne)
+DASHBOARD_LIVE_UPDATES = os.environ.get('DASHBOARD_LIVE_UPDATES', '') == 'true'
+
+# Период проверки данных производителем обновлений (секунды)
+DASHBOARD_LIVE_INTERVAL = float(os.environ.get('DASHBOARD_LIVE_INTERVAL', 5))
+
+# 'inprocess' - производитель в ASGI-процессе (слой каналов в памяти),
+# 'command' - отдельный процесс manage.py publish_chart_updates (общий слой)
+DASHBOARD_LIVE_PRODUCER = os.environ.get('DASHBOARD_LIVE_PRODUCER', 'inprocess')
+
+# Профилирование запросов: заголовок Server-Timing и гистограммы на /metrics/
+DASHBOARD_PROFILING = os.environ.get('DASHBOARD_PROFILING', '') == 'true'
+DASHBOARD_METRICS_ALLOWED_IPS = os.environ.get('DASHBOARD_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Дампы cProfile для медленных запросов (при заданном каталоге)
+DASHBOARD_PROFILE_DIR = os.environ.get('DASHBOARD_PROFILE_DIR')
+DASHBOARD_PROFILE_SAMPLE_RATE = float(os.environ.get('DASHBOARD_PROFILE_SAMPLE_RATE', 0.1))
+DASHBOARD_PROFILE_THRESHOLD_MS = float(os.environ.get('DASHBOARD_PROFILE_THRESHOLD_MS', 500))
+
+# Число строк фактов, которое выгрузка CSV/Parquet читает и кодирует за раз
+DASHBOARD_EXPORT_CHUNK_SIZE = int(os.environ.get('DASHBOARD_EXPORT_CHUNK_SIZE', 5000))
+
+# Сколько секунд помнить пропуски id фактов, ещё не видимых при обновлении
+# агрегатов (транзакции, закоммиченные не по порядку id; см. dashboard.fact_cursor)
+DASHBOARD_FACT_GAP_TIMEOUT = float(os.environ.get('DASHBOARD_FACT_GAP_TIMEOUT', 3600))
+
+# Отдавать графики среза по умолчанию из артефактов планировщика
+# (manage.py precompute_charts) вместо расчёта в запросе
+DASHBOARD_PRECOMPUTED_CHARTS = os.environ.get('DASHBOARD_PRECOMPUTED_CHARTS', '') == 'true'
+DASHBOARD_PRECOMPUTE_INTERVAL = float(os.environ.get('DASHBOARD_PRECOMPUTE_INTERVAL', 60))  # секунды
+DASHBOARD_PRECOMPUTE_LOCK_TIMEOUT = float(os.environ.get('DASHBOARD_PRECOMPUTE_LOCK_TIMEOUT', 300))
+
+# Файловое колоночное хранилище фактов (memory-mapped NumPy) вместо выборок
+# из агрегатов в базе; обновляется вместе с refresh_rollups
+DASHBOARD_COLUMNAR_STORE = os.environ.get('DASHBOARD_COLUMNAR_STORE', '') == 'true'
+DASHBOARD_COLUMNAR_ROOT = Path(os.environ.get('DASHBOARD_COLUMNAR_ROOT', BASE_DIR / 'columnar'))
+# Сколько партиций держать открытыми (memmap и файловый дескриптор на партицию)
+DASHBOARD_COLUMNAR_CACHE_SIZE = int(os.environ.get('DASHBOARD_COLUMNAR_CACHE_SIZE', 512))
+
+# Интерактивные дашборды (django-plotly-dash, /dashboards/interactive/).
+# Модели и URL django-plotly-dash импортируют dash и plotly уже при
+# django.setup(), поэтому приложение подключается только при
+# DASHBOARD_INTERACTIVE=true; само приложение Dash создаётся при первом
+# обращении загрузчиком из dashboard.dash_apps
+DASHBOARD_INTERACTIVE = os.environ.get('DASHBOARD_INTERACTIVE', '') == 'true'
+if DASHBOARD_INTERACTIVE:
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('dashboard'), 'django_plotly_dash.apps.DjangoPlotlyDashConfig')
+PLOTLY_DASH = {
+    'stateless_loader': 'dashboard.dash_apps.load_app',
+}
+
+# Кэш фигур колбэков в процессе: число записей и время жизни (секунды)
+DASHBOARD_DASH_CACHE_SIZE = int(os.environ.get('DASHBOARD_DASH_CACHE_SIZE', 256))
+DASHBOARD_DASH_CACHE_TTL = float(os.environ.get('DASHBOARD_DASH_CACHE_TTL', 300))
+
+# Пул потоков колбэков и время, которое колбэк ждёт расчёта фигуры, прежде
+# чем показать заглушку и повторить запрос по таймеру (секунды)
+DASHBOARD_DASH_WORKERS = int(os.environ.get('DASHBOARD_DASH_WORKERS', 4))
+DASHBOARD_DASH_CALLBACK_TIMEOUT = float(os.environ.get('DASHBOARD_DASH_CALLBACK_TIMEOUT', 1))
@@ -24,6 +24,11 @@ urlpatterns = [
     path('', include('dashboard.urls')),
 ]
 
+# URL django-plotly-dash импортируют dash, поэтому подключаются только вместе
+# с интерактивными дашбордами
+if getattr(settings, 'DASHBOARD_INTERACTIVE', False):
+    urlpatterns.insert(1, path('django_plotly_dash/', include('django_plotly_dash.urls')))
+
 # Маршруты для статических и медиа файлов (только для разработки)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)